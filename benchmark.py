@@ -0,0 +1,333 @@
+"""
+Contents: Benchmarks for the (spline based) peak period estimation. Each workload is run for every combination of the
+requested problem sizes (number of spectra, number of coarse frequency bins and refinement factor of the fine frequency
+grid) in a fresh process, so that the reported peak resident memory (RSS) belongs to that workload alone. Results are
+reported as throughput in spectra per second and can be stored as a baseline to compare later runs against, e.g.:
+
+    python benchmark.py --save-baseline
+    python benchmark.py --workloads peak_period_natural spline_peak_natural --spectra 100 1000
+
+With --check-startup only the cold start of the command line tool (estimate_peak_period.py) and the import of
+observed_data are measured instead, and the run fails if either exceeds the budget or loads a module it should not
+(STARTUP_EXCLUDED_MODULES, STARTUP_IMPORTS):
+
+    python benchmark.py --check-startup --startup-budget 2.0
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import itertools
+import json
+import os
+import time
+
+# Frequency range of the synthetic spectra
+FREQUENCY_LIMITS = [0.01, 0.5]
+
+# Workloads with a problem size that is not set by the number of spectra (e.g. because they run on the observed data)
+FIXED_SIZE_WORKLOADS = ['observed_get_data', 'observed_monotone_numpy', 'observed_monotone_kernel',
+                        'observed_interpolate_library', 'observed_interpolate_banded', 'observed_peak_library',
+                        'observed_peak_banded']
+
+# Refinement factor of the fine grid the observed spectra are interpolated to in the observed_interpolate workloads.
+OBSERVED_REFINEMENT = 10
+
+# Command whose cold start is checked, and the modules it should not load (they take seconds to import, or are only
+# needed for plotting).
+STARTUP_COMMAND = ['estimate_peak_period.py', './data/spectrum_reference.nc', '--output', os.devnull]
+STARTUP_EXCLUDED_MODULES = ['roguewavespectrum', 'xarray', 'pandas', 'matplotlib', 'scipy.signal']
+
+# Modules whose import is checked in the same way, with the modules they should not load. observed_data needs xarray
+# for the data itself; scripts that only use its data (e.g. figure04) should not pay for roguewavespectrum.
+STARTUP_IMPORTS = {'observed_data': ['roguewavespectrum', 'matplotlib', 'scipy.signal']}
+
+# Default cold start budget of the command line tool in seconds.
+STARTUP_BUDGET = 2.0
+
+
+def get_frequencies(number_of_bins, refinement):
+    """
+    Coarse and fine frequency grids for the given problem size.
+    :param number_of_bins: number of coarse frequency bins
+    :param refinement: ratio of coarse to fine frequency step
+    :return: coarse frequencies, fine frequencies
+    """
+    import numpy as np
+    sampled_frequencies = np.linspace(FREQUENCY_LIMITS[0], FREQUENCY_LIMITS[1], number_of_bins)
+    interpolated_frequencies = np.linspace(FREQUENCY_LIMITS[0], FREQUENCY_LIMITS[1],
+                                           (number_of_bins - 1) * refinement + 1)
+    return sampled_frequencies, interpolated_frequencies
+
+
+def get_spectra(number_of_spectra, number_of_bins, refinement):
+    """
+    Create a time series of downsampled JONSWAP spectra with peak frequencies spanning the swell to wind-sea range.
+    :return: coarse FrequencySpectrum, fine FrequencySpectrum
+    """
+    from roguewavespectrum import FrequencySpectrum
+    from xarray import Dataset
+    import numpy as np
+    import sweep
+
+    sampled_frequencies, interpolated_frequencies = get_frequencies(number_of_bins, refinement)
+    peak_frequencies = np.linspace(0.05, 0.15, number_of_spectra)
+    fine = sweep.parametric_variance_density(interpolated_frequencies, peak_frequencies, [0.0], 'jonswap')[0, ...]
+    coarse = sweep.downsample(fine, interpolated_frequencies, sampled_frequencies)
+
+    time = np.datetime64('2022-09-01', 'ns') + np.arange(number_of_spectra) * np.timedelta64(3600, 's')
+
+    def as_spectrum(frequencies, variance_density):
+        # Directional moments are irrelevant for the peak period but are required by the spectral object.
+        zeros = np.zeros_like(variance_density)
+        dims = ('time', 'frequency')
+        return FrequencySpectrum(Dataset(
+            data_vars={'variance_density': (dims, variance_density), 'a1': (dims, zeros), 'b1': (dims, zeros),
+                       'a2': (dims, zeros), 'b2': (dims, zeros)},
+            coords={'time': time, 'frequency': frequencies}))
+
+    return as_spectrum(sampled_frequencies, coarse), as_spectrum(interpolated_frequencies, fine)
+
+
+def setup_workload(workload, number_of_spectra, number_of_bins, refinement):
+    """
+    Prepare the inputs of a workload and return a function without arguments that runs it.
+    """
+    import numpy as np
+    import interpolation
+    import monotone_spline
+    import observed_data
+    import online
+    import plotting
+    import spline_peak
+    import sweep
+
+    if workload == 'observed_get_data':
+        return lambda: observed_data.get_data()
+
+    if workload in ('observed_monotone_numpy', 'observed_monotone_kernel'):
+        # Monotone spline coefficients and peaks of the reference spectra; the kernel is compiled only if Numba is
+        # installed (the best of the repeats excludes its compilation on the first call).
+        import xarray
+        with xarray.open_dataset(observed_data.REFERENCE_FILE) as dataset:
+            frequency = dataset['frequency'].values
+            variance_density = dataset['variance_density'].transpose('time', 'frequency').fillna(0.0).values
+        monotone_plan = interpolation.InterpolationPlan(frequency, frequency)
+        solver = monotone_spline.MonotoneSplineSolver(monotone_plan.knots)
+        compiled = workload == 'observed_monotone_kernel' and monotone_spline.COMPILED
+        return lambda: solver.fit(variance_density, monotone_plan.binwidth, compiled=compiled)
+
+    if workload.startswith(('observed_interpolate', 'observed_peak')):
+        # Monotone spline interpolation (densities on a fine grid) and peak periods of the reference spectra with the
+        # quadratic program of roguewavespectrum, and with the banded solver (compiled kernel if Numba is installed).
+        reference = observed_data.get_spectrum('reference')
+        reference.dataset.load()
+        frequency = reference.frequency.values
+        fine = np.linspace(frequency[0], frequency[-1], (len(frequency) - 1) * OBSERVED_REFINEMENT + 1)
+        observed_plan = interpolation.get_plan(frequency, fine)
+        return {
+            'observed_interpolate_library': lambda: reference.interpolate_frequency(fine, method='spline'),
+            'observed_interpolate_banded': lambda: observed_plan.interpolate(reference, solver='banded'),
+            'observed_peak_library': lambda: reference.peak_period(use_spline=True),
+            'observed_peak_banded': lambda: spline_peak.peak_period(reference, solver='banded'),
+        }[workload]
+
+    sampled_frequencies, interpolated_frequencies = get_frequencies(number_of_bins, refinement)
+
+    if workload == 'get_periods':
+        peak_frequencies = np.linspace(0.05, 0.15, number_of_spectra)
+        return lambda: sweep.get_periods(peak_frequencies, [0.0], interpolated_frequencies, sampled_frequencies,
+                                         kind='jonswap')
+
+    coarse, fine = get_spectra(number_of_spectra, number_of_bins, refinement)
+    estimator = online.OnlineEstimator(sampled_frequencies, solver='banded')
+    plan = interpolation.InterpolationPlan(sampled_frequencies, interpolated_frequencies)
+    coefficients = plan.natural_coefficients(coarse.e.fillna(0.0).values)
+    plot_directory = os.path.join('./benchmarks', 'plots')
+    spectra = {'reference': coarse, 'natural': fine, 'monotone': fine, 'target': fine}
+    workloads = {
+        'interpolate_monotone': lambda: coarse.interpolate_frequency(interpolated_frequencies, method='spline'),
+        'interpolate_natural': lambda: coarse.interpolate_frequency(interpolated_frequencies, method='spline',
+                                                                    monotone_interpolation=False),
+        'peak_period_monotone': lambda: coarse.peak_period(use_spline=True),
+        'peak_period_natural': lambda: coarse.peak_period(use_spline=True, monotone_interpolation=False),
+        'spline_peak_monotone': lambda: spline_peak.peak_period(coarse),
+        'spline_peak_natural': lambda: spline_peak.peak_period(coarse, monotone_interpolation=False),
+        'downsample': lambda: fine.downsample(sampled_frequencies),
+        'sweep_downsample': lambda: sweep.downsample(fine.e.values, interpolated_frequencies, sampled_frequencies),
+        'peak_uniform': lambda: interpolated_frequencies[np.argmax(plan.evaluate(coefficients, extrapolate=True),
+                                                                   axis=-1)],
+        'peak_adaptive': lambda: plan.peak_frequency(coefficients, extrapolate=True),
+        'online_update': lambda: [estimator.update(variance_density) for variance_density in coarse.e.values],
+        'plot_batch': lambda: plotting.SpectrumPlotter().plot_batch(spectra, plot_directory),
+    }
+    if workload not in workloads:
+        raise ValueError(f'unknown workload {workload}')
+    return workloads[workload]
+
+
+def run_case(workload, number_of_spectra, number_of_bins, refinement, repeat):
+    """
+    Run a single benchmark case. Intended to be called in a fresh process.
+    :return: best wall clock time over the repeats (s), peak resident memory of the process (bytes)
+    """
+    import resource
+
+    function = setup_workload(workload, number_of_spectra, number_of_bins, refinement)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    # ru_maxrss is in kilobytes on Linux
+    return best, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(workloads, spectra, bins, refinements, repeat=3):
+    """
+    Run all combinations of workloads and problem sizes, each in a fresh process.
+    :return: list of results (dictionaries)
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for workload in workloads:
+        if workload in FIXED_SIZE_WORKLOADS:
+            sizes = [(None, None, None)]
+        else:
+            sizes = itertools.product(spectra, bins, refinements)
+
+        for number_of_spectra, number_of_bins, refinement in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                seconds, peak_rss = executor.submit(
+                    run_case, workload, number_of_spectra, number_of_bins, refinement, repeat).result()
+
+            if number_of_spectra is None:
+                import observed_data
+                import xarray
+                with xarray.open_dataset(observed_data.REFERENCE_FILE) as dataset:
+                    number_of_spectra = dataset.sizes['time']
+
+            results.append({'workload': workload, 'spectra': number_of_spectra, 'bins': number_of_bins,
+                            'refinement': refinement, 'seconds': seconds,
+                            'spectra_per_second': number_of_spectra / seconds, 'peak_rss_mb': peak_rss / 1024 ** 2})
+    return results
+
+
+def case_name(result):
+    return f"{result['workload']}[spectra={result['spectra']},bins={result['bins']},refinement={result['refinement']}]"
+
+
+def report(results, baseline=None, tolerance=0.2):
+    """
+    Print a table of the results, compared to the baseline if given. Cases that are more than tolerance (relative)
+    slower than the baseline are flagged.
+    :return: names of the cases that regressed
+    """
+    baseline = {} if baseline is None else {case_name(result): result for result in baseline}
+    regressions = []
+
+    print(f"{'case':<70} {'seconds':>10} {'spectra/s':>12} {'peak RSS [MB]':>14} {'vs baseline':>12}")
+    for result in results:
+        name = case_name(result)
+        comparison = ''
+        if name in baseline:
+            ratio = result['seconds'] / baseline[name]['seconds']
+            comparison = f'{ratio:.2f}x'
+            if ratio > 1 + tolerance:
+                comparison += ' SLOWER'
+                regressions.append(name)
+        print(f"{name:<70} {result['seconds']:>10.4f} {result['spectra_per_second']:>12.1f} "
+              f"{result['peak_rss_mb']:>14.1f} {comparison:>12}")
+    return regressions
+
+
+def startup(repeat=5):
+    """
+    Cold start of the command line tool and of the STARTUP_IMPORTS: wall clock time of running the command (importing
+    the module) in a new interpreter, and the excluded modules that are loaded. Everything is run once before timing,
+    so that compiled (numba) functions are cached on disk.
+    :param repeat: number of timed runs (best time is reported)
+    :return: dictionary with for the command and each module the seconds and the list of excluded modules loaded
+    """
+    import subprocess
+    import sys
+
+    run_command = f'import runpy; sys.argv = {STARTUP_COMMAND!r}; runpy.run_path(sys.argv[0], run_name="__main__")'
+    cases = {' '.join(STARTUP_COMMAND): (run_command, STARTUP_EXCLUDED_MODULES)}
+    for module, excluded in STARTUP_IMPORTS.items():
+        cases[f'import {module}'] = (f'import {module}', excluded)
+
+    results = {}
+    for name, (statement, excluded) in cases.items():
+        script = f'import sys; {statement}; print(",".join(name for name in {excluded!r} if name in sys.modules))'
+        output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', script], check=True, capture_output=True)
+            seconds.append(time.perf_counter() - start)
+        results[name] = (min(seconds), [module for module in output.strip().split('\n')[-1].split(',') if module])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the peak period estimation.')
+    parser.add_argument('--workloads', nargs='+',
+                        default=['interpolate_monotone', 'interpolate_natural', 'peak_period_monotone',
+                                 'peak_period_natural', 'spline_peak_monotone', 'spline_peak_natural', 'downsample',
+                                 'sweep_downsample', 'get_periods', 'peak_uniform', 'peak_adaptive', 'online_update',
+                                 'observed_monotone_numpy', 'observed_monotone_kernel', 'observed_interpolate_library',
+                                 'observed_interpolate_banded', 'observed_peak_library', 'observed_peak_banded',
+                                 'plot_batch'],
+                        help=f'workloads to run; {FIXED_SIZE_WORKLOADS} run on the observed data.')
+    parser.add_argument('--spectra', nargs='+', type=int, default=[16, 64], help='number of spectra')
+    parser.add_argument('--bins', nargs='+', type=int, default=[50], help='number of coarse frequency bins')
+    parser.add_argument('--refinement', nargs='+', type=int, default=[10, 100], help='refinement factor')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repeats (best time is reported)')
+    parser.add_argument('--baseline', default='./benchmarks/baseline.json', help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative slowdown reported as regression')
+    parser.add_argument('--check-startup', action='store_true',
+                        help='only check the cold start of the command line tool')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET, help='cold start budget in seconds')
+    args = parser.parse_args()
+
+    if args.check_startup:
+        failures = []
+        for name, (seconds, loaded) in startup(args.repeat).items():
+            print(f'cold start of {name}: {seconds:.3f} s (budget {args.startup_budget:.3f} s)')
+            if loaded:
+                failures.append(f'{name} loads {", ".join(loaded)}')
+            if seconds > args.startup_budget:
+                failures.append(f'{name} exceeds the budget of {args.startup_budget} s')
+        raise SystemExit('; '.join(failures) if failures else 0)
+
+    results = run(args.workloads, args.spectra, args.bins, args.refinement, args.repeat)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file_handle:
+            baseline = json.load(file_handle)
+
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file_handle:
+            json.dump(results, file_handle, indent=2)
+
+    if regressions:
+        raise SystemExit(f'{len(regressions)} benchmark(s) regressed')
@@ -0,0 +1,122 @@
+"""
+Contents: Fused calculation of all bulk parameters of spectra in a single pass: the discrete, monotone and natural
+spline peak periods, the significant wave height and (optionally) the mean period and the spectral bandwidth, e.g.:
+
+    bulk = bulk_parameters(spectrum)
+    bulk = bulk_parameters(xarray.open_dataset(REFERENCE_FILE, chunks={'time': 256}), mean_period=True)
+
+The calculation is exposed through xarray.apply_ufunc(..., dask='parallelized'): for spectra backed by dask arrays
+(opened with chunks, or chunked with the chunks argument) every chunk of spectra is processed independently, in parallel
+and lazily, by the dask scheduler. Dask is optional; numpy backed spectra are processed in a single call.
+
+No high resolution spectra are created: the spline peak periods follow in closed form from the spline coefficients on
+the original frequencies (see online.OnlineEstimator and spline_peak), and the moments are integrated with the
+trapezoidal rule on the original frequencies (as FrequencySpectrum does). The monotone spline is obtained with the
+given solver; the default is that of observed_data.get_data (the quadratic program of roguewavespectrum), so that the
+monotone peak periods equal those of get_peak_period('monotone'). The banded solver of monotone_spline is much faster,
+but its peak periods differ by up to O(1e-4) s.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from typing import TYPE_CHECKING
+import numpy as np
+import online
+import sweep
+
+if TYPE_CHECKING:
+    from xarray import Dataset
+
+# Bulk parameters that are always calculated, and the ones that are calculated on request.
+PARAMETERS = ['peak_period_reference', 'peak_period_monotone', 'peak_period_natural', 'significant_waveheight']
+OPTIONAL_PARAMETERS = ['mean_period', 'bandwidth']
+
+# Estimators for the frequency grids used most recently (per process, so also per dask worker).
+_estimators = sweep.LRUCache(maxsize=16)
+
+
+def parameter_names(mean_period=False, bandwidth=False) -> list:
+    """
+    Names of the calculated bulk parameters, in the order of the last axis of bulk_kernel.
+    """
+    return PARAMETERS + [name for name, include in zip(OPTIONAL_PARAMETERS, (mean_period, bandwidth)) if include]
+
+
+def bulk_kernel(variance_density, frequency, mean_period=False, bandwidth=False,
+                solver='roguewavespectrum') -> np.ndarray:
+    """
+    Bulk parameters of a batch of spectra (the function that is applied to every chunk).
+    :param variance_density: variance densities, shape (..., nf). Missing values (NaN) are treated as zero.
+    :param frequency: frequencies, shape (nf,)
+    :param mean_period: calculate the mean period Tm01 = m0 / m1
+    :param bandwidth: calculate the spectral bandwidth (Longuet-Higgins, 1975) sqrt( m0 m2 / m1**2 - 1 )
+    :param solver: solver of the monotone spline, 'roguewavespectrum' or 'banded' (see online.OnlineEstimator)
+    :return: bulk parameters, shape (..., number of parameters); see parameter_names for the order.
+    """
+    frequency = np.asarray(frequency, dtype='float64')
+    variance_density = np.asarray(variance_density, dtype='float64')
+    shape = variance_density.shape[:-1]
+    names = parameter_names(mean_period, bandwidth)
+    if variance_density.size == 0:
+        return np.zeros(shape + (len(names),))
+
+    estimator = _estimators.get((sweep.grid_key(frequency), solver),
+                                lambda: online.OnlineEstimator(frequency, solver))
+    variance_density = np.where(np.isnan(variance_density), 0.0, variance_density)
+
+    bulk = estimator.update(variance_density)
+    bulk['peak_period_reference'] = 1 / frequency[np.argmax(variance_density, axis=-1)]
+
+    if mean_period or bandwidth:
+        m0 = variance_density @ estimator.weights
+        m1 = variance_density @ (estimator.weights * frequency)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bulk['mean_period'] = m0 / m1
+            if bandwidth:
+                m2 = variance_density @ (estimator.weights * frequency ** 2)
+                bulk['bandwidth'] = np.sqrt(m0 * m2 / m1 ** 2 - 1)
+
+    return np.stack([bulk[name] for name in names], axis=-1)
+
+
+def bulk_parameters(spectrum, mean_period=False, bandwidth=False, chunks=None,
+                    solver='roguewavespectrum') -> 'Dataset':
+    """
+    Bulk parameters of spectra, calculated in a single (fused) pass over the variance densities.
+    :param spectrum: FrequencySpectrum, or dataset with a variance_density variable with a frequency dimension (e.g.
+        xarray.open_dataset(path, chunks={'time': 256}) for lazy, chunked processing).
+    :param mean_period: calculate the mean period Tm01
+    :param bandwidth: calculate the spectral bandwidth
+    :param chunks: (optional) chunks of the spectra (e.g. {'time': 256}); requires dask.
+    :param solver: solver of the monotone spline, 'roguewavespectrum' or 'banded' (see online.OnlineEstimator)
+    :return: dataset with one variable per bulk parameter; lazy (dask backed) if the spectra are.
+    """
+    import xarray
+
+    dataset = spectrum if isinstance(spectrum, xarray.Dataset) else spectrum.dataset
+    variance_density = dataset['variance_density']
+    if chunks is not None:
+        variance_density = variance_density.chunk(chunks)
+
+    if variance_density.chunks is not None:
+        # The frequency dimension is the core dimension of the kernel and has to be a single chunk.
+        variance_density = variance_density.chunk({'frequency': -1})
+
+    names = parameter_names(mean_period, bandwidth)
+    bulk = xarray.apply_ufunc(
+        bulk_kernel, variance_density,
+        input_core_dims=[['frequency']], output_core_dims=[['parameter']],
+        kwargs={'frequency': dataset['frequency'].values, 'mean_period': mean_period, 'bandwidth': bandwidth,
+                'solver': solver},
+        dask='parallelized', output_dtypes=['float64'], dask_gufunc_kwargs={'output_sizes': {'parameter': len(names)}}
+    )
+    return bulk.assign_coords(parameter=names).to_dataset(dim='parameter').drop_vars('parameter', errors='ignore')
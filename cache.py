@@ -0,0 +1,180 @@
+"""
+Contents: Content addressed cache for intermediate results. Results are stored as netCDF files under a key that is a
+hash of the contents of the input files and the options used to calculate the result. Changing either the input data or
+the options therefore results in a new key and a recalculation. Entries are validated when loaded, invalid (corrupt or
+mismatching) entries are removed, and the least recently used entries are evicted once the cache exceeds its size limit.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from xarray import Dataset
+import xarray
+import hashlib
+import json
+import os
+import secrets
+import warnings
+
+# Location of the cache and the maximum size (in bytes) of all cached entries combined.
+CACHE_DIRECTORY = './data/cache'
+CACHE_SIZE_LIMIT = 2 * 1024 ** 3
+
+# Bump if the layout of stored entries or keys changes; all existing entries are then treated as stale. Changes of the
+# calculations are covered by the hashes of their code in the keys (see cache_key).
+CACHE_FORMAT = 2
+
+# Hashes of files we have seen, keyed on (path, size, modification time), to avoid rehashing large files.
+_file_hashes = {}
+
+
+def temporary_file(path) -> str:
+    """
+    Create an empty temporary file with a unique name in the directory of a file that is about to be written. Files are
+    written to a temporary file first and then moved to their final name with os.replace, so that an interrupted write
+    never leaves a partial file under the final name. The unique name makes sure that concurrent writers of the same
+    file never write to the same temporary file.
+    :param path: final path of the file
+    :return: path of the temporary file
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    while True:
+        temporary_path = os.path.join(directory, f'{name}.{secrets.token_hex(8)}.tmp')
+        try:
+            # Created with the permissions of open(), i.e. subject to the umask of the process.
+            os.close(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            return temporary_path
+        except FileExistsError:
+            continue
+
+
+def write_atomically(path, write):
+    """
+    Write a file through a temporary file (see temporary_file) that replaces the file once it is complete. If the write
+    fails, the temporary file is removed.
+    :param path: path of the file
+    :param write: function that writes the file to the path it is given
+    :return: None
+    """
+    temporary_path = temporary_file(path)
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def file_hash(path) -> str:
+    """
+    Get the sha256 hash of the contents of a file.
+    :param path: path to the file
+    :return: hex digest
+    """
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if signature not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file_handle:
+            for block in iter(lambda: file_handle.read(2 ** 20), b''):
+                digest.update(block)
+        _file_hashes[signature] = digest.hexdigest()
+    return _file_hashes[signature]
+
+
+def cache_key(paths, code=(), **options) -> str:
+    """
+    Get the key of a cache entry.
+    :param paths: input files the result is calculated from
+    :param code: source files of the modules the result is calculated with. Their hashes are part of the key (as in
+        sweep.SweepStore), so that a change of the calculation results in a new key and a recalculation.
+    :param options: options used to calculate the result (must be json serializable)
+    :return: key
+    """
+    description = {'format': CACHE_FORMAT, 'inputs': [file_hash(path) for path in paths],
+                   'code': [file_hash(path) for path in code], 'options': options}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_path(name, key) -> str:
+    return os.path.join(CACHE_DIRECTORY, f'{name}-{key[:32]}.nc')
+
+
+def load(name, key):
+    """
+    Load an entry from the cache. Entries that cannot be read or that do not belong to the given key are removed.
+    :param name: descriptive name of the entry
+    :param key: key of the entry (see cache_key)
+    :return: dataset, or None if there is no valid entry.
+    """
+    path = _entry_path(name, key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with xarray.open_dataset(path) as dataset:
+            if dataset.attrs.get('cache_key') != key:
+                raise ValueError('cache key mismatch')
+            dataset = dataset.load()
+    except Exception as error:
+        warnings.warn(f'Removing invalid cache entry {path}: {error}')
+        os.remove(path)
+        return None
+
+    # Mark as recently used
+    os.utime(path)
+    del dataset.attrs['cache_key']
+    return dataset
+
+
+def save(name, key, dataset: Dataset):
+    """
+    Save an entry to the cache and evict old entries if the cache exceeds its size limit.
+    :param name: descriptive name of the entry
+    :param key: key of the entry (see cache_key)
+    :param dataset: data to store
+    :return: None
+    """
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    path = _entry_path(name, key)
+
+    # Write to a temporary file first so that an interrupted write never leaves a partial entry under the final name.
+    dataset = dataset.copy()
+    dataset.attrs['cache_key'] = key
+    write_atomically(path, dataset.to_netcdf)
+
+    evict()
+
+
+def evict(size_limit=None):
+    """
+    Remove the least recently used entries until the total size of the cache is below the size limit.
+    :param size_limit: size limit in bytes (defaults to CACHE_SIZE_LIMIT)
+    :return: None
+    """
+    if size_limit is None:
+        size_limit = CACHE_SIZE_LIMIT
+
+    if not os.path.isdir(CACHE_DIRECTORY):
+        return
+
+    entries = []
+    for file_name in os.listdir(CACHE_DIRECTORY):
+        if file_name.endswith('.nc'):
+            stat = os.stat(os.path.join(CACHE_DIRECTORY, file_name))
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+
+    total_size = sum(entry[1] for entry in entries)
+    for _, size, file_name in sorted(entries):
+        if total_size <= size_limit:
+            break
+        os.remove(os.path.join(CACHE_DIRECTORY, file_name))
+        total_size -= size
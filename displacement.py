@@ -0,0 +1,224 @@
+"""
+Contents: Streaming spectral analysis of raw buoy displacement records. The displacement file (months of 2.5 Hz data)
+is never read into memory as a whole; instead it is read one segment (by default an hour) at a time directly from the
+netCDF file, and a (Welch) frequency spectrum with directional moments is estimated for each segment, e.g.:
+
+    spectrum = estimate_spectra('./data/displacement.nc', get_window('hann', 2048), spectral_window=numpy.ones(9))
+
+Only the time stamps and displacements of the current segment (and the spectra themselves) are held in memory.
+
+Directional moments follow from the co- and quad-spectra of the horizontal (x: east, y: north) and vertical (z)
+displacements (Longuet-Higgins et al., 1963):
+
+    a1 = Q_xz / sqrt( C_zz (C_xx + C_yy) ),     b1 = Q_yz / sqrt( C_zz (C_xx + C_yy) ),
+    a2 = (C_xx - C_yy) / (C_xx + C_yy),         b2 = 2 C_xy / (C_xx + C_yy),
+
+so that a1 = 1 for waves travelling towards the east.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from roguewavespectrum import FrequencySpectrum
+from scipy.signal import csd, get_window
+from xarray import Dataset
+from typing import Iterator
+import netCDF4
+import numpy as np
+import pandas
+
+DISPLACEMENT_FILE = './data/displacement.nc'
+
+# Names of the time and displacement variables in the displacement file.
+NAME_TIME = 'time'
+NAME_X = 'x'
+NAME_Y = 'y'
+NAME_Z = 'z'
+
+# Variables that, if present in the displacement file, are averaged over a segment and added to the spectrum.
+SEGMENT_AVERAGED_VARIABLES = ['latitude', 'longitude', 'depth']
+
+# Units of the time variable we understand, in seconds.
+TIME_UNITS = {'seconds': 1.0, 'milliseconds': 1e-3, 'microseconds': 1e-6, 'minutes': 60.0, 'hours': 3600.0,
+              'days': 86400.0}
+
+
+class DisplacementReader:
+    """
+    Read a displacement file one time segment at a time.
+    """
+
+    def __init__(self, path=DISPLACEMENT_FILE):
+        self.dataset = netCDF4.Dataset(path)
+        self.dataset.set_auto_mask(False)
+
+        # Time is kept as float seconds since the epoch of the file so that we can read it in blocks without decoding.
+        time = self.dataset[NAME_TIME]
+        unit, _, epoch = time.units.partition(' since ')
+        self.time_scale = TIME_UNITS[unit.strip()]
+        self.epoch = np.datetime64(pandas.Timestamp(epoch.strip()).tz_localize(None), 'ns')
+        self.number_of_samples = len(time)
+
+    def close(self):
+        self.dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def seconds(self, start, stop) -> np.ndarray:
+        """
+        Time of samples start to stop (exclusive) in seconds since the epoch of the file.
+        """
+        return np.asarray(self.dataset[NAME_TIME][start:stop], dtype='float64') * self.time_scale
+
+    def sampling_frequency(self, number_of_samples=1000) -> float:
+        """
+        Sampling frequency estimated from the first samples, rounded to a micro Hertz (the time stamps of the samples
+        themselves are only accurate to round-off, e.g. O(1e-7) s for float seconds since 1970).
+        """
+        seconds = self.seconds(0, number_of_samples)
+        return round((len(seconds) - 1) / (seconds[-1] - seconds[0]), 6)
+
+    def segments(self, segment_length_seconds=3600) -> Iterator[Dataset]:
+        """
+        Iterate over consecutive segments of segment_length_seconds, starting at the first sample. Segments without any
+        samples (gaps in the record) are skipped.
+        :param segment_length_seconds: length of a segment
+        :return: iterator over segments (time, x, y, z and segment averaged variables along the time dimension); the
+            start time of the segment is stored in the attribute segment_start.
+        """
+        block_size = int(np.ceil(segment_length_seconds * self.sampling_frequency())) + 1
+        start = 0
+        segment_start = self.seconds(0, 1)[0]
+        while start < self.number_of_samples:
+            # Read time stamps in blocks until we pass the end of the segment (or the end of the file).
+            segment_end = segment_start + segment_length_seconds
+            stop = start
+            while stop < self.number_of_samples:
+                seconds = self.seconds(stop, stop + block_size)
+                number_in_segment = np.searchsorted(seconds, segment_end, side='left')
+                stop += number_in_segment
+                if number_in_segment < len(seconds):
+                    break
+
+            if stop > start:
+                seconds = self.seconds(start, stop)
+                segment = Dataset(
+                    data_vars={name: (NAME_TIME, np.asarray(self.dataset[name][start:stop], dtype='float64'))
+                               for name in [NAME_X, NAME_Y, NAME_Z] + SEGMENT_AVERAGED_VARIABLES
+                               if name in self.dataset.variables},
+                    coords={NAME_TIME: self.epoch + (seconds * 1e9).astype('timedelta64[ns]')}
+                )
+                segment.attrs['segment_start'] = self.epoch + np.timedelta64(int(segment_start * 1e9), 'ns')
+                yield segment
+                start = stop
+                segment_start = segment_end
+            else:
+                # Gap in the record: continue at the segment that contains the next sample.
+                next_sample = self.seconds(start, start + 1)[0]
+                segment_start += np.floor((next_sample - segment_start) / segment_length_seconds) * \
+                    segment_length_seconds
+
+
+def estimate_frequency_spectrum(x, y, z, sampling_frequency, window, spectral_window=None, use_u=True, use_v=True):
+    """
+    Estimate the variance density and directional moments of a single segment with Welch's method (50% overlap).
+    :param x: eastward displacement, shape (nt,)
+    :param y: northward displacement, shape (nt,)
+    :param z: vertical displacement, shape (nt,)
+    :param sampling_frequency: sampling frequency (Hz)
+    :param window: window of a Welch sub-segment; its length sets the frequency resolution.
+    :param spectral_window: (optional) weights of a moving average over frequency applied to the co/quad spectra.
+    :param use_u: use the eastward displacement for the directional moments.
+    :param use_v: use the northward displacement for the directional moments.
+    :return: frequencies (without the Nyquist frequency), dictionary with variance_density, a1, b1, a2, b2
+    """
+    signals = {'x': x if use_u else np.zeros_like(z), 'y': y if use_v else np.zeros_like(z), 'z': z}
+
+    spectra = {}
+    for first, second in ('zz', 'xx', 'yy', 'xy', 'xz', 'yz'):
+        frequency, spectra[first + second] = csd(signals[first], signals[second], fs=sampling_frequency,
+                                                 window=window, nperseg=len(window), detrend='constant')
+
+    if spectral_window is not None:
+        weights = np.asarray(spectral_window, dtype='float64')
+        normalization = np.convolve(np.ones(len(frequency)), weights, mode='same')
+        spectra = {key: np.convolve(value, weights, mode='same') / normalization for key, value in spectra.items()}
+
+    czz, cxx, cyy = spectra['zz'].real, spectra['xx'].real, spectra['yy'].real
+    horizontal = cxx + cyy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertical_horizontal = np.sqrt(czz * horizontal)
+        moments = {
+            'variance_density': czz,
+            'a1': spectra['xz'].imag / vertical_horizontal,
+            'b1': spectra['yz'].imag / vertical_horizontal,
+            'a2': (cxx - cyy) / horizontal,
+            'b2': 2 * spectra['xy'].real / horizontal,
+        }
+
+    # Drop the Nyquist frequency (as in the spectra of the buoy).
+    return frequency[:-1], {key: value[:-1] for key, value in moments.items()}
+
+
+def iterate_spectra(path=DISPLACEMENT_FILE, window=None, spectral_window=None, segment_length_seconds=3600,
+                    use_u=True, use_v=True) -> Iterator[FrequencySpectrum]:
+    """
+    Estimate the spectrum of every segment of the displacement file, one segment at a time.
+    :param path: displacement file
+    :param window: window of a Welch sub-segment (default: hann window of 256 samples)
+    :param spectral_window: (optional) weights of a moving average over frequency.
+    :param segment_length_seconds: length of the segment a spectrum is estimated from.
+    :param use_u: use the eastward displacement for the directional moments.
+    :param use_v: use the northward displacement for the directional moments.
+    :return: iterator over spectra (each with a time dimension of length 1)
+    """
+    if window is None:
+        window = get_window('hann', 256)
+
+    with DisplacementReader(path) as reader:
+        sampling_frequency = reader.sampling_frequency()
+        for segment in reader.segments(segment_length_seconds):
+            if segment.sizes[NAME_TIME] < len(window):
+                # Not enough data for a single Welch sub-segment.
+                continue
+
+            frequency, moments = estimate_frequency_spectrum(
+                segment[NAME_X].values, segment[NAME_Y].values, segment[NAME_Z].values, sampling_frequency, window,
+                spectral_window, use_u, use_v)
+
+            time = [segment.attrs['segment_start']]
+            data_vars = {key: (('time', 'frequency'), value[None, :]) for key, value in moments.items()}
+            for name in SEGMENT_AVERAGED_VARIABLES:
+                if name in segment:
+                    data_vars[name] = ('time', [float(segment[name].mean())])
+            yield FrequencySpectrum(Dataset(data_vars=data_vars, coords={'time': time, 'frequency': frequency}))
+
+
+def estimate_spectra(path=DISPLACEMENT_FILE, window=None, spectral_window=None, segment_length_seconds=3600,
+                     use_u=True, use_v=True) -> FrequencySpectrum:
+    """
+    Estimate the spectra of all segments of the displacement file (see iterate_spectra). Only the spectra are kept in
+    memory, never the full displacement record.
+    :return: spectrum
+    """
+    datasets = [spectrum.dataset for spectrum in
+                iterate_spectra(path, window, spectral_window, segment_length_seconds, use_u, use_v)]
+    if not datasets:
+        raise ValueError(f'{path} contains no segment of {segment_length_seconds} s with enough data for a spectrum')
+    return FrequencySpectrum(
+        Dataset({name: (datasets[0][name].dims, np.concatenate([dataset[name].values for dataset in datasets]))
+                 for name in datasets[0].data_vars},
+                coords={'time': np.concatenate([dataset['time'].values for dataset in datasets]),
+                        'frequency': datasets[0]['frequency'].values}))
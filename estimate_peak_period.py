@@ -0,0 +1,128 @@
+"""
+Contents: Command line tool that estimates the peak periods (discrete, monotone and natural spline) and the significant
+wave height of all spectra in a netCDF file in the layout of spectrum_reference.nc, e.g.:
+
+    python estimate_peak_period.py ./data/spectrum_reference.nc                   # csv on standard output
+    python estimate_peak_period.py station.nc --output bulk.csv --mean-period
+    python estimate_peak_period.py station.nc --output bulk.nc
+
+Intended for short-lived (e.g. scheduled) processes, where importing libraries would take most of the run time: the
+file is read with netCDF4 and the bulk parameters are calculated by bulk.bulk_kernel on plain arrays, so neither
+roguewavespectrum (which takes seconds to import), xarray, pandas nor any plotting library is loaded. The spectra are
+processed in blocks of chunk_size time steps, so memory use does not depend on the length of the record. See
+benchmark.py --check-startup for the start-up time budget.
+
+For the same reason the monotone spline is solved with the banded solver by default, whose monotone peak periods differ
+from those of observed_data.get_data by up to O(1e-4) s. With --solver roguewavespectrum they are identical, at the cost
+of importing roguewavespectrum.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+import argparse
+import os
+import sys
+import netCDF4
+import numpy as np
+import bulk
+import monotone_spline
+
+
+def iterate_bulk_parameters(path, chunk_size=1024, mean_period=False, bandwidth=False, solver='banded'):
+    """
+    Bulk parameters of the spectra in a file, one block of chunk_size time steps at a time.
+    :param path: netCDF file with variance_density as function of time and frequency
+    :param chunk_size: number of time steps in a block
+    :param mean_period: also calculate the mean period
+    :param bandwidth: also calculate the spectral bandwidth
+    :param solver: solver of the monotone spline, 'banded' or 'roguewavespectrum' (see bulk.bulk_kernel)
+    :return: iterator over (times, bulk parameters) per block; times as datetimes, bulk parameters of shape
+        (n, number of parameters) in the order of bulk.parameter_names.
+    """
+    with netCDF4.Dataset(path) as dataset:
+        dataset.set_auto_mask(False)
+        variance_density = dataset['variance_density']
+        if variance_density.dimensions not in (('time', 'frequency'), ('frequency', 'time')):
+            raise ValueError(f'variance_density in {path} must have dimensions time and frequency')
+        frequency = dataset['frequency'][:]
+        time = dataset['time']
+
+        for start in range(0, len(time), chunk_size):
+            block = slice(start, start + chunk_size)
+            if variance_density.dimensions[0] == 'time':
+                values = variance_density[block, :]
+            else:
+                values = variance_density[:, block].T
+
+            times = netCDF4.num2date(time[block], time.units, getattr(time, 'calendar', 'standard'),
+                                     only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+            yield times, bulk.bulk_kernel(values, frequency, mean_period, bandwidth, solver)
+
+
+def write_csv(file_handle, blocks, names):
+    file_handle.write(','.join(['time'] + names) + '\n')
+    for times, values in blocks:
+        for time, row in zip(times, values):
+            file_handle.write(','.join([time.isoformat()] + [f'{value:.6f}' for value in row]) + '\n')
+
+
+def write_netcdf(path, blocks, names):
+    with netCDF4.Dataset(path, 'w') as dataset:
+        # Unlimited time dimension, so that every block is appended as soon as it is calculated.
+        dataset.createDimension('time', None)
+        time = dataset.createVariable('time', 'f8', ('time',))
+        time.units = 'seconds since 1970-01-01 00:00:00'
+        time.calendar = 'proleptic_gregorian'
+        variables = [dataset.createVariable(name, 'f8', ('time',), fill_value=np.nan) for name in names]
+
+        size = 0
+        for times, values in blocks:
+            block = slice(size, size + len(times))
+            time[block] = netCDF4.date2num(list(times), time.units, time.calendar)
+            for index, variable in enumerate(variables):
+                variable[block] = values[:, index]
+            size += len(times)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(
+        description='Estimate peak periods and significant wave height of the spectra in a netCDF file.')
+    parser.add_argument('path', help='netCDF file with variance_density as function of time and frequency')
+    parser.add_argument('--output', default=None,
+                        help='output file; netCDF if it ends with .nc, csv otherwise (default: csv on standard output)')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='number of time steps processed at once')
+    parser.add_argument('--mean-period', action='store_true', help='also calculate the mean period Tm01')
+    parser.add_argument('--bandwidth', action='store_true', help='also calculate the spectral bandwidth')
+    parser.add_argument('--solver', choices=monotone_spline.SOLVERS, default='banded',
+                        help='solver of the monotone spline (default: banded)')
+    args = parser.parse_args(arguments)
+
+    names = bulk.parameter_names(args.mean_period, args.bandwidth)
+    blocks = iterate_bulk_parameters(args.path, args.chunk_size, args.mean_period, args.bandwidth, args.solver)
+    if args.output is None:
+        try:
+            write_csv(sys.stdout, blocks, names)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader closed the pipe (e.g. | head). Point standard output at devnull so that the interpreter does
+            # not fail again when it flushes it at exit, and stop without a traceback.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+    elif args.output.endswith('.nc'):
+        write_netcdf(args.output, blocks, names)
+    else:
+        with open(args.output, 'w') as file_handle:
+            write_csv(file_handle, blocks, names)
+
+
+if __name__ == '__main__':
+    main()
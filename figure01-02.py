@@ -14,9 +14,12 @@ Authors: Pieter Bart Smit
 """
 
 from roguewavespectrum import FrequencySpectrum
-from roguewavespectrum.parametric import create_parametric_frequency_spectrum
 import matplotlib.pyplot as plt
 import numpy as np
+import interpolation
+import plotting
+import refinement
+import sweep
 import os
 
 
@@ -28,12 +31,12 @@ def get_spectra(peak_frequency, standard_deviation, kind='gaussian'):
     :param kind: jonswap or gaussian
     :return:
     """
-    true_spectrum = create_parametric_frequency_spectrum(interpolated_frequencies, peak_frequency, 1, kind,
-                                                         standard_deviation_hertz=standard_deviation)
-    downsampled_spectrum = true_spectrum.downsample(sampled_frequencies)
-    interpolated_spectrum = downsampled_spectrum.interpolate_frequency(interpolated_frequencies, method='spline')
-    non_monotone = downsampled_spectrum.interpolate_frequency(interpolated_frequencies, method='spline',
-                                                              monotone_interpolation=False)
+    true_spectrum = sweep.parametric_spectrum(interpolated_frequencies, peak_frequency, kind, standard_deviation)
+    downsampled_spectrum = sweep.downsampled_parametric_spectrum(interpolated_frequencies, sampled_frequencies,
+                                                                 peak_frequency, kind, standard_deviation)
+    plan = interpolation.get_plan(sampled_frequencies, interpolated_frequencies)
+    interpolated_spectrum = plan.interpolate(downsampled_spectrum)
+    non_monotone = plan.interpolate(downsampled_spectrum, monotone_interpolation=False)
 
     return {'target': true_spectrum, 'downsampled': downsampled_spectrum, 'interpolated': interpolated_spectrum,
             'non_monotone': non_monotone}
@@ -45,15 +48,7 @@ def plot(spectrum: FrequencySpectrum, block=False, freq_scale=1, scale=1, **kwar
     y = spectrum.variance_density.values / scale
 
     if block:
-        dx = x[2] - x[1]
-
-        xx = []
-        yy = []
-        for ii in range(len(x)):
-            xx += [x[ii] - 0.5 * dx, x[ii] + 0.5 * dx]
-            yy += [y[ii], y[ii]]
-
-        x, y = xx, yy # blockify(x, y)
+        x, y = plotting.blockify(x, y)
 
     plt.plot(x, y, **kwargs)
 
@@ -90,31 +85,36 @@ def plot_example(kind, peak_frequency, step, xlab=True, ylab=True, text=None, lo
     plt.grid('on')
 
 
-if __name__ == '__main__':
-    # the coarse frequency step
-    frequency_step = 0.01
+# --- Setup ---
 
-    # frequency limits
-    frequency_limits = [0.0, 0.5]
+# the coarse frequency step
+frequency_step = 0.01
 
-    # the high resolution frequency step used for integration
-    frequency_step_highres = frequency_step / 100
+# frequency limits
+frequency_limits = [0.0, 0.5]
 
-    # frequency band
-    frequency_band = frequency_limits[1] - frequency_limits[0]
+# the high resolution frequency step used for integration (refinement factor 100 unless calibrated, see refinement.py)
+frequency_step_highres = frequency_step / refinement.get_refinement()
 
-    # Frequencies we sample the distribution at.
-    sampled_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
-                                      int(frequency_band / frequency_step) + 1,
-                                      endpoint=True)
+# frequency band
+frequency_band = frequency_limits[1] - frequency_limits[0]
 
-    # frequencies we interpolate at
-    interpolated_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
-                                           int(frequency_band / frequency_step_highres) + 1, endpoint=True)
+# Frequencies we sample the distribution at.
+sampled_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
+                                  int(frequency_band / frequency_step) + 1,
+                                  endpoint=True)
 
-    # Figure 1
-    # ---------------
+# frequencies we interpolate at
+interpolated_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
+                                       int(frequency_band / frequency_step_highres) + 1, endpoint=True)
 
+
+def render_figure01(output_directory='./figures'):
+    """
+    Render figure 1 and save it to the output directory.
+    :param output_directory: directory the figure is saved to
+    :return: path of the figure
+    """
     figure = plt.figure(figsize=[7, 6], dpi=300)
     plt.subplot(2, 2, 1)
     plot_example('gaussian', 0.0525, 1 * frequency_step, xlab=False, text=r'(a) $1.00 \Delta f$')
@@ -130,13 +130,19 @@ if __name__ == '__main__':
     plot_example('gaussian', 0.0525, 0.1 * frequency_step, ylab=False, text=r'(d) $0.10 \Delta f$')
 
     plt.tight_layout()
-    os.makedirs('./figures', exist_ok=True)
-    figure.savefig('./figures/figure01.png')
+    os.makedirs(output_directory, exist_ok=True)
+    path = os.path.join(output_directory, 'figure01.png')
+    figure.savefig(path)
+    return path
 
-    # Figure 2
-    # ---------------
 
-    log = False
+def render_figure02(output_directory='./figures', log=False):
+    """
+    Render figure 2 and save it to the output directory.
+    :param output_directory: directory the figure is saved to
+    :param log: use logarithmic axes
+    :return: path of the figure
+    """
     figure = plt.figure(figsize=[7, 6], dpi=300)
     plt.subplot(2, 2, 1)
     plot_example('jonswap', 0.0525, 1 * frequency_step, xlab=False, text=r'(a) JONSWAP' + '\n' + r'$f_{peak}=0.055$ Hz',
@@ -156,7 +162,13 @@ if __name__ == '__main__':
 
     plt.tight_layout()
 
-    os.makedirs('./figures', exist_ok=True)
-    figure.savefig('./figures/figure02.png')
+    os.makedirs(output_directory, exist_ok=True)
+    path = os.path.join(output_directory, 'figure02.png')
+    figure.savefig(path)
+    return path
 
+
+if __name__ == '__main__':
+    render_figure01()
+    render_figure02()
     plt.show()
@@ -13,11 +13,11 @@ Sofar Ocean Technologies
 Authors: Pieter Bart Smit
 """
 
-from roguewavespectrum.parametric import create_parametric_frequency_spectrum
+import refinement
+import sweep
 import matplotlib.pyplot as plt
 import numpy as np
 import os
-import pickle
 
 # --- Plotting functions ---
 def get_periods(peak_periods, standard_deviations, kind='gaussian'):
@@ -28,24 +28,8 @@ def get_periods(peak_periods, standard_deviations, kind='gaussian'):
     :param kind: jonswap or gaussian
     :return:
     """
-    truth = np.zeros((len(standard_deviations), len(peak_periods)))
-    downsampled = np.zeros((len(standard_deviations), len(peak_periods)))
-    interpolated = np.zeros((len(standard_deviations), len(peak_periods)))
-    natural = np.zeros((len(standard_deviations), len(peak_periods)))
-
-    for ind_sd, standard_deviation in enumerate(standard_deviations):
-        for ind_per, period in enumerate(peak_periods):
-            true_spectrum = create_parametric_frequency_spectrum(interpolated_frequencies, period, 1, kind,
-                                                                 standard_deviation_hertz=standard_deviation)
-            downsampled_spectrum = true_spectrum.downsample(sampled_frequencies)
-
-            truth[ind_sd, ind_per] = true_spectrum.peak_period().values
-            downsampled[ind_sd, ind_per] = downsampled_spectrum.peak_period().values
-            interpolated[ind_sd, ind_per] = downsampled_spectrum.peak_period(use_spline=True).values
-            natural[ind_sd, ind_per] = downsampled_spectrum.peak_period(use_spline=True,monotone_interpolation=False).values
-
-    return {'target': truth, 'downsampled_error': np.abs(downsampled - truth) / truth,
-            'interpolated_error': np.abs(interpolated - truth) / truth,'downsampled':downsampled,'monotone':interpolated,'natural':natural }
+    return sweep.get_periods(peak_periods, standard_deviations, interpolated_frequencies, sampled_frequencies,
+                             kind=kind, solver=solver)
 
 
 
@@ -87,57 +71,32 @@ def plot( periods, data, kind, _range, diff,xlabel=None,ylabel=None,plot_legend=
     else:
         plt.gca().axes.yaxis.set_ticklabels([])
 
-def get_data(peak_frequency, frequency_width):
-    # Running is somewhat slow - so we save locally the results after the first time.
-    if os.path.exists('data/data.zip'):
-        with open("data/data.pkl", "rb") as file_handle:
-            data = pickle.loads(file_handle)
-    else:
-        # Lets calculate
-        data = {}
-        data['gaussian'] = get_periods(peak_frequency, frequency_width, kind='gaussian')
-        data['jonswap'] = get_periods(peak_frequency, [0.0], kind='jonswap')
-        data['pm'] = get_periods(peak_frequency, [0.0], kind='pm')
-
-        with open("data/data.pkl", "wb") as file_handle:
-            pickle.dump(data, file_handle)
-
-
-    return data
-
-# --- Main script ---
-if __name__ == '__main__':
-
-    # --- Setup ---
-
-    # the coarse frequency step
-    frequency_step = 0.01
-
-    # frequency limits
-    frequency_limits = [0.01, 0.5]
-
-    # the high resolution frequency step used for integration
-    frequency_step_highres = frequency_step / 100
-
-    # frequency band
-    frequency_band = frequency_limits[1] - frequency_limits[0]
-
-    # Frequencies we sample the distribution at.
-    sampled_frequencies = np.linspace(frequency_limits[0], frequency_limits[1], int(frequency_band / frequency_step) + 1,
-                                      endpoint=True)
-
-    # frequencies we interpolate at
-    interpolated_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
-                                           int(frequency_band / frequency_step_highres) + 1, endpoint=True)
+def get_data(peak_frequency, frequency_width, max_workers=None):
+    """
+    Get the peak periods of the sweeps of figure 3. Running is somewhat slow - so every chunk of the sweep is stored
+    as soon as it is calculated (see sweep.SweepStore), and only what is not stored yet is calculated. An interrupted
+    run continues where it stopped, and adding peak frequencies or widths only calculates the new ones.
+    :param peak_frequency: peak frequencies of the true distribution
+    :param frequency_width: standard deviations of the gaussian distributions
+    :param max_workers: number of worker processes for the sweep (see sweep.get_data)
+    :return: dictionary with for each kind the dictionary returned by sweep.get_periods.
+    """
+    store = sweep.SweepStore(interpolated_frequencies, sampled_frequencies, solver=solver)
 
-    # Peak frequencies we consider
-    peak_frequency = np.linspace( 5 * frequency_step, 15 * frequency_step, 101)
+    # Lets calculate - the sweeps are independent and distributed over max_workers processes.
+    return sweep.get_data(peak_frequency, frequency_width, interpolated_frequencies, sampled_frequencies,
+                          max_workers=max_workers, store=store, solver=solver)
 
-    # Frequency widths
-    frequency_width = [2*frequency_step,frequency_step,frequency_step/2,frequency_step/10]
 
+def render(output_directory='./figures', max_workers=None):
+    """
+    Render figure 3 and save it to the output directory.
+    :param output_directory: directory the figure is saved to
+    :param max_workers: number of worker processes used if the sweep has to be calculated.
+    :return: path of the figure
+    """
     # Get data to plot
-    data = get_data(peak_frequency, frequency_width)
+    data = get_data(peak_frequency, frequency_width, max_workers=max_workers)
 
     # -- Plotting --
     figure = plt.figure( figsize=[7,5],dpi=300 )
@@ -167,7 +126,45 @@ if __name__ == '__main__':
     plt.ylim([-1.5,1.5])
 
     plt.tight_layout()
-    os.makedirs('./figures',exist_ok=True)
-    figure.savefig('./figures/figure03.png')
+    os.makedirs(output_directory,exist_ok=True)
+    path = os.path.join(output_directory, 'figure03.png')
+    figure.savefig(path)
+    return path
+
+
+# --- Setup ---
+
+# the coarse frequency step
+frequency_step = 0.01
+
+# frequency limits
+frequency_limits = [0.01, 0.5]
+
+# the high resolution frequency step used for integration (refinement factor 100 unless calibrated, see refinement.py)
+frequency_step_highres = frequency_step / refinement.get_refinement()
 
+# frequency band
+frequency_band = frequency_limits[1] - frequency_limits[0]
+
+# Frequencies we sample the distribution at.
+sampled_frequencies = np.linspace(frequency_limits[0], frequency_limits[1], int(frequency_band / frequency_step) + 1,
+                                  endpoint=True)
+
+# frequencies we interpolate at
+interpolated_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
+                                       int(frequency_band / frequency_step_highres) + 1, endpoint=True)
+
+# Peak frequencies we consider
+peak_frequency = np.linspace( 5 * frequency_step, 15 * frequency_step, 101)
+
+# Frequency widths
+frequency_width = [2*frequency_step,frequency_step,frequency_step/2,frequency_step/10]
+
+# Solver of the monotone spline: 'roguewavespectrum' as in the manuscript, or 'banded' for the much faster solver of
+# monotone_spline (peak periods differ by O(1e-3) s).
+solver = 'roguewavespectrum'
+
+# --- Main script ---
+if __name__ == '__main__':
+    render()
     plt.show()
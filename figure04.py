@@ -14,12 +14,17 @@ Authors: Pieter Bart Smit
 """
 
 import observed_data
-import numpy as np
+import plotting
+import spectrum_store
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 
+# The spectra are hourly, but not on the hour; the spectra closest to the dates of the panels are plotted (as
+# FrequencySpectrum.sel does by default). A date further than this from any spectrum is an error.
+SPECTRAL_DATE_TOLERANCE = timedelta(minutes=30)
+
 # --- Plotting functions ---
 def plot_bulk_parameter(data, start_date, end_date, ylim, xlabel, spectral_dates, **kwargs):
     """
@@ -50,41 +55,26 @@ def plot_bulk_parameter(data, start_date, end_date, ylim, xlabel, spectral_dates
     plt.grid('on')
 
 
-def plot_spec(spectral_dates: datetime, spectrum, lim=(0., 0.3)):
+def plot_spec(spectral_dates: datetime, spectrum: spectrum_store.SpectrumStore, lim=(0., 0.3)):
     """
     Plot spectra
-    :param spectral_dates: date to plot spectrum for.
-    :param spectrum: spectral data
+    :param spectral_dates: date to plot spectrum for (the nearest time step within SPECTRAL_DATE_TOLERANCE is used).
+    :param spectrum: spectral data, indexed on time
     :param lim: frequency limits
     :return: None
     """
-    def blockify(x, y):
-        """
-        Create bars to plot for discrete spectra
-        :param x: time
-        :param y: period
-        :return: plotable bars
-        """
-        dx = x[2] - x[1]
-
-        xx = []
-        yy = []
-        for ii in range(len(x)):
-            xx += [x[ii] - 0.5 * dx, x[ii] + 0.5 * dx]
-            yy += [y[ii], y[ii]]
-        return np.array(xx), np.array(yy)
-
-    spec_tar = spectrum['target'].sel(time=spectral_dates)
-    spec_nat = spectrum['natural'].sel(time=spectral_dates)
-    spec_mon = spectrum['monotone'].sel(time=spectral_dates)
-    spec_ref = spectrum['reference'].sel(time=spectral_dates)
-
-    x, y = blockify(spec_ref.frequency.values, spec_ref.values[:])
+    spectra = spectrum.get(spectral_dates, method='nearest', tolerance=SPECTRAL_DATE_TOLERANCE)
+    spec_tar = spectra['target']
+    spec_nat = spectra['natural']
+    spec_mon = spectra['monotone']
+    spec_ref = spectra['reference']
+
+    x, y = plotting.blockify(spec_ref['frequency'], spec_ref['variance_density'])
     plt.plot(x, y, 'grey', label='piecewise')
-    plt.plot(spec_ref.frequency, spec_ref.values[:], 'grey', linestyle='--', label='linear')
-    plt.plot(spec_nat.frequency, spec_nat.values[:], 'b', label='natural')
-    plt.plot(spec_mon.frequency, spec_mon.values[:], 'orange', label='monotone')
-    plt.plot(spec_tar.frequency, spec_tar.values[:], 'k', label='target')
+    plt.plot(spec_ref['frequency'], spec_ref['variance_density'], 'grey', linestyle='--', label='linear')
+    plt.plot(spec_nat['frequency'], spec_nat['variance_density'], 'b', label='natural')
+    plt.plot(spec_mon['frequency'], spec_mon['variance_density'], 'orange', label='monotone')
+    plt.plot(spec_tar['frequency'], spec_tar['variance_density'], 'k', label='target')
 
     time_string = spectral_dates.strftime('%b-%d, %HH')
     plt.title(time_string, fontsize='10')
@@ -95,11 +85,19 @@ def plot_spec(spectral_dates: datetime, spectrum, lim=(0., 0.3)):
     plt.grid(which='minor', linestyle='-', linewidth=0.5)
 
 
-# --- Main script ---
-if __name__ == '__main__':
-
+def render(output_directory='./figures', data=None):
+    """
+    Render figure 4 and save it to the output directory.
+    :param output_directory: directory the figure is saved to
+    :param data: (optional) spectra, peak periods and significant wave heights as returned by observed_data.get_data
+        (e.g. attached to shared memory, see shared_data); loaded if not given.
+    :return: path of the figure
+    """
     # Get the data
-    spectrum, peak_period, significant_wave_height = observed_data.get_data()
+    if data is None:
+        data = observed_data.get_data()
+    spectrum, peak_period, significant_wave_height = data
+    spectrum = spectrum_store.SpectrumStore(spectrum)
 
     # Set the time range
     start_date = datetime(2022, 9, 24)
@@ -145,7 +143,14 @@ if __name__ == '__main__':
     plt.legend(fontsize=8)
     plt.tight_layout()
 
-    # Save the figure, and show it.
-    os.makedirs('./figures', exist_ok=True)
-    figure.savefig('./figures/figure04.png')
+    # Save the figure.
+    os.makedirs(output_directory, exist_ok=True)
+    path = os.path.join(output_directory, 'figure04.png')
+    figure.savefig(path)
+    return path
+
+
+# --- Main script ---
+if __name__ == '__main__':
+    render()
     plt.show()
@@ -0,0 +1,132 @@
+"""
+Contents: Bulk parameters (discrete, monotone and natural peak periods and significant wave height) for a fleet of
+buoys, with one spectrum netCDF file (in the layout of spectrum_reference.nc) per station, e.g.:
+
+    fleet_bulk, failures = process_fleet('./data/fleet/*.nc')
+
+Stations are processed in parallel on a process pool. Every station is read and processed in blocks of chunk_size time
+steps, so that the memory used by a worker does not depend on the length of the record. A station that cannot be
+processed (unreadable file, unexpected layout, crashing worker, ...) is reported and left out of the result; it does
+not affect the other stations.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from xarray import Dataset
+import xarray
+import glob
+import os
+import pandas
+import bulk
+import observed_data
+
+
+def station_files(source) -> dict:
+    """
+    Find the spectrum files of all stations.
+    :param source: directory with one netCDF file per station, or a glob pattern (e.g. './data/fleet/*.nc')
+    :return: dictionary with the path of the file of each station, keyed on the station name (the file name without
+        extension).
+    """
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '*.nc'))
+    else:
+        paths = glob.glob(source)
+
+    return {os.path.splitext(os.path.basename(path))[0]: path for path in sorted(paths)}
+
+
+def station_bulk_parameters(path, chunk_size=48, solver='roguewavespectrum') -> Dataset:
+    """
+    Calculate the bulk parameters of a single station, one block of chunk_size time steps at a time.
+    :param path: path to the spectrum file of the station
+    :param chunk_size: number of time steps in a block
+    :param solver: solver of the monotone spline (see bulk.bulk_parameters)
+    :return: bulk parameters as function of time
+    """
+    blocks = [bulk.bulk_parameters(spec, solver=solver) for spec in observed_data.iterate_file(path, chunk_size)]
+
+    if not blocks:
+        raise ValueError(f'no spectra in {path}')
+    return xarray.concat(blocks, dim='time')
+
+
+def process_fleet(source, max_workers=None, chunk_size=48, progress=print, solver='roguewavespectrum'):
+    """
+    Calculate the bulk parameters for all stations.
+    :param source: directory or glob pattern of the station files (see station_files)
+    :param max_workers: number of worker processes. If 1 the stations are processed in the current process, if None
+        the number of processors on the machine is used.
+    :param chunk_size: number of time steps that are processed at once by a worker.
+    :param progress: function that is called with a progress message after every station (None to disable).
+    :param solver: solver of the monotone spline, 'roguewavespectrum' or 'banded' (see bulk.bulk_parameters)
+    :return: dataset with the bulk parameters of all stations that succeeded, with dimensions (station, time), and a
+        dictionary with the error message of each station that failed.
+    """
+    paths = station_files(source)
+    results = {}
+    failures = {}
+
+    def _report(station, result=None, error=None):
+        if error is None:
+            results[station] = result
+        else:
+            failures[station] = f'{type(error).__name__}: {error}'
+
+        if progress is not None:
+            status = 'done' if error is None else f'failed ({failures[station]})'
+            progress(f'[{len(results) + len(failures)}/{len(paths)}] {station}: {status}')
+
+    if max_workers == 1:
+        for station, path in paths.items():
+            try:
+                result = station_bulk_parameters(path, chunk_size, solver)
+            except Exception as error:
+                _report(station, error=error)
+            else:
+                _report(station, result)
+    else:
+        # Stations whose worker died (e.g. out of memory) take the whole pool down with them; we cannot tell which
+        # station was responsible, so those are retried one at a time in a pool of their own.
+        lost = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(station_bulk_parameters, path, chunk_size, solver): station
+                       for station, path in paths.items()}
+            for future in as_completed(futures):
+                station = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    lost.append(station)
+                except Exception as error:
+                    _report(station, error=error)
+                else:
+                    _report(station, result)
+
+        for station in lost:
+            try:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(station_bulk_parameters, paths[station], chunk_size, solver).result()
+            except Exception as error:
+                _report(station, error=error)
+            else:
+                _report(station, result)
+
+    stations = sorted(results)
+    if not stations:
+        return Dataset(), failures
+
+    fleet_bulk = xarray.concat([results[station] for station in stations],
+                               dim=pandas.Index(stations, name='station'), join='outer')
+    return fleet_bulk, failures
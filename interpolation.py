@@ -0,0 +1,460 @@
+"""
+Contents: Interpolation plans for the spline interpolation of the cumulative distribution function (cdf) from a fixed
+coarse frequency grid to a fixed fine frequency grid. Everything that only depends on the two grids is calculated once
+when the plan is created:
+
+- The natural (not-a-knot) spline interpolation of the cdf is linear in the spectral values, so the spline
+  coefficients are a linear function of the spectrum. We store this as a (nf x 3 nf) matrix, so that the coefficients
+  of a whole batch of spectra (and of the directional moments) follow from a single matrix product.
+- For the monotone spline the coefficients depend non-linearly on the data and are solved for per spectrum, with the
+  quadratic program of roguewavespectrum or (solver='banded') with the banded solver/compiled kernel of
+  monotone_spline for the whole batch at once.
+- For both the density (derivative of the cdf) is a quadratic on each bin, which we evaluate directly from the
+  coefficients with the compiled piecewise polynomial evaluator of scipy.
+
+Results are equal (up to round-off) to FrequencySpectrum.interpolate_frequency(..., method='spline') with the default
+solver.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from scipy.interpolate import CubicSpline, PPoly
+from typing import TYPE_CHECKING
+import numpy as np
+import monotone_spline
+import profiling
+import spline_peak
+import sweep
+
+# roguewavespectrum and xarray are imported where spectrum objects are used: importing roguewavespectrum takes seconds,
+# and InterpolationPlan is also used on plain arrays by short-lived processes (see estimate_peak_period.py).
+if TYPE_CHECKING:
+    from roguewavespectrum import FrequencySpectrum
+    from xarray import DataArray
+
+
+class InterpolationPlan:
+    """
+    Precomputed spline interpolation of the cdf from the given frequencies to the given interpolation frequencies.
+    """
+
+    def __init__(self, frequency, interpolation_frequency):
+        self.frequency = np.asarray(frequency, dtype='float64')
+        self.interpolation_frequency = np.asarray(interpolation_frequency, dtype='float64')
+
+        self.binwidth = sweep.frequency_binwidth(self.frequency)
+        self.knots = sweep.integration_frequencies(self.frequency)
+
+        # The spline coefficients [a, b, c] of the cdf of the i'th unit spectrum give the i'th row of the operator.
+        number_of_frequencies = len(self.frequency)
+        unit_cdf = np.concatenate((np.zeros((number_of_frequencies, 1)),
+                                   np.cumsum(np.diag(self.binwidth), axis=-1)), axis=-1)
+        coefficients = CubicSpline(self.knots, unit_cdf, axis=-1).c[:3, ...]
+        self.natural_operator = np.reshape(np.transpose(coefficients, (2, 0, 1)), (number_of_frequencies, -1))
+
+        # Interpolation frequencies outside of the range of the spline. The monotone spline does not extrapolate.
+        self.inside = (self.interpolation_frequency >= self.knots[0]) & (self.interpolation_frequency <= self.knots[-1])
+
+        # Segment of the spline each interpolation frequency is evaluated with (the first/last segment outside of the
+        # range of the spline, as in PPoly), and the interpolation frequencies per segment (see peak_frequency).
+        self.segment = np.clip(np.searchsorted(self.knots, self.interpolation_frequency, side='right') - 1, 0,
+                               number_of_frequencies - 1)
+        self._segment_points = {}
+        self._monotone_solver = None
+
+    @property
+    def monotone_solver(self) -> monotone_spline.MonotoneSplineSolver:
+        """
+        Banded solver of the monotone spline on the knots of the plan (created on first use).
+        """
+        if self._monotone_solver is None:
+            self._monotone_solver = monotone_spline.MonotoneSplineSolver(self.knots)
+        return self._monotone_solver
+
+    def cdf(self, variance_density):
+        """
+        Cumulative distribution at the bin edges.
+        :param variance_density: shape (..., nf)
+        :return: shape (..., nf+1)
+        """
+        cumsum = np.cumsum(variance_density * self.binwidth, axis=-1)
+        return np.concatenate((np.zeros(cumsum.shape[:-1] + (1,)), cumsum), axis=-1)
+
+    def natural_coefficients(self, variance_density, dtype='float64'):
+        """
+        Coefficients [a, b, c] of the natural cdf spline.
+        :param variance_density: shape (..., nf)
+        :param dtype: floating point type used in the calculation (float64 or float32)
+        :return: shape (..., 3, nf)
+        """
+        variance_density = np.asarray(variance_density, dtype=dtype)
+        coefficients = variance_density @ self.natural_operator.astype(dtype, copy=False)
+        return np.reshape(coefficients, variance_density.shape[:-1] + (3, len(self.frequency)))
+
+    def natural(self, variance_density):
+        """
+        Natural spline interpolation of a batch of spectra.
+        :param variance_density: shape (..., nf)
+        :return: shape (..., nfi)
+        """
+        return self.evaluate(self.natural_coefficients(variance_density), extrapolate=True)
+
+    def monotone_coefficients(self, variance_density, dtype='float64', solver='roguewavespectrum'):
+        """
+        Coefficients [a, b, c] of the monotone cdf spline.
+        :param variance_density: shape (..., nf)
+        :param dtype: floating point type of the returned coefficients. The constrained least squares problem is
+            always solved in double precision.
+        :param solver: 'roguewavespectrum' (quadratic program per spectrum) or 'banded' (MonotoneSplineSolver.fit, for
+            the whole batch at once); see monotone_spline.SOLVERS.
+        :return: shape (..., 3, nf)
+        """
+        monotone_spline.check_solver(solver)
+        variance_density = np.asarray(variance_density)
+        shape = variance_density.shape[:-1]
+
+        if solver == 'banded':
+            coefficients, _ = self.monotone_solver.fit(np.reshape(variance_density, (-1, len(self.frequency))),
+                                                       self.binwidth)
+        else:
+            from roguewavespectrum.spectrum.spline_interpolation import monotone_cubic_spline_coeficients
+
+            cdf = np.reshape(self.cdf(variance_density), (-1, len(self.knots)))
+            coefficients = monotone_cubic_spline_coeficients(self.knots, cdf)[:, :3, :]
+        return np.reshape(coefficients, shape + (3, len(self.frequency))).astype(dtype, copy=False)
+
+    def coefficients(self, variance_density, monotone_interpolation=True, dtype='float64',
+                     solver='roguewavespectrum'):
+        """
+        Coefficients [a, b, c] of the monotone or natural cdf spline.
+        :param variance_density: shape (..., nf)
+        :param monotone_interpolation: use a monotone (True) or natural (False) spline.
+        :param dtype: floating point type (float64 or float32)
+        :param solver: solver of the monotone spline (see monotone_coefficients)
+        :return: shape (..., 3, nf)
+        """
+        if monotone_interpolation:
+            return self.monotone_coefficients(variance_density, dtype, solver)
+        else:
+            return self.natural_coefficients(variance_density, dtype)
+
+    def evaluate(self, coefficients, extrapolate=False):
+        """
+        Evaluate the density (derivative of the cdf spline) at the interpolation frequencies.
+        :param coefficients: cdf spline coefficients, shape (..., 3 or 4, nf)
+        :param extrapolate: extrapolate outside of the range of the spline (as the natural spline does), otherwise
+            the density is zero there (as for the monotone spline).
+        :return: shape (..., nfi), of the same floating point type as the coefficients.
+        """
+        dtype = coefficients.dtype
+        shape = coefficients.shape[:-2]
+        number_of_frequencies = coefficients.shape[-1]
+
+        # density = 3 a t**2 + 2 b t + c; as a piecewise polynomial with coefficients of shape (3, nf, m)
+        coefficients = np.reshape(coefficients[..., :3, :], (-1, 3, number_of_frequencies))
+        density_coefficients = np.transpose(coefficients * np.array([[3.0], [2.0], [1.0]]), (1, 2, 0))
+        density = PPoly.construct_fast(np.ascontiguousarray(density_coefficients, dtype='float64'), self.knots,
+                                       extrapolate=extrapolate)
+
+        values = np.reshape(density(self.interpolation_frequency).T, shape + (len(self.interpolation_frequency),))
+        if not extrapolate:
+            values = np.where(self.inside, values, 0.0)
+        return values.astype(dtype, copy=False)
+
+    def _points_per_segment(self, extrapolate):
+        """
+        Interpolation frequencies (that are not zero by definition) of each segment of the spline.
+        :return: index of the first interpolation frequency of each segment, number of interpolation frequencies of
+            each segment, and the offset of the first and last of them to the start of the segment.
+        """
+        if extrapolate not in self._segment_points:
+            points = np.arange(len(self.interpolation_frequency)) if extrapolate else np.flatnonzero(self.inside)
+            segments = np.arange(len(self.frequency))
+            first = np.searchsorted(self.segment[points], segments, side='left')
+            last = np.searchsorted(self.segment[points], segments, side='right') - 1
+            count = last - first + 1
+
+            index = points[np.clip(first, 0, len(points) - 1)]
+            offset_first = self.interpolation_frequency[index] - self.knots[:-1]
+            offset_last = self.interpolation_frequency[points[np.clip(last, 0, len(points) - 1)]] - self.knots[:-1]
+            self._segment_points[extrapolate] = (index, count, offset_first, offset_last)
+        return self._segment_points[extrapolate]
+
+    def peak_frequency(self, coefficients, extrapolate=False, number_of_candidates=3):
+        """
+        Interpolation frequency at which the density is largest, i.e.
+
+            interpolation_frequency[ argmax( evaluate(coefficients, extrapolate), axis=-1 ) ]
+
+        but without evaluating the density at all interpolation frequencies. For every segment of the spline an upper
+        bound of the density at its interpolation frequencies follows from the coefficients (the quadratic is largest
+        at either end or at its stationary point). Only the number_of_candidates segments with the largest bounds (to
+        also find the peak of bimodal spectra, e.g. swell and wind sea) are evaluated at the interpolation
+        frequencies. The result is exact: should the bound of a segment that was not evaluated exceed the maximum that
+        was found, the density of that spectrum is evaluated at all interpolation frequencies instead. Requires
+        increasing interpolation frequencies.
+
+        For a refinement factor R and nf coarse frequencies, about number_of_candidates * R instead of nf * R points
+        are evaluated per spectrum.
+        :param coefficients: cdf spline coefficients, shape (..., 3 or 4, nf)
+        :param extrapolate: extrapolate outside of the range of the spline (see evaluate)
+        :param number_of_candidates: number of segments that are evaluated
+        :return: peak frequencies, shape (...)
+        """
+        shape = coefficients.shape[:-2]
+        number_of_segments = coefficients.shape[-1]
+        dtype = coefficients.dtype
+        coefficients = np.reshape(coefficients[..., :3, :], (-1, 3, number_of_segments)).astype('float64')
+        number_of_spectra = coefficients.shape[0]
+
+        # density = 3 a t**2 + 2 b t + c
+        quadratic, linear, constant = 3 * coefficients[:, 0, :], 2 * coefficients[:, 1, :], coefficients[:, 2, :]
+        first, count, offset_first, offset_last = self._points_per_segment(extrapolate)
+
+        # Upper bound of the density at the interpolation frequencies of each segment.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = -linear / (2 * quadratic)
+            has_maximum = (quadratic < 0) & (offset > offset_first) & (offset < offset_last)
+            bound = np.maximum(constant + linear * offset_first + quadratic * offset_first ** 2,
+                               constant + linear * offset_last + quadratic * offset_last ** 2)
+            bound = np.where(has_maximum, constant - linear ** 2 / (4 * quadratic), bound)
+        bound = np.where(count > 0, bound, -np.inf)
+
+        # Evaluate the candidate segments, in order of increasing frequency so that ties resolve as in argmax.
+        number_of_candidates = min(number_of_candidates, number_of_segments)
+        candidates = np.sort(np.argpartition(-bound, number_of_candidates - 1, axis=-1)[:, :number_of_candidates],
+                             axis=-1)
+        window = np.arange(np.max(count))
+        points = first[candidates][..., None] + window
+        valid = window < count[candidates][..., None]
+        points = np.reshape(np.where(valid, points, 0), (number_of_spectra, -1))
+
+        spectra = np.arange(number_of_spectra)[:, None]
+        segments = self.segment[points]
+        t = self.interpolation_frequency[points] - self.knots[segments]
+        # Same order of operations as PPoly, so that the values (and ties) are identical to those of evaluate.
+        values = constant[spectra, segments] + linear[spectra, segments] * t + quadratic[spectra, segments] * (t * t)
+        values = np.where(np.reshape(valid, (number_of_spectra, -1)), values.astype(dtype), -np.inf)
+
+        index = np.argmax(values, axis=-1)
+        maximum = values[spectra[:, 0], index]
+        peak_frequency = self.interpolation_frequency[points[spectra[:, 0], index]]
+
+        # Spectra for which the candidates are not conclusive: a segment that was not evaluated may contain a larger
+        # value, or the largest value is not positive (values outside the spline, which are zero, may come first).
+        evaluated = np.zeros(bound.shape, dtype='bool')
+        evaluated[spectra, candidates] = True
+        inconclusive = np.any(~evaluated & (bound >= maximum[:, None] - 1e-12 * np.abs(maximum[:, None])), axis=-1)
+        inconclusive |= ~(maximum > 0)
+        if np.any(inconclusive):
+            density = self.evaluate(coefficients[inconclusive].astype(dtype), extrapolate)
+            peak_frequency[inconclusive] = self.interpolation_frequency[np.argmax(density, axis=-1)]
+
+        return np.reshape(peak_frequency, shape)
+
+    def monotone(self, variance_density, solver='roguewavespectrum'):
+        """
+        Monotone spline interpolation of a batch of spectra.
+        :param variance_density: shape (..., nf)
+        :param solver: solver of the monotone spline (see monotone_coefficients)
+        :return: shape (..., nfi)
+        """
+        return self.evaluate(self.monotone_coefficients(variance_density, solver=solver))
+
+    @profiling.timed('interpolate_frequency')
+    def interpolate(self, spectrum: 'FrequencySpectrum', monotone_interpolation=True, dtype='float64',
+                    coefficients=None, solver='roguewavespectrum') -> 'FrequencySpectrum':
+        """
+        Equivalent of spectrum.interpolate_frequency(interpolation_frequency, method='spline',
+        monotone_interpolation=monotone_interpolation) for spectra with frequency as the last dimension.
+        :param spectrum: spectrum on the plan frequencies
+        :param monotone_interpolation: use a monotone (True) or natural (False) spline for the variance density.
+        :param dtype: floating point type of the calculation and of the returned spectrum (float64 or float32)
+        :param coefficients: precomputed spline coefficients of the variance density (optional, see coefficients)
+        :param solver: solver of the monotone spline (see monotone_coefficients)
+        :return: interpolated spectrum
+        """
+        from roguewavespectrum import FrequencySpectrum
+        from roguewavespectrum.spectrum.variable_names import SPECTRAL_VARS, SPECTRAL_MOMENTS, NAME_E, NAME_F
+        from xarray import Dataset, DataArray
+
+        dataset = spectrum.dataset.fillna(0.0)
+        if dataset[NAME_E].dims[-1] != NAME_F:
+            raise ValueError('frequency must be the last dimension of the spectrum')
+
+        variance_density = dataset[NAME_E].values
+        if coefficients is None:
+            coefficients = self.coefficients(variance_density, monotone_interpolation, dtype, solver)
+        interpolated_energy = self.evaluate(coefficients, extrapolate=not monotone_interpolation)
+
+        dims = dataset[NAME_E].dims
+        coords = {str(name): dataset[str(name)] for name in dataset[NAME_E].coords}
+        coords[NAME_F] = self.interpolation_frequency
+
+        interpolated = Dataset()
+        for name in dataset:
+            if str(name) not in SPECTRAL_VARS:
+                interpolated = interpolated.assign({str(name): dataset[name]})
+
+        interpolated = interpolated.assign({NAME_E: DataArray(data=interpolated_energy, coords=coords, dims=dims)})
+
+        # Directional moments are interpolated as densities (moment times variance density) with the natural spline.
+        mask = interpolated_energy > 0
+        for name in SPECTRAL_MOMENTS:
+            interpolated_density = self.evaluate(
+                self.natural_coefficients(dataset[name].values * variance_density, dtype), extrapolate=True)
+            interpolated_density[mask] = interpolated_density[mask] / interpolated_energy[mask]
+            interpolated = interpolated.assign({name: DataArray(data=interpolated_density, coords=coords, dims=dims)})
+
+        return FrequencySpectrum(interpolated)
+
+
+class CompactSpectrum:
+    """
+    Compact representation of a spline interpolated spectrum. Instead of the variance density (and directional moments)
+    on the fine frequency grid, only the spline coefficients of the variance density on the coarse grid are stored
+    (optionally in single precision); values on the fine grid are calculated on demand from the coefficients and the
+    coarse spectrum it was derived from. For a fine grid that is R times finer than the coarse grid this reduces
+    storage by a factor 5R / 3 (10R / 3 in single precision).
+
+    Single precision: the coefficients are rounded to float32 (relative error 6e-8). The continuous peak period
+    derived from the coefficients then has an absolute error of the order
+
+        |dT| <= T**2 * |df| ,   |df| ~ eps * df_bin * |c / b|
+
+    with df_bin the coarse bin width. For the reference data (df_bin ~ 0.01 Hz) the maximum observed difference with the
+    double precision peak period is below 1e-5 s. Note that for spectra with two (near) equal maxima the rounding may
+    select the other maximum; this can give arbitrarily large differences in peak period.
+    """
+
+    def __init__(self, spectrum: 'FrequencySpectrum', plan: InterpolationPlan, coefficients,
+                 monotone_interpolation=True):
+        """
+        :param spectrum: (coarse) spectrum the interpolated spectrum is derived from
+        :param plan: interpolation plan from the coarse to the fine frequencies
+        :param coefficients: spline coefficients of the variance density, shape (..., 3, nf)
+        :param monotone_interpolation: whether the coefficients belong to a monotone (True) or natural (False) spline.
+        """
+        self.spectrum = spectrum
+        self.plan = plan
+        self.coefficients = coefficients
+        self.monotone_interpolation = monotone_interpolation
+
+    @classmethod
+    def from_spectrum(cls, spectrum: 'FrequencySpectrum', interpolation_frequency, monotone_interpolation=True,
+                      dtype='float64', solver='roguewavespectrum') -> 'CompactSpectrum':
+        """
+        Create the compact interpolated spectrum.
+        :param spectrum: (coarse) spectrum
+        :param interpolation_frequency: fine frequencies
+        :param monotone_interpolation: use a monotone (True) or natural (False) spline.
+        :param dtype: floating point type of the coefficients (float64 or float32)
+        :param solver: solver of the monotone spline (see InterpolationPlan.monotone_coefficients)
+        :return: compact spectrum
+        """
+        plan = get_plan(spectrum.frequency, interpolation_frequency)
+        variance_density = spectrum.dataset['variance_density'].fillna(0.0).values
+        coefficients = plan.coefficients(variance_density, monotone_interpolation, dtype, solver)
+        return cls(spectrum, plan, coefficients, monotone_interpolation)
+
+    @property
+    def frequency(self) -> 'DataArray':
+        from xarray import DataArray
+        return DataArray(self.plan.interpolation_frequency, dims='frequency',
+                         coords={'frequency': self.plan.interpolation_frequency})
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Number of bytes needed to store the spline coefficients.
+        """
+        return self.coefficients.nbytes
+
+    def to_spectrum(self) -> 'FrequencySpectrum':
+        """
+        Evaluate the interpolated spectrum on the fine frequency grid.
+        :return: spectrum
+        """
+        return self.plan.interpolate(self.spectrum, self.monotone_interpolation, self.coefficients.dtype,
+                                     coefficients=self.coefficients)
+
+    def isel(self, **kwargs) -> 'FrequencySpectrum':
+        """
+        Select spectra by index along the space/time dimensions (see xarray isel) and evaluate them on the fine grid.
+        """
+        from xarray import DataArray
+        variance_density = self.spectrum.dataset['variance_density']
+        indexer = DataArray(np.arange(variance_density.shape[0]), dims=variance_density.dims[0]).isel(**kwargs).values
+        return self.plan.interpolate(self.spectrum.isel(**kwargs), self.monotone_interpolation,
+                                     self.coefficients.dtype, coefficients=self.coefficients[indexer, ...])
+
+    def sel(self, method='nearest', **kwargs) -> 'FrequencySpectrum':
+        """
+        Select spectra by label along the space/time dimensions (see xarray sel) and evaluate them on the fine grid.
+        """
+        from xarray import DataArray
+        dim = self.spectrum.dataset['variance_density'].dims[0]
+        indexer = DataArray(np.arange(self.spectrum.dataset['variance_density'].shape[0]), dims=dim,
+                            coords={dim: self.spectrum.dataset[dim].values}).sel(method=method, **kwargs)
+        return self.isel(**{dim: indexer.values})
+
+    def peak_period(self, mode='continuous') -> 'DataArray':
+        """
+        Peak period, calculated directly from the coefficients.
+        :param mode: 'continuous' for the peak of the continuous spline (see spline_peak), or 'grid' for the peak on the
+            fine grid, i.e. to_spectrum().peak_period(), found with the adaptive search of
+            InterpolationPlan.peak_frequency without evaluating the spectrum on the whole grid.
+        :return: peak period
+        """
+        from xarray import DataArray
+        if mode == 'continuous':
+            coefficients = np.moveaxis(self.coefficients, (-2, -1), (0, 1))
+            data = 1 / spline_peak.peak_frequency_from_coefficients(self.plan.knots, coefficients)
+        elif mode == 'grid':
+            with profiling.stage('peak_period'):
+                data = 1 / self.plan.peak_frequency(self.coefficients, extrapolate=not self.monotone_interpolation)
+        else:
+            raise ValueError(f'unknown peak period mode {mode}, expected continuous or grid')
+        return DataArray(data=data, coords=self.spectrum.coords_space_time, dims=self.spectrum.dims_space_time,
+                         name='peak period')
+
+    @property
+    def significant_waveheight(self) -> 'DataArray':
+        """
+        Significant wave height of the interpolated spectrum (on the fine grid).
+        :return: significant wave height
+        """
+        from xarray import DataArray
+        with profiling.stage('significant_waveheight'):
+            variance_density = self.plan.evaluate(self.coefficients, extrapolate=not self.monotone_interpolation)
+            m0 = np.trapz(variance_density, self.plan.interpolation_frequency, axis=-1)
+        return DataArray(data=4 * np.sqrt(m0), coords=self.spectrum.coords_space_time,
+                         dims=self.spectrum.dims_space_time)
+
+
+# Plans for the grid pairs used most recently.
+_plans = sweep.LRUCache(maxsize=16)
+
+
+def get_plan(frequency, interpolation_frequency) -> InterpolationPlan:
+    """
+    Get the (cached) interpolation plan for the given pair of frequency grids.
+    :param frequency: coarse frequencies
+    :param interpolation_frequency: fine frequencies
+    :return: interpolation plan
+    """
+    # Frequencies may be given as DataArray
+    frequency = np.asarray(frequency)
+    interpolation_frequency = np.asarray(interpolation_frequency)
+
+    key = (sweep.grid_key(frequency), sweep.grid_key(interpolation_frequency))
+    return _plans.get(key, lambda: InterpolationPlan(frequency, interpolation_frequency))
@@ -0,0 +1,197 @@
+"""
+Contents: Load test of the observed data pipeline on synthetic archives (see synthetic.py) of increasing size, e.g.:
+
+    python load_test.py --stations 1 4 --years 0.25 1 4
+    python load_test.py --stations 2 --years 1 --interpolate --plot ./benchmarks/load_test.png
+
+For every combination of the number of stations and the length of the records the archive is generated (or reused),
+and the pipeline is run over all its spectra in a fresh process: the files are read in blocks of chunk_size time steps
+(observed_data.iterate_file), and for every block the discrete peak period, the monotone and natural spline peak
+periods and the significant wave height are calculated (bulk.bulk_parameters) and optionally the spectra are
+interpolated to a fine frequency grid (as observed_data.get_spectrum does). We report the throughput (spectra per
+second), percentiles of the latency of a block (from reading it to its last result) and the peak resident memory of
+the process, as function of the size of the data. Since the data is processed block by block, the memory should not
+grow with the size of the archive.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import itertools
+import json
+import os
+import time
+
+# Directory the synthetic archives are generated in (one subdirectory per record length).
+ARCHIVE_DIRECTORY = './data/synthetic'
+
+# Latency percentiles that are reported.
+PERCENTILES = [50, 90, 99]
+
+
+def archive_paths(stations, years, directory=ARCHIVE_DIRECTORY, max_workers=None) -> list:
+    """
+    Generate (or reuse) the archive of the given size.
+    :return: paths of the station files
+    """
+    import synthetic
+    return synthetic.generate_archive(os.path.join(directory, f'years_{years:g}'), stations=stations, years=years,
+                                      max_workers=max_workers)
+
+
+def run_case(paths, chunk_size=48, interpolate=False, refinement=10):
+    """
+    Run the pipeline over all spectra of the given files. Intended to be called in a fresh process.
+    :return: number of spectra, wall clock time (s), latency of every block (s), peak resident memory (bytes)
+    """
+    import resource
+    import numpy as np
+    import bulk
+    import interpolation
+    import observed_data
+
+    number_of_spectra = 0
+    latencies = []
+    start = time.perf_counter()
+    for path in paths:
+        blocks = observed_data.iterate_file(path, chunk_size)
+        plan = None
+        while True:
+            block_start = time.perf_counter()
+            spectrum = next(blocks, None)
+            if spectrum is None:
+                break
+
+            spectrum.peak_period()
+            bulk.bulk_parameters(spectrum)
+            if interpolate:
+                if plan is None:
+                    frequency = spectrum.frequency.values
+                    fine = np.linspace(frequency[0], frequency[-1], (len(frequency) - 1) * refinement + 1)
+                    plan = interpolation.get_plan(frequency, fine)
+                plan.interpolate(spectrum).peak_period()
+
+            latencies.append(time.perf_counter() - block_start)
+            number_of_spectra += len(spectrum.time)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    return number_of_spectra, seconds, latencies, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(stations, years, chunk_size=48, interpolate=False, refinement=10, directory=ARCHIVE_DIRECTORY,
+        progress=print) -> list:
+    """
+    Run the load test for all combinations of the number of stations and record lengths, in order of data size.
+    :param stations: numbers of stations
+    :param years: record lengths in years
+    :param chunk_size: number of time steps per block
+    :param interpolate: also interpolate the spectra to a fine frequency grid
+    :param refinement: refinement factor of the fine frequency grid
+    :param directory: directory of the synthetic archives
+    :param progress: function that is called with every result (None to disable)
+    :return: list of results (dictionaries)
+    """
+    import numpy as np
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    sizes = sorted(itertools.product(stations, years), key=lambda size: size[0] * size[1])
+    for number_of_stations, record_years in sizes:
+        paths = archive_paths(number_of_stations, record_years, directory)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            number_of_spectra, seconds, latencies, peak_rss = executor.submit(
+                run_case, paths, chunk_size, interpolate, refinement).result()
+
+        result = {'stations': number_of_stations, 'years': record_years, 'spectra': number_of_spectra,
+                  'megabytes': sum(os.path.getsize(path) for path in paths) / 1024 ** 2, 'seconds': seconds,
+                  'spectra_per_second': number_of_spectra / seconds, 'peak_rss_mb': peak_rss / 1024 ** 2,
+                  'chunk_size': chunk_size, 'interpolate': interpolate}
+        for percentile, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+            result[f'latency_p{percentile}_ms'] = 1000 * value
+        results.append(result)
+        if progress is not None:
+            progress(format_result(result))
+    return results
+
+
+def header() -> str:
+    latency = ''.join(f'{f"p{percentile} (ms)":>11}' for percentile in PERCENTILES)
+    return (f'{"stations":>8}{"years":>7}{"spectra":>10}{"size (MB)":>11}{"time (s)":>10}{"spectra/s":>11}{latency}'
+            f'{"peak RSS (MB)":>15}')
+
+
+def format_result(result) -> str:
+    latency = ''.join(f'{result[f"latency_p{percentile}_ms"]:>11.2f}' for percentile in PERCENTILES)
+    return (f'{result["stations"]:>8}{result["years"]:>7g}{result["spectra"]:>10}{result["megabytes"]:>11.1f}'
+            f'{result["seconds"]:>10.2f}{result["spectra_per_second"]:>11.1f}{latency}{result["peak_rss_mb"]:>15.1f}')
+
+
+def plot(results, path):
+    """
+    Plot throughput, latency percentiles and peak memory as function of the number of spectra.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    spectra = [result['spectra'] for result in results]
+    figure = plt.figure(figsize=[10, 3.5], dpi=150)
+
+    plt.subplot(1, 3, 1)
+    plt.plot(spectra, [result['spectra_per_second'] for result in results], 'o-', color='k')
+    plt.ylabel('throughput [spectra/s]')
+
+    plt.subplot(1, 3, 2)
+    for percentile in PERCENTILES:
+        plt.plot(spectra, [result[f'latency_p{percentile}_ms'] for result in results], 'o-', label=f'p{percentile}')
+    plt.ylabel('block latency [ms]')
+    plt.legend(fontsize=8)
+
+    plt.subplot(1, 3, 3)
+    plt.plot(spectra, [result['peak_rss_mb'] for result in results], 'o-', color='k')
+    plt.ylabel('peak RSS [MB]')
+
+    for index in range(3):
+        plt.subplot(1, 3, index + 1)
+        plt.xscale('log')
+        plt.xlabel('number of spectra')
+        plt.grid('on')
+
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    figure.savefig(path)
+    plt.close(figure)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the observed data pipeline on synthetic archives.')
+    parser.add_argument('--stations', nargs='+', type=int, default=[1, 4], help='numbers of stations')
+    parser.add_argument('--years', nargs='+', type=float, default=[0.25, 1], help='record lengths in years')
+    parser.add_argument('--chunk-size', type=int, default=48, help='number of time steps per block')
+    parser.add_argument('--interpolate', action='store_true', help='also interpolate to a fine frequency grid')
+    parser.add_argument('--refinement', type=int, default=10, help='refinement factor of the fine frequency grid')
+    parser.add_argument('--directory', default=ARCHIVE_DIRECTORY, help='directory of the synthetic archives')
+    parser.add_argument('--output', default=None, help='json file to write the results to')
+    parser.add_argument('--plot', default=None, help='file to save the scaling curves to')
+    args = parser.parse_args()
+
+    print(header())
+    results = run(args.stations, args.years, args.chunk_size, args.interpolate, args.refinement, args.directory)
+
+    if args.output is not None:
+        with open(args.output, 'w') as file_handle:
+            json.dump(results, file_handle, indent=2)
+    if args.plot is not None:
+        plot(results, args.plot)
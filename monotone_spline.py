@@ -0,0 +1,536 @@
+"""
+Contents: Fast solver for the monotone cubic spline of the cumulative distribution function (cdf). The monotone spline
+of roguewavespectrum (Wolberg & Alfy, 1999) is found as the solution of a general quadratic program in the spline
+coefficients [a, b, c] of all bins, which is solved per spectrum with an interior point method (cvxopt).
+
+If we write the spline in Hermite form, i.e. in terms of the values and the slopes s of the cdf at the knots, the C0
+and C1 continuity constraints are satisfied by construction and the monotonicity constraints reduce to bounds on the
+slopes
+
+    0 <= s_i <= 3 * min(secant_(i-1), secant_i)      (s_i = 0 if one of the neighbouring secants is zero).
+
+What remains of the quadratic program is a bound constrained linear least squares problem for the slopes, where we
+minimize the jumps in the second derivative at the knots (scaled by the maximum curvature of the data as in
+roguewavespectrum) together with the not-a-knot conditions at either end. The normal matrix of this problem is
+pentadiagonal and apart from the curvature scale only depends on the knots; we precompute it once per grid and solve
+the problem with an active set method on banded matrices. This is typically two orders of magnitude faster than the
+general solver, and finds the minimum to round-off (the interior point solution differs from it by up to its
+tolerance, which corresponds to differences in peak period of O(1e-3) s).
+
+Spectra with negative values (for which the bounds are not as above) are passed on to the roguewavespectrum solver.
+
+If Numba is installed, MonotoneSplineSolver.fit runs a compiled kernel that, for a batch of spectra in parallel, fuses
+all steps from the variance density to the peak frequency in a single loop per spectrum (cdf, bounds, normal equations,
+active set iterations with an inline banded Cholesky solver, spline coefficients and the closed form peak of
+spline_peak), without temporary arrays per step or Python overhead per spectrum. Without Numba the same results are
+obtained with the NumPy implementation below.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from scipy.linalg.lapack import dpbsv
+import numpy as np
+import spline_peak
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Maximum number of active set iterations before we fall back on a general bounded least squares solver.
+MAXIMUM_ITERATIONS = 50
+
+# Solvers for the monotone spline that can be selected in interpolation, spline_peak, sweep and observed_data: the
+# quadratic program of roguewavespectrum (the default, as in the manuscript), or MonotoneSplineSolver.fit ('banded';
+# the compiled kernel if Numba is installed). Peak periods of the two differ by up to O(1e-3) s (see above).
+SOLVERS = ['roguewavespectrum', 'banded']
+
+
+def check_solver(solver):
+    if solver not in SOLVERS:
+        raise ValueError(f'unknown monotone spline solver {solver}, expected one of {SOLVERS}')
+
+
+class MonotoneSplineSolver:
+    """
+    Monotone cubic spline interpolation of the cdf on a fixed set of knots.
+    """
+
+    def __init__(self, knots):
+        """
+        :param knots: knots of the spline (integration frequencies), shape (nseg+1,)
+        """
+        self.knots = np.asarray(knots, dtype='float64')
+        width = np.diff(self.knots)
+        number_of_segments = len(width)
+        number_of_knots = number_of_segments + 1
+        self.width = width
+
+        # In Hermite form the coefficients on each bin are linear in the slopes s and the secants:
+        #     a = (s_i + s_(i+1) - 2 secant_i) / h**2,   b = (3 secant_i - 2 s_i - s_(i+1)) / h
+        index = np.arange(number_of_segments)
+        slope_to_a = np.zeros((number_of_segments, number_of_knots))
+        slope_to_a[index, index] = 1 / width ** 2
+        slope_to_a[index, index + 1] = 1 / width ** 2
+        slope_to_b = np.zeros((number_of_segments, number_of_knots))
+        slope_to_b[index, index] = -2 / width
+        slope_to_b[index, index + 1] = -1 / width
+        secant_to_a = np.diag(-2 / width ** 2)
+        secant_to_b = np.diag(3 / width)
+        self.slope_to_a, self.slope_to_b = slope_to_a, slope_to_b
+        self.secant_to_a, self.secant_to_b = secant_to_a, secant_to_b
+
+        # Jump in the second derivative at the interior knots: 6 a_i h_i + 2 b_i - 2 b_(i+1)
+        def jump(to_a, to_b):
+            return 6 * width[:-1, None] * to_a[:-1] + 2 * to_b[:-1] - 2 * to_b[1:]
+
+        # Not-a-knot conditions: a_0 - a_1 and a_(n-2) - a_(n-1)
+        def not_a_knot(to_a):
+            return np.stack((to_a[0] - to_a[1], to_a[-2] - to_a[-1]))
+
+        jump_matrix, jump_offset = jump(slope_to_a, slope_to_b), jump(secant_to_a, secant_to_b)
+        knot_matrix, knot_offset = not_a_knot(slope_to_a), not_a_knot(secant_to_a)
+        self.jump_matrix, self.jump_offset = jump_matrix, jump_offset
+        self.knot_matrix, self.knot_offset = knot_matrix, knot_offset
+
+        # Normal equations, multiplied by the square of the curvature scale k:
+        #     (J^T J + k**2 N^T N) s = -(J^T Jo + k**2 N^T No) secant
+        # N^T N only has entries in the 3x3 blocks at either end of the diagonal.
+        self.jump_normal = jump_matrix.T @ jump_matrix
+        self.knot_normal = knot_matrix.T @ knot_matrix
+        self.jump_bands = _banded(self.jump_normal)
+        self.knot_bands = _banded(self.knot_normal)
+        self.jump_rhs = -jump_matrix.T @ jump_offset
+        self.knot_rhs = -knot_matrix.T @ knot_offset
+        self.corners = (slice(0, 3), slice(number_of_knots - 3, number_of_knots))
+
+        # Factor in the maximum curvature of the cdf used by roguewavespectrum to scale the second derivative jumps.
+        self.curvature_factor = 2 / (width[:-1] + width[1:])
+
+        # Non-zero entries of the jump and not-a-knot rows (and of their offsets) for the compiled kernel: row r of the
+        # jump matrix acts on slopes r..r+2 and secants r..r+1, the not-a-knot rows on the first/last 3 slopes and 2
+        # secants.
+        rows = np.arange(number_of_segments - 1)
+        self.jump_entries = np.stack([jump_matrix[rows, rows + j] for j in range(3)], axis=-1)
+        self.jump_offset_entries = np.stack([jump_offset[rows, rows + j] for j in range(2)], axis=-1)
+        self.knot_entries = np.stack((knot_matrix[0, :3], knot_matrix[1, -3:]))
+        self.knot_offset_entries = np.stack((knot_offset[0, :2], knot_offset[1, -2:]))
+
+    def slopes(self, cdf):
+        """
+        Slopes of the monotone spline at the knots for a single cdf.
+        :param cdf: values of the cdf at the knots, shape (nseg+1,). Must be non-decreasing.
+        :return: slopes, shape (nseg+1,), or None if the problem cannot be solved by this method.
+        """
+        delta = np.diff(cdf)
+        secant = delta / self.width
+        if np.any(secant < 0):
+            return None
+
+        curvature = np.max(np.abs(np.diff(delta) * self.curvature_factor))
+        if curvature == 0:
+            # Linear cdf: the line itself is the (monotone) spline. roguewavespectrum cannot solve this case.
+            return np.full(len(cdf), secant[0])
+
+        normal = self.jump_normal.copy()
+        for corner in self.corners:
+            normal[corner, corner] += curvature ** 2 * self.knot_normal[corner, corner]
+        bands = self.jump_bands + curvature ** 2 * self.knot_bands
+        rhs = self.jump_rhs @ secant + curvature ** 2 * (self.knot_rhs @ secant)
+
+        # Bounds on the slopes; slopes next to a zero secant are fixed at zero.
+        upper = np.empty(len(cdf))
+        upper[:-1] = 3 * secant
+        upper[-1] = np.inf
+        upper[1:] = np.minimum(upper[1:], 3 * secant)
+        positive = secant > 0
+        fixed = np.zeros(len(cdf), dtype='bool')
+        fixed[:-1] |= ~positive
+        fixed[1:] |= ~positive
+        upper[fixed] = 0.0
+
+        slopes = _solve_bounded(normal, bands, rhs, upper, fixed)
+        if slopes is None:
+            from scipy.optimize import lsq_linear
+
+            free = ~fixed
+            matrix = np.concatenate((self.jump_matrix / curvature, self.knot_matrix))
+            offset = np.concatenate((self.jump_offset / curvature, self.knot_offset)) @ secant
+            slopes = np.zeros(len(cdf))
+            slopes[free] = lsq_linear(matrix[:, free], -offset, bounds=(0.0, upper[free]), method='bvls').x
+        return slopes
+
+    def coefficients(self, cdf):
+        """
+        Spline coefficients of the monotone spline. Drop in replacement for monotone_cubic_spline_coeficients of
+        roguewavespectrum.
+        :param cdf: values of the cdf at the knots, shape (m, nseg+1)
+        :return: spline coefficients [a, b, c, d], shape (m, 4, nseg)
+        """
+        cdf = np.asarray(cdf, dtype='float64')
+        output = np.zeros((cdf.shape[0], 4, len(self.width)))
+        for index in range(cdf.shape[0]):
+            if np.all(np.diff(cdf[index]) == 0):
+                # Zero solution (as in roguewavespectrum)
+                continue
+
+            slopes = self.slopes(cdf[index])
+            if slopes is None:
+                from roguewavespectrum.spectrum.spline_interpolation import monotone_cubic_spline_coeficients
+
+                output[index] = monotone_cubic_spline_coeficients(self.knots, cdf[index:index + 1])[0]
+                continue
+
+            secant = np.diff(cdf[index]) / self.width
+            output[index, 0] = self.slope_to_a @ slopes + self.secant_to_a @ secant
+            output[index, 1] = self.slope_to_b @ slopes + self.secant_to_b @ secant
+            output[index, 2] = slopes[:-1]
+            output[index, 3] = cdf[index, :-1]
+        return output
+
+
+    def fit(self, variance_density, binwidth, compiled=None):
+        """
+        Monotone spline coefficients and peak frequencies of a batch of spectra, from the variance densities.
+        :param variance_density: variance densities, shape (m, nseg). Must not contain NaN.
+        :param binwidth: widths of the frequency bins the cdf is integrated with, shape (nseg,)
+        :param compiled: use the compiled kernel (default: if Numba is installed)
+        :return: spline coefficients [a, b, c], shape (m, 3, nseg), and peak frequencies, shape (m,)
+        """
+        variance_density = np.ascontiguousarray(variance_density, dtype='float64')
+        binwidth = np.asarray(binwidth, dtype='float64')
+        if compiled is None:
+            compiled = COMPILED
+
+        if not compiled:
+            cumsum = np.cumsum(variance_density * binwidth, axis=-1)
+            cdf = np.concatenate((np.zeros((variance_density.shape[0], 1)), cumsum), axis=-1)
+            coefficients = self.coefficients(cdf)[:, :3, :]
+            peak_frequency = spline_peak.peak_frequency_from_coefficients(self.knots,
+                                                                          np.transpose(coefficients, (1, 2, 0)))
+            return coefficients, peak_frequency
+
+        kernel = _compiled_kernel if _compiled_kernel is not None else _fit_kernel
+        number_of_spectra = variance_density.shape[0]
+        coefficients = np.zeros((number_of_spectra, 3, len(self.width)))
+        peak_frequency = np.zeros(number_of_spectra)
+        status = np.zeros(number_of_spectra, dtype='int64')
+        kernel(variance_density, binwidth, self.knots, self.jump_bands, self.jump_entries, self.jump_offset_entries,
+               self.knot_entries, self.knot_offset_entries, self.curvature_factor, MAXIMUM_ITERATIONS, coefficients,
+               peak_frequency, status)
+
+        # Spectra the kernel cannot solve (negative values, no convergence) are solved with the NumPy implementation.
+        unsolved = status != 0
+        if np.any(unsolved):
+            coefficients[unsolved], peak_frequency[unsolved] = self.fit(variance_density[unsolved], binwidth,
+                                                                        compiled=False)
+        return coefficients, peak_frequency
+
+
+def _fit_kernel(variance_density, binwidth, knots, jump_bands, jump_entries, jump_offset_entries, knot_entries,
+                knot_offset_entries, curvature_factor, maximum_iterations, coefficients, peak_frequency, status):
+    """
+    Kernel of MonotoneSplineSolver.fit; compiled with Numba if available. Follows MonotoneSplineSolver.slopes,
+    _solve_bounded, MonotoneSplineSolver.coefficients and spline_peak.peak_frequency_from_coefficients step by step, for
+    one spectrum at a time. Results are written to coefficients (m, 3, nseg) and peak_frequency (m,); status is set to
+    1 for spectra that have to be solved otherwise.
+    """
+    number_of_spectra, number_of_segments = variance_density.shape
+    number_of_knots = number_of_segments + 1
+
+    for spectrum in _prange(number_of_spectra):
+        # cdf at the knots, and secants
+        cdf = np.zeros(number_of_knots)
+        for i in range(number_of_segments):
+            cdf[i + 1] = cdf[i] + variance_density[spectrum, i] * binwidth[i]
+        delta = np.empty(number_of_segments)
+        secant = np.empty(number_of_segments)
+        negative = False
+        all_zero = True
+        for i in range(number_of_segments):
+            delta[i] = cdf[i + 1] - cdf[i]
+            secant[i] = delta[i] / (knots[i + 1] - knots[i])
+            negative = negative or secant[i] < 0
+            all_zero = all_zero and delta[i] == 0
+        if all_zero:
+            # Zero solution; the peak is at the first knot (as for the NumPy implementation).
+            peak_frequency[spectrum] = knots[0]
+            continue
+        if negative:
+            status[spectrum] = 1
+            continue
+
+        curvature = 0.0
+        for i in range(number_of_segments - 1):
+            curvature = max(curvature, abs((delta[i + 1] - delta[i]) * curvature_factor[i]))
+
+        slopes = np.zeros(number_of_knots)
+        if curvature == 0:
+            for i in range(number_of_knots):
+                slopes[i] = secant[0]
+        else:
+            curvature_squared = curvature ** 2
+
+            # Normal matrix (upper bands) and right hand side.
+            bands = np.zeros((3, number_of_knots))
+            rhs = np.zeros(number_of_knots)
+            for i in range(number_of_knots):
+                for d in range(3):
+                    bands[d, i] = jump_bands[d, i]
+            for r in range(number_of_segments - 1):
+                offset = jump_offset_entries[r, 0] * secant[r] + jump_offset_entries[r, 1] * secant[r + 1]
+                for j in range(3):
+                    rhs[r + j] -= jump_entries[r, j] * offset
+            for q in range(2):
+                base = 0 if q == 0 else number_of_knots - 3
+                secant_base = 0 if q == 0 else number_of_segments - 2
+                offset = (knot_offset_entries[q, 0] * secant[secant_base] +
+                          knot_offset_entries[q, 1] * secant[secant_base + 1])
+                for j1 in range(3):
+                    rhs[base + j1] -= curvature_squared * knot_entries[q, j1] * offset
+                    for j2 in range(j1, 3):
+                        bands[j2 - j1, base + j1] += curvature_squared * knot_entries[q, j1] * knot_entries[q, j2]
+
+            # Bounds; slopes next to a zero secant are fixed at zero. state: 0 free, 1 lower, 2 upper, 3 fixed.
+            upper = np.empty(number_of_knots)
+            state = np.zeros(number_of_knots, dtype=np.int64)
+            for i in range(number_of_knots):
+                bound = np.inf
+                if i < number_of_segments:
+                    bound = min(bound, 3 * secant[i])
+                    if secant[i] <= 0:
+                        state[i] = 3
+                if i > 0:
+                    bound = min(bound, 3 * secant[i - 1])
+                    if secant[i - 1] <= 0:
+                        state[i] = 3
+                upper[i] = 0.0 if state[i] == 3 else bound
+
+            tolerance = 0.0
+            for i in range(number_of_knots):
+                tolerance = max(tolerance, abs(rhs[i]))
+            tolerance *= 1e-12
+
+            # Block principal pivoting (see _solve_bounded)
+            free_index = np.empty(number_of_knots, dtype=np.int64)
+            diagonal = np.empty(number_of_knots)
+            lower_1 = np.zeros(number_of_knots)
+            lower_2 = np.zeros(number_of_knots)
+            work = np.empty(number_of_knots)
+            gradient = np.empty(number_of_knots)
+            converged = False
+            for _ in range(maximum_iterations):
+                number_free = 0
+                for i in range(number_of_knots):
+                    slopes[i] = upper[i] if state[i] == 2 else 0.0
+                    if state[i] == 0:
+                        free_index[number_free] = i
+                        number_free += 1
+
+                # H @ slopes for the variables at a bound
+                _banded_product(bands, slopes, gradient)
+
+                # Cholesky factorization of the free block, and forward/backward substitution.
+                failed = False
+                for p in range(number_free):
+                    i = free_index[p]
+                    value = bands[0, i]
+                    if p >= 1:
+                        value -= lower_1[p - 1] ** 2
+                    if p >= 2:
+                        value -= lower_2[p - 2] ** 2
+                    if value <= 0:
+                        failed = True
+                        break
+                    diagonal[p] = np.sqrt(value)
+
+                    lower_1[p] = 0.0
+                    if p + 1 < number_free and free_index[p + 1] - i <= 2:
+                        lower_1[p] = bands[free_index[p + 1] - i, i]
+                    if p >= 1 and p + 1 < number_free:
+                        lower_1[p] -= lower_2[p - 1] * lower_1[p - 1]
+                    lower_1[p] /= diagonal[p]
+
+                    lower_2[p] = 0.0
+                    if p + 2 < number_free and free_index[p + 2] - i <= 2:
+                        lower_2[p] = bands[free_index[p + 2] - i, i] / diagonal[p]
+                if failed:
+                    break
+
+                for p in range(number_free):
+                    value = rhs[free_index[p]] - gradient[free_index[p]]
+                    if p >= 1:
+                        value -= lower_1[p - 1] * work[p - 1]
+                    if p >= 2:
+                        value -= lower_2[p - 2] * work[p - 2]
+                    work[p] = value / diagonal[p]
+                for p in range(number_free - 1, -1, -1):
+                    value = work[p]
+                    if p + 1 < number_free:
+                        value -= lower_1[p] * work[p + 1]
+                    if p + 2 < number_free:
+                        value -= lower_2[p] * work[p + 2]
+                    work[p] = value / diagonal[p]
+                    slopes[free_index[p]] = work[p]
+
+                # Exchange variables between the sets.
+                _banded_product(bands, slopes, gradient)
+                changed = False
+                for i in range(number_of_knots):
+                    gradient[i] -= rhs[i]
+                for i in range(number_of_knots):
+                    if state[i] == 0 and slopes[i] < 0:
+                        state[i] = -1
+                    elif state[i] == 0 and slopes[i] > upper[i]:
+                        state[i] = -2
+                    elif state[i] == 1 and gradient[i] < -tolerance:
+                        state[i] = -3
+                    elif state[i] == 2 and gradient[i] > tolerance:
+                        state[i] = -3
+                for i in range(number_of_knots):
+                    if state[i] < 0:
+                        changed = True
+                        state[i] = 1 if state[i] == -1 else (2 if state[i] == -2 else 0)
+                if not changed:
+                    converged = True
+                    break
+
+            if not converged:
+                status[spectrum] = 1
+                continue
+
+        # Coefficients and the peak of the density (see spline_peak.peak_frequency_from_coefficients)
+        best_value = -np.inf
+        best_location = knots[0]
+        for i in range(number_of_segments):
+            width = knots[i + 1] - knots[i]
+            a = (slopes[i] + slopes[i + 1] - 2 * secant[i]) / width ** 2
+            b = (3 * secant[i] - 2 * slopes[i] - slopes[i + 1]) / width
+            c = slopes[i]
+            coefficients[spectrum, 0, i] = a
+            coefficients[spectrum, 1, i] = b
+            coefficients[spectrum, 2, i] = c
+
+            # Candidates in order of increasing frequency (ties resolve to the lowest frequency): interior knot i, a
+            # maximum if the slope of the density changes sign from positive to negative, then the stationary point
+            # within segment i.
+            if i > 0:
+                previous_width = knots[i] - knots[i - 1]
+                slope_left = (6 * coefficients[spectrum, 0, i - 1] * previous_width
+                              + 2 * coefficients[spectrum, 1, i - 1])
+                slope_right = 2 * b
+                if slope_left >= 0 and slope_right <= 0 and not (slope_left == 0 and slope_right == 0):
+                    if c > best_value:
+                        best_value = c
+                        best_location = knots[i]
+
+            if a < 0:
+                offset = -b / (3 * a)
+                if 0 < offset < width:
+                    value = c - b ** 2 / (3 * a)
+                    if value > best_value:
+                        best_value = value
+                        best_location = knots[i] + offset
+
+        if best_value == -np.inf:
+            # No local maximum: largest value at the knots.
+            best_value = coefficients[spectrum, 2, 0]
+            best_location = knots[0]
+            for i in range(1, number_of_segments):
+                if coefficients[spectrum, 2, i] > best_value:
+                    best_value = coefficients[spectrum, 2, i]
+                    best_location = knots[i]
+            width = knots[-1] - knots[-2]
+            a, b, c = coefficients[spectrum, 0, -1], coefficients[spectrum, 1, -1], coefficients[spectrum, 2, -1]
+            if 3 * a * width ** 2 + 2 * b * width + c > best_value:
+                best_location = knots[-1]
+        peak_frequency[spectrum] = best_location
+
+
+def _banded_product(bands, vector, output):
+    """
+    output = H @ vector for a symmetric pentadiagonal matrix H in upper banded form (bands[d, i] = H[i, i + d]).
+    """
+    number = len(vector)
+    for i in range(number):
+        value = bands[0, i] * vector[i]
+        for d in range(1, 3):
+            if i + d < number:
+                value += bands[d, i] * vector[i + d]
+            if i - d >= 0:
+                value += bands[d, i - d] * vector[i - d]
+        output[i] = value
+
+
+if numba is not None:
+    _prange = numba.prange
+    _banded_product = numba.njit(cache=True)(_banded_product)
+    _compiled_kernel = numba.njit(cache=True, parallel=True)(_fit_kernel)
+else:
+    _prange = range
+    _compiled_kernel = None
+
+# Whether MonotoneSplineSolver.fit uses the compiled kernel by default.
+COMPILED = _compiled_kernel is not None
+
+
+def _banded(matrix):
+    """
+    Diagonals of a pentadiagonal symmetric matrix: bands[k, i] = matrix[i, i + k] (zero padded).
+    """
+    bands = np.zeros((4, matrix.shape[0]))
+    for offset in range(3):
+        bands[offset, :matrix.shape[0] - offset] = np.diagonal(matrix, offset)
+    return bands
+
+
+def _solve_bounded(normal, bands, rhs, upper, fixed):
+    """
+    Minimize s^T H s / 2 - rhs^T s subject to 0 <= s <= upper, for a positive definite pentadiagonal matrix H, with
+    block principal pivoting (Kim & Park, 2011): variables are exchanged between the free set and the sets of variables
+    at their lower/upper bounds until the solution on the free set is feasible and the gradient has the correct sign
+    for all variables at a bound.
+    :param normal: H, shape (n, n)
+    :param bands: H in banded form (see _banded), shape (4, n)
+    :return: solution, or None if the iteration did not converge.
+    """
+    at_lower = np.zeros(len(rhs), dtype='bool')
+    at_upper = np.zeros(len(rhs), dtype='bool')
+    tolerance = 1e-12 * np.max(np.abs(rhs))
+
+    for _ in range(MAXIMUM_ITERATIONS):
+        free = ~(fixed | at_lower | at_upper)
+        solution = np.where(at_upper, upper, 0.0)
+
+        free_index = np.flatnonzero(free)
+        if len(free_index) > 0:
+            # Upper banded storage of the free block of H. Variables that are more than two apart in the full problem
+            # do not interact; the last row of bands is zero.
+            banded = np.empty((3, len(free_index)))
+            banded[2] = bands[0, free_index]
+            for offset in (1, 2):
+                distance = np.minimum(free_index[offset:] - free_index[:-offset], 3)
+                banded[2 - offset, offset:] = bands[distance, free_index[:-offset]]
+            _, solution[free], info = dpbsv(banded, (rhs - normal @ solution)[free])
+            if info != 0:
+                return None
+
+        gradient = normal @ solution - rhs
+        below = free & (solution < 0)
+        above = free & (solution > upper)
+        release = (at_lower & (gradient < -tolerance)) | (at_upper & (gradient > tolerance))
+        if not (below.any() or above.any() or release.any()):
+            return solution
+
+        at_lower = (at_lower & ~release) | below
+        at_upper = (at_upper & ~release) | above
+    return None
@@ -13,138 +13,412 @@ Sofar Ocean Technologies
 
 Authors: Pieter Bart Smit
 """
-from roguewavespectrum import FrequencySpectrum
-from scipy.signal.windows import get_window
 import xarray
 import os
 import numpy
 from xarray import DataArray
-import pickle
+from typing import Iterator, TYPE_CHECKING
+import bulk
+import cache
+import interpolation
+import monotone_spline
+import profiling
+import spline_peak
 
-def get_data():
+# roguewavespectrum (which takes seconds to import) and displacement (scipy.signal) are imported where they are used,
+# so that scripts that only need the data (e.g. figure04) start quickly.
+if TYPE_CHECKING:
+    from roguewavespectrum import FrequencySpectrum
+
+REFERENCE_FILE = './data/spectrum_reference.nc'
+TARGET_FILE = './data/spectrum_target.nc'
+
+# Version of the blocks written by stream_bulk_parameters; blocks of other versions are recalculated.
+BULK_VERSION = 2
+
+# Source files of the calculations of the cached spectra and peak periods (see cache.cache_key).
+CACHE_CODE = [__file__, interpolation.__file__, monotone_spline.__file__, spline_peak.__file__]
+
+def get_data(chunk_size=None, compact=False, dtype='float64', solver='roguewavespectrum'):
+    """
+    Get the spectra, peak periods and significant wave heights of figure 4.
+
+    With the default solver the monotone peak period is that of the roguewavespectrum quadratic program (as in the
+    manuscript), calculated per kind. With solver='banded' the peak periods of the reference, monotone and natural
+    spectra and the significant wave height of the reference spectra are calculated in a single fused pass over the
+    reference spectra (see get_bulk_parameters), and are identical to those of get_bulk_parameters and
+    stream_bulk_parameters with solver='banded'.
+
+    :param chunk_size: if given, data is calculated in blocks of chunk_size time steps to limit memory use.
+    :param compact: return the derived spectra in compact form (see get_spectrum)
+    :param dtype: floating point type of derived spectra (see get_spectrum)
+    :param solver: solver of the monotone spline, 'roguewavespectrum' or 'banded' (see monotone_spline.SOLVERS)
+    :return: dictionaries with the spectrum, peak period and significant wave height of every kind
+    """
     kinds = ['reference','target','monotone','natural']
     spectra = {}
     tp = {}
     hm0 = {}
+
+    fused = None
+    if solver == 'banded':
+        fused = _fused_bulk_parameters(chunk_size, solver)
+
     for kind in kinds:
-        spectra[kind] = get_spectrum(kind)
-        tp[kind] = get_peak_period(kind)
-        hm0[kind] = spectra[kind].significant_waveheight
+        spectra[kind] = get_spectrum(kind, chunk_size, compact=compact, dtype=dtype, solver=solver)
+        if fused is not None and kind != 'target':
+            tp[kind] = fused[f'peak_period_{kind}'].rename('peak period')
+        else:
+            tp[kind] = get_peak_period(kind, chunk_size, solver=solver)
+
+        if fused is not None and kind == 'reference':
+            hm0[kind] = fused['significant_waveheight']
+        else:
+            with profiling.stage('significant_waveheight'):
+                hm0[kind] = spectra[kind].significant_waveheight
 
     return spectra, tp, hm0
 
-def get_spectrum(kind) -> FrequencySpectrum:
+def iterate_spectrum(kind, chunk_size, start=0) -> Iterator['FrequencySpectrum']:
+    """
+    Iterate over the spectra on disk in blocks of chunk_size time steps. The file is opened lazily, and only the block
+    that is currently yielded is read into memory.
+
+    :param kind: one of 'reference', 'target'
+    :param chunk_size: number of time steps in a block
+    :param start: time index of the first block
+    :return: iterator over spectra
+    """
+    if kind == 'reference':
+        name = REFERENCE_FILE
+    elif kind == 'target':
+        name = TARGET_FILE
+    else:
+        raise Exception(f'cannot iterate over kind {kind}')
+
+    yield from iterate_file(name, chunk_size, start)
+
+def iterate_file(path, chunk_size, start=0) -> Iterator['FrequencySpectrum']:
+    """
+    Iterate over the spectra in a netCDF file in blocks of chunk_size time steps (see iterate_spectrum).
+
+    :param path: path to the file
+    :param chunk_size: number of time steps in a block
+    :param start: time index of the first block
+    :return: iterator over spectra
+    """
+    from roguewavespectrum import FrequencySpectrum
+
+    with xarray.open_dataset(path) as dataset:
+        for index in range(start, dataset.sizes['time'], chunk_size):
+            with profiling.stage('load'):
+                block = FrequencySpectrum(dataset.isel(time=slice(index, index + chunk_size)).load())
+            yield block
+
+def get_spectrum(kind, chunk_size=None, compact=False, dtype='float64', solver='roguewavespectrum'):
     """
     Get spectra from disk or calculate it if it does not exist yet. The returned spectrum takes the form
     of a roguewave.FrequencySpectrum object.
 
     :param kind: one of 'reference', 'target', 'monotone', 'natural'
+    :param chunk_size: if given, derived spectra are calculated in blocks of chunk_size time steps to limit memory use.
+    :param compact: if True, derived spectra are returned (and cached) as an interpolation.CompactSpectrum that only
+        stores the spline coefficients on the reference grid and evaluates the high resolution spectrum on demand.
+    :param dtype: floating point type of derived spectra, 'float64' or 'float32' (see interpolation.CompactSpectrum
+        for the effect on the peak period).
+    :param solver: solver of the monotone spline, 'roguewavespectrum' or 'banded' (see monotone_spline.SOLVERS)
     :return: spectrum
     """
-
+    from roguewavespectrum import FrequencySpectrum
 
     if kind == 'reference':
         kwargs = {'segment_length_seconds': 3600, 'use_u':True,'use_v':True}
-        name = f'./data/spectrum_reference.nc'
 
-
-        return FrequencySpectrum.from_netcdf(name) # type: FrequencySpectrum
+        with profiling.stage('load'):
+            return FrequencySpectrum.from_netcdf(REFERENCE_FILE) # type: FrequencySpectrum
 
 
     elif kind == 'target':
+        from scipy.signal.windows import get_window
         kwargs = {'window':get_window('hann', 2048),'spectral_window':numpy.ones(9),
                   'segment_length_seconds':3600, 'use_u':True,'use_v':True}
-        name = f'./data/spectrum_target.nc'
 
-        return FrequencySpectrum.from_netcdf(name)
-    elif kind == 'monotone':
-        name = './data/spectrum_monotone.nc'
+        with profiling.stage('load'):
+            return FrequencySpectrum.from_netcdf(TARGET_FILE)
+
+    elif kind in ('monotone', 'natural'):
+        interpolation_kwargs = {'method': 'spline', 'monotone_interpolation': kind == 'monotone'}
+        monotone_interpolation = interpolation_kwargs['monotone_interpolation']
+        if compact:
+            return _get_compact_spectrum(kind, chunk_size, dtype, interpolation_kwargs, solver)
+
+        # Double precision results of the default solver keep the key (and cache entry) they had before the dtype and
+        # solver options were added.
+        options = {} if dtype == 'float64' else {'dtype': dtype}
+        options.update(_solver_options(monotone_interpolation, solver))
+        key = cache.cache_key([REFERENCE_FILE, TARGET_FILE], CACHE_CODE, kind=kind, **interpolation_kwargs, **options)
+
+        with profiling.stage('load'):
+            dataset = cache.load(f'spectrum_{kind}', key)
+        if dataset is not None:
+            return FrequencySpectrum(dataset)
+
+        # The grids are the same for all spectra (and blocks), so the interpolation plan is set up only once. Only the
+        # frequencies are read, so that in chunked mode no more than a block of spectra is held in memory.
+        plan = interpolation.get_plan(_read_frequency(REFERENCE_FILE), _read_frequency(TARGET_FILE))
+        if chunk_size is None:
+            spec = plan.interpolate(get_spectrum('reference'), monotone_interpolation, dtype, solver=solver)
+        else:
+            blocks = [plan.interpolate(block, monotone_interpolation, dtype, solver=solver).dataset
+                      for block in iterate_spectrum('reference', chunk_size)]
+            spec = FrequencySpectrum(xarray.concat(blocks, dim='time'))
+        cache.save(f'spectrum_{kind}', key, spec.dataset)
+        return spec
+
+    else:
+        raise Exception(f'unknown kind {kind}')
 
-        if os.path.exists(name):
-            with open(name, "rb") as file_handle:
-                spec = pickle.load(file_handle)
-            return spec
+def _get_compact_spectrum(kind, chunk_size, dtype, interpolation_kwargs, solver) -> interpolation.CompactSpectrum:
+    """
+    Get the compact form of a derived spectrum; only the spline coefficients are stored in the cache.
+    """
+    monotone_interpolation = interpolation_kwargs['monotone_interpolation']
+    key = cache.cache_key([REFERENCE_FILE, TARGET_FILE], CACHE_CODE, kind=kind, compact=True, dtype=dtype,
+                          **interpolation_kwargs, **_solver_options(monotone_interpolation, solver))
 
-        else:
-            native = get_spectrum('reference')
-            hr = get_spectrum('target')
-            spec = native.interpolate_frequency(hr.frequency, method='spline')
-            with open(name, "wb") as file_handle:
-                pickle.dump(spec, file_handle)
-            return spec
-
-    elif kind == 'natural':
-        name = './data/spectrum_natural.nc'
-
-        if os.path.exists(name):
-            if os.path.exists(name):
-                with open(name, "rb") as file_handle:
-                    spec = pickle.load(file_handle)
-                return spec
+    plan = interpolation.get_plan(_read_frequency(REFERENCE_FILE), _read_frequency(TARGET_FILE))
 
-        else:
-            native = get_spectrum('reference')
-            hr = get_spectrum('target')
-            spec = native.interpolate_frequency(hr.frequency, method='spline', monotone_interpolation=False)
-            with open(name, "wb") as file_handle:
-                pickle.dump(spec, file_handle)
-            return spec
+    # The reference spectrum is opened lazily; its values are only read when the compact spectrum is evaluated.
+    native = get_spectrum('reference')
 
+    with profiling.stage('load'):
+        dataset = cache.load(f'coefficients_{kind}', key)
+    if dataset is not None:
+        return interpolation.CompactSpectrum(native, plan, dataset['coefficients'].values, monotone_interpolation)
+
+    if chunk_size is None:
+        with profiling.stage('interpolate_frequency'):
+            coefficients = plan.coefficients(native.e.fillna(0.0).values, monotone_interpolation, dtype, solver)
     else:
-        raise Exception(f'unknown kind {kind}')
+        blocks = []
+        for block in iterate_spectrum('reference', chunk_size):
+            with profiling.stage('interpolate_frequency'):
+                blocks.append(plan.coefficients(block.e.fillna(0.0).values, monotone_interpolation, dtype, solver))
+        coefficients = numpy.concatenate(blocks)
+    spec = interpolation.CompactSpectrum(native, plan, coefficients, monotone_interpolation)
+
+    dataset = xarray.Dataset({'coefficients': (('time', 'coefficient', 'segment'), coefficients)},
+                             coords={'time': native.time.values})
+    cache.save(f'coefficients_{kind}', key, dataset)
+    return spec
+
+def _solver_options(monotone_interpolation, solver) -> dict:
+    """
+    Cache key options of the monotone spline solver; empty for the default solver (and for the natural spline), so that
+    those results keep the keys they had before the solver option was added.
+    """
+    return {'solver': solver} if monotone_interpolation and solver != 'roguewavespectrum' else {}
+
+def _read_frequency(path) -> numpy.ndarray:
+    """
+    Read only the frequencies of the spectra in a file.
+    """
+    with xarray.open_dataset(path) as dataset:
+        return dataset['frequency'].values
 
-def get_peak_period(kind) -> DataArray:
+def get_peak_period(kind, chunk_size=None, solver='roguewavespectrum') -> DataArray:
     """
     Get peak period from disk or calculate it if it does not exist yet. The returned peak period takes the form
     of a xarray.DataArray object.
 
     :param kind: one of 'reference', 'target', 'monotone', 'natural'
+    :param chunk_size: if given, peak periods are calculated in blocks of chunk_size time steps to limit memory use.
+    :param solver: solver of the monotone spline (see get_spectrum)
     :return: peak periods
     """
 
-    if kind == 'reference':
-        return get_spectrum(kind).peak_period()
-
-    elif kind == 'target':
-        return get_spectrum(kind).peak_period()
-
-    elif kind == 'monotone':
-        name = './data/tp_monotone.nc'
-
-        if os.path.exists(name):
-            with open(name, "rb") as file_handle:
-                tp = pickle.load(file_handle)
-            return tp(name)  # type: DataArray
-        else:
-            spec = get_spectrum('reference')
-            tp = spec.peak_period(use_spline=True)
-            with open(name, "wb") as file_handle:
-                pickle.dump(tp, file_handle)
-            return tp
-
-    elif kind == 'natural':
-        name = './data/tp_natural.nc'
-
-        if os.path.exists(name):
-            with open(name, "rb") as file_handle:
-                tp = pickle.load(file_handle)
-            return tp(name)  # type: DataArray
+    if kind in ('reference', 'target'):
+        if chunk_size is None:
+            spec = get_spectrum(kind)
+            with profiling.stage('peak_period'):
+                return spec.peak_period()
+
+        blocks = []
+        for spec in iterate_spectrum(kind, chunk_size):
+            with profiling.stage('peak_period'):
+                blocks.append(spec.peak_period())
+        return xarray.concat(blocks, dim='time')
+
+    elif kind in ('monotone', 'natural'):
+        interpolation_kwargs = {'monotone_interpolation': kind == 'monotone'}
+        key = cache.cache_key([REFERENCE_FILE], CACHE_CODE, kind=kind, method='spline', use_spline=True,
+                              **interpolation_kwargs, **_solver_options(kind == 'monotone', solver))
+
+        with profiling.stage('load'):
+            dataset = cache.load(f'tp_{kind}', key)
+        if dataset is not None:
+            return dataset['peak_period'].rename('peak period')  # type: DataArray
+
+        if chunk_size is None:
+            tp = spline_peak.peak_period(get_spectrum('reference'), solver=solver, **interpolation_kwargs)
         else:
-            spec = get_spectrum('reference')
-            tp = spec.peak_period(use_spline=True, monotone_interpolation=False)
-            with open(name, "wb") as file_handle:
-                pickle.dump(tp, file_handle)
-            return tp
+            tp = xarray.concat([spline_peak.peak_period(spec, solver=solver, **interpolation_kwargs)
+                                for spec in iterate_spectrum('reference', chunk_size)], dim='time')
+        cache.save(f'tp_{kind}', key, tp.to_dataset(name='peak_period'))
+        return tp
+
     else:
         raise Exception(f'unknown kind {kind}')
 
 
+def get_bulk_parameters(chunks=None, mean_period=False, bandwidth=False, solver='roguewavespectrum') -> xarray.Dataset:
+    """
+    Get all bulk parameters of the reference spectra (discrete, monotone and natural peak periods, significant wave
+    height and optionally mean period and bandwidth) in a single pass over the data, without creating the interpolated
+    spectra (see bulk.bulk_parameters).
+
+    The monotone peak period equals that of get_peak_period('monotone', solver=solver).
+
+    :param chunks: if given (e.g. {'time': 256}), the file is opened lazily with dask and the chunks are processed in
+        parallel; requires dask.
+    :param mean_period: also calculate the mean period
+    :param bandwidth: also calculate the spectral bandwidth
+    :param solver: solver of the monotone spline, 'roguewavespectrum' or 'banded' (see monotone_spline.SOLVERS)
+    :return: bulk parameters
+    """
+    with xarray.open_dataset(REFERENCE_FILE, chunks=chunks) as dataset:
+        return bulk.bulk_parameters(dataset, mean_period, bandwidth, solver=solver).load()
+
+
+def stream_bulk_parameters(output_directory, chunk_size=48, solver='roguewavespectrum') -> Iterator[xarray.Dataset]:
+    """
+    Calculate the bulk parameters (discrete, monotone and natural peak periods and significant wave height) of the
+    reference spectra one block of chunk_size time steps at a time, with bulk.bulk_parameters (so the values are those
+    of get_bulk_parameters). Each block is written to its own netCDF file in the output directory as soon as it is
+    calculated. Blocks that were already written by a previous (interrupted) run
+    with the same input data, chunk size and solver are not recalculated, i.e. the calculation resumes after the last
+    block that was written.
+
+    :param output_directory: directory to write the blocks to
+    :param chunk_size: number of time steps in a block
+    :param solver: solver of the monotone spline (see get_bulk_parameters)
+    :return: iterator over the bulk parameters of each block (as xarray.Dataset).
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    source = cache.file_hash(REFERENCE_FILE)
+
+    with xarray.open_dataset(REFERENCE_FILE) as dataset:
+        number_of_spectra = dataset.sizes['time']
+
+    # Yield the blocks written by previous runs, up to the first block that is missing or invalid. Any other block in
+    # the directory is stale (written with other data, chunk size or solver, or after the gap) and is removed.
+    start = 0
+    valid = []
+    while start < number_of_spectra:
+        parameters = _load_block(_block_path(output_directory, start), source, chunk_size, solver)
+        if parameters is None:
+            break
+        valid.append(_block_path(output_directory, start))
+        yield parameters
+        start += chunk_size
+
+    for path in _block_paths(output_directory):
+        if path not in valid:
+            os.remove(path)
+
+    for spec in iterate_spectrum('reference', chunk_size, start=start):
+        parameters = bulk.bulk_parameters(spec, solver=solver)
+        parameters.attrs = {'source': source, 'chunk_size': chunk_size, 'solver': solver, 'version': BULK_VERSION}
+
+        # Write to a temporary file first so that a crash never leaves a partially written block behind.
+        path = _block_path(output_directory, start)
+        cache.write_atomically(path, parameters.to_netcdf)
+
+        yield parameters
+        start += chunk_size
+
+def _fused_bulk_parameters(chunk_size=None, solver='roguewavespectrum') -> xarray.Dataset:
+    """
+    Bulk parameters of the reference spectra in a single pass, in blocks of chunk_size time steps if given.
+    """
+    if chunk_size is None:
+        return get_bulk_parameters(solver=solver)
+    blocks = [bulk.bulk_parameters(spec, solver=solver) for spec in iterate_spectrum('reference', chunk_size)]
+    return xarray.concat(blocks, dim='time')
+
+def read_bulk_parameters(output_directory, chunk_size=48, solver='roguewavespectrum') -> xarray.Dataset:
+    """
+    Read the bulk parameters written by stream_bulk_parameters. Only the blocks that belong to the current reference
+    data and the given chunk size and solver are read, up to the first block that is missing.
+
+    :param output_directory: directory the blocks were written to
+    :param chunk_size: number of time steps in a block (as passed to stream_bulk_parameters)
+    :param solver: solver of the monotone spline (as passed to stream_bulk_parameters)
+    :return: bulk parameters
+    """
+    source = cache.file_hash(REFERENCE_FILE)
+    with xarray.open_dataset(REFERENCE_FILE) as dataset:
+        number_of_spectra = dataset.sizes['time']
+
+    blocks = []
+    for start in range(0, number_of_spectra, chunk_size):
+        block = _load_block(_block_path(output_directory, start), source, chunk_size, solver)
+        if block is None:
+            break
+        blocks.append(block)
+
+    if not blocks:
+        raise ValueError(f'no bulk parameters for {REFERENCE_FILE} with chunk size {chunk_size} and solver {solver} in '
+                         f'{output_directory}')
+    return xarray.concat(blocks, dim='time')
+
+def _block_path(output_directory, start):
+    return os.path.join(output_directory, f'block_{start:010d}.nc')
+
+def _block_paths(output_directory):
+    return [os.path.join(output_directory, name) for name in sorted(os.listdir(output_directory))
+            if name.startswith('block_') and name.endswith('.nc')]
+
+def _load_block(path, source, chunk_size, solver):
+    """
+    Load a previously written block, or return None if it does not exist or was calculated from different data.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with xarray.open_dataset(path) as block:
+            if (block.attrs.get('source') != source or block.attrs.get('chunk_size') != chunk_size or
+                    block.attrs.get('solver') != solver or block.attrs.get('version') != BULK_VERSION):
+                return None
+            return block.load()
+    except Exception:
+        return None
+
+
 def get_displacements():
     """
     Get raw displacement data from netcdf file. Note that the displacement data is not include as part of the repository
     due to its size. Instead, derived spectra are included.
 
+    This loads the whole record into memory; use iterate_displacements to read it one segment at a time.
+
     :return: Pandas dataframe with displacement data.
     """
     dataset = xarray.open_dataset('./data/displacement.nc')
-    return dataset.to_dataframe()
\ No newline at end of file
+    return dataset.to_dataframe()
+
+
+def iterate_displacements(segment_length_seconds=3600) -> Iterator[xarray.Dataset]:
+    """
+    Get raw displacement data from netcdf file, one segment at a time. The record is too large to hold in memory as a
+    whole, so it is read lazily (see displacement.DisplacementReader); spectra can be estimated from it with
+    displacement.estimate_spectra.
+
+    :param segment_length_seconds: length of a segment
+    :return: iterator over segments of displacement data.
+    """
+    import displacement
+
+    with displacement.DisplacementReader(displacement.DISPLACEMENT_FILE) as reader:
+        yield from reader.segments(segment_length_seconds)
@@ -0,0 +1,101 @@
+"""
+Contents: Online estimation of the continuous peak period and significant wave height for spectra that arrive one at a
+time (or in small batches), e.g. the hourly spectra of a buoy in real time. The estimator only holds what depends on
+the frequency grid (the natural spline operator and the normal matrices of the monotone spline problem), so the cost of
+an update does not depend on how many spectra were processed before, e.g.:
+
+    estimator = OnlineEstimator(frequency)
+    for variance_density in incoming_spectra:
+        bulk = estimator.update(variance_density)
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+import numpy as np
+import sys
+import interpolation
+import monotone_spline
+import spline_peak
+
+
+class OnlineEstimator:
+    """
+    Monotone and natural spline peak periods and significant wave height for spectra on a fixed frequency grid.
+    """
+
+    def __init__(self, frequency, solver='roguewavespectrum'):
+        """
+        :param frequency: frequencies of the spectra, shape (nf,)
+        :param solver: solver of the monotone spline, 'roguewavespectrum' (the quadratic program of roguewavespectrum,
+            as observed_data.get_data) or 'banded' (MonotoneSplineSolver.fit, compiled if Numba is installed); see
+            monotone_spline.SOLVERS.
+        """
+        monotone_spline.check_solver(solver)
+        self.frequency = np.asarray(frequency, dtype='float64')
+        self.solver = solver
+
+        # Only the natural spline operator and the knots of the plan are used; the interpolation grid is irrelevant.
+        self.plan = interpolation.InterpolationPlan(self.frequency, self.frequency)
+        self.monotone_solver = self.plan.monotone_solver if solver == 'banded' else None
+
+        # Trapezoidal rule weights, so that m0 = variance_density @ weights
+        self.weights = np.zeros(len(self.frequency))
+        self.weights[:-1] += np.diff(self.frequency) / 2
+        self.weights[1:] += np.diff(self.frequency) / 2
+
+    def update(self, spectrum) -> dict:
+        """
+        Estimate the bulk parameters of new spectra.
+        :param spectrum: variance density, shape (nf,) for a single spectrum or (n, nf) for a batch, or a
+            FrequencySpectrum on the same frequencies with frequency as last dimension.
+        :return: dictionary with the monotone and natural spline peak periods and the significant wave height, each of
+            shape () for a single spectrum or (n,) for a batch.
+        """
+        # A FrequencySpectrum can only exist if roguewavespectrum was imported (importing it here takes seconds).
+        roguewavespectrum = sys.modules.get('roguewavespectrum')
+        if roguewavespectrum is not None and isinstance(spectrum, roguewavespectrum.FrequencySpectrum):
+            if not np.array_equal(spectrum.frequency.values, self.frequency):
+                raise ValueError('spectrum is not defined on the frequencies of the estimator')
+            spectrum = spectrum.e.values
+
+        variance_density = np.asarray(spectrum, dtype='float64')
+        variance_density = np.where(np.isnan(variance_density), 0.0, variance_density)
+        shape = variance_density.shape[:-1]
+        variance_density = np.reshape(variance_density, (-1, len(self.frequency)))
+
+        natural = self.plan.natural_coefficients(variance_density)
+        number_of_spectra = variance_density.shape[0]
+        if self.solver == 'roguewavespectrum':
+            monotone_peak = spline_peak.spline_peak_frequency(self.frequency, variance_density, True, self.solver)
+            natural_peak = spline_peak.peak_frequency_from_coefficients(self.plan.knots,
+                                                                        np.transpose(natural, (1, 2, 0)))
+            peak_frequency = np.concatenate((monotone_peak, natural_peak))
+        elif monotone_spline.COMPILED:
+            # The compiled kernel finds the monotone peaks itself.
+            _, monotone_peak = self.monotone_solver.fit(variance_density, self.plan.binwidth)
+            natural_peak = spline_peak.peak_frequency_from_coefficients(self.plan.knots,
+                                                                        np.transpose(natural, (1, 2, 0)))
+            peak_frequency = np.concatenate((monotone_peak, natural_peak))
+        else:
+            # Both splines in a single call, the overhead of the peak search dominates for small batches.
+            monotone = self.monotone_solver.coefficients(self.plan.cdf(variance_density))[:, :3, :]
+            coefficients = np.concatenate((monotone, natural), axis=0)
+            peak_frequency = spline_peak.peak_frequency_from_coefficients(
+                self.plan.knots, np.transpose(coefficients, (1, 2, 0)))
+
+        significant_waveheight = 4 * np.sqrt(variance_density @ self.weights)
+
+        return {
+            'peak_period_monotone': np.reshape(1 / peak_frequency[:number_of_spectra], shape),
+            'peak_period_natural': np.reshape(1 / peak_frequency[number_of_spectra:], shape),
+            'significant_waveheight': np.reshape(significant_waveheight, shape),
+        }
@@ -0,0 +1,154 @@
+"""
+Contents: Shared plotting helpers for spectra: a vectorized step (piecewise constant) outline of discrete spectra, and a
+batch renderer that draws the reference/natural/monotone/target spectra of many time steps (as in figure 4) into a
+single figure that is reused for all of them, e.g.:
+
+    plotter = SpectrumPlotter()
+    plotter.plot_batch(spectrum, './figures/spectra')
+
+Everything that is the same for all spectra (axes, ticks, grid, labels, legend) is rendered once; per spectrum only the
+lines and the title are updated (set_data) and drawn on top of the stored background (blitting). For this to work the
+axes limits must be fixed, so spectra are normalized by their maximum (as in figures 1 and 2).
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+import numpy as np
+import pandas
+import os
+
+# Line styles of the different spectra (as in figure 4)
+STYLES = {
+    'piecewise': {'color': 'grey'},
+    'linear': {'color': 'grey', 'linestyle': '--'},
+    'natural': {'color': 'b'},
+    'monotone': {'color': 'orange'},
+    'target': {'color': 'k'},
+}
+
+
+def blockify(x, y):
+    """
+    Create bars to plot for discrete spectra: every value is drawn as a horizontal bar of one bin wide, centred on its
+    frequency.
+    :param x: frequencies, shape (n,)
+    :param y: values, shape (..., n)
+    :return: plotable bars, shapes (2n,) and (..., 2n)
+    """
+    x = np.asarray(x)
+    dx = x[2] - x[1]
+    xx = np.stack((x - 0.5 * dx, x + 0.5 * dx), axis=-1).reshape(-1)
+    yy = np.repeat(np.asarray(y), 2, axis=-1)
+    return xx, yy
+
+
+class SpectrumPlotter:
+    """
+    Render the reference (piecewise and linear), natural, monotone and target spectra of individual time steps into a
+    single reused figure.
+    """
+
+    def __init__(self, frequency_limits=(0., 0.3), ylim=(0., 1.05), figsize=(4, 3), dpi=100):
+        """
+        :param frequency_limits: frequency limits of the plot
+        :param ylim: limits of the normalized variance density
+        :param figsize: size of the figure (inches)
+        :param dpi: resolution of the figure
+        """
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot(1, 1, 1)
+
+        # Artists that change per spectrum are animated, i.e. excluded from the background.
+        self.lines = {name: self.axes.plot([], [], label=label, animated=True, **STYLES[name])[0]
+                      for name, label in [('piecewise', 'piecewise'), ('linear', 'linear'), ('natural', 'natural'),
+                                          ('monotone', 'monotone'), ('target', 'target')]}
+        self.title = self.axes.set_title(' ', fontsize='10', animated=True)
+
+        self.axes.set_xlim(frequency_limits)
+        self.axes.set_ylim(ylim)
+        self.axes.set_xlabel('frequency [Hz]')
+        self.axes.set_ylabel('$E/E_{max}$ [-]')
+        self.axes.minorticks_on()
+        self.axes.grid(which='major', linestyle='-', linewidth=1)
+        self.axes.grid(which='minor', linestyle='-', linewidth=0.5)
+        self.axes.legend(fontsize=8)
+        self.figure.tight_layout()
+
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def draw(self, frequencies, values, title=''):
+        """
+        Draw the spectra of a single time step.
+        :param frequencies: dictionary with the frequencies of the 'reference', 'natural', 'monotone' and 'target'
+            spectra
+        :param values: dictionary with the variance densities of these spectra
+        :param title: title of the plot
+        :return: None
+        """
+        scale = max(np.nanmax(value) for value in values.values())
+        if not scale > 0:
+            scale = 1.0
+
+        x, y = blockify(frequencies['reference'], values['reference'] / scale)
+        self.lines['piecewise'].set_data(x, y)
+        self.lines['linear'].set_data(frequencies['reference'], values['reference'] / scale)
+        for name in ('natural', 'monotone', 'target'):
+            self.lines[name].set_data(frequencies[name], values[name] / scale)
+        self.title.set_text(title)
+
+        self.canvas.restore_region(self.background)
+        for artist in list(self.lines.values()) + [self.title]:
+            self.axes.draw_artist(artist)
+
+    def save(self, path, compress_level=1):
+        """
+        Save the current image as png.
+        :param path: path of the png file
+        :param compress_level: zlib compression level (0-9); low levels are much faster to write.
+        :return: None
+        """
+        Image.frombuffer('RGBA', self.canvas.get_width_height(), self.canvas.buffer_rgba()).save(
+            path, format='png', compress_level=compress_level)
+
+    def plot_batch(self, spectrum, output_directory, times=None) -> int:
+        """
+        Plot the spectra of many time steps, one png per time step.
+        :param spectrum: dictionary with 'reference', 'natural', 'monotone' and 'target' spectra (as returned by
+            observed_data.get_data).
+        :param output_directory: directory for the png files
+        :param times: times to plot; the nearest time of every spectrum is used. All times of the reference spectrum if
+            None.
+        :return: number of plots
+        """
+        os.makedirs(output_directory, exist_ok=True)
+        kinds = ('reference', 'natural', 'monotone', 'target')
+        if times is None:
+            times = spectrum['reference'].time.values
+        times = pandas.DatetimeIndex(times)
+
+        frequencies = {}
+        values = {}
+        for kind in kinds:
+            index = pandas.Index(spectrum[kind].time.values).get_indexer(times, method='nearest')
+            selection = spectrum[kind].isel(time=index)
+            frequencies[kind] = selection.frequency.values
+            values[kind] = selection.variance_density.values
+
+        for index, time in enumerate(times):
+            self.draw(frequencies, {kind: values[kind][index] for kind in kinds}, time.strftime('%b-%d, %HH'))
+            self.save(os.path.join(output_directory, f'spectrum_{time.strftime("%Y%m%dT%H%M%S")}.png'))
+        return len(times)
@@ -0,0 +1,251 @@
+"""
+Contents: Opt-in instrumentation of the stages of the estimation pipeline (load, downsample, interpolate_frequency,
+peak_period, significant_waveheight). For every stage the number of calls, the wall time and the allocated memory are
+recorded, e.g.:
+
+    with profiling.profile() as profile:
+        observed_data.get_data()
+    print(profile.table())
+    profile.to_json('./profile.json')
+
+or, without changing any code, by setting an environment variable before starting Python:
+
+    PEAK_PERIOD_PROFILE=1 python figure03.py                 # table printed to stderr on exit
+    PEAK_PERIOD_PROFILE=profile.json python figure03.py      # report written as json on exit
+
+Allocated memory is measured with tracemalloc (which numpy reports its array buffers to): per call we record the peak
+of the traced memory above the level at the start of the stage ("allocated") and the change in traced memory ("net").
+Stages may be nested; the time and memory of an inner stage are then also included in the outer stage.
+
+When instrumentation is off a stage is a single global lookup that returns a shared no-op context manager, so the
+instrumented code runs at full speed. Only the current process is instrumented; stages that run on worker processes
+(e.g. sweep.get_data with max_workers != 1) are not recorded.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import atexit
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Environment variable that enables instrumentation for the whole run ('1' to print a table, or the path of a json
+# file to write the report to).
+ENVIRONMENT_VARIABLE = 'PEAK_PERIOD_PROFILE'
+
+# Stages of the pipeline, in the order they are reported.
+STAGES = ['load', 'downsample', 'interpolate_frequency', 'peak_period', 'significant_waveheight']
+
+# Context manager returned by stage() while instrumentation is off.
+_NO_OP = nullcontext()
+
+# Profile that is currently recording, None if instrumentation is off.
+_active = None
+
+
+class Profile:
+    """
+    Statistics (calls, wall time, allocated bytes) of the stages of the pipeline.
+    """
+
+    def __init__(self, track_memory=True):
+        """
+        :param track_memory: record allocated memory (tracemalloc slows down Python code, not numpy kernels).
+        """
+        self.track_memory = track_memory
+        self.statistics = {}
+
+        # Per open stage: the traced memory at its start and the highest traced memory seen so far.
+        self._memory_stack = []
+
+    def _record(self, name, seconds, allocated_bytes=0, net_bytes=0):
+        if name not in self.statistics:
+            self.statistics[name] = {'calls': 0, 'seconds': 0.0, 'allocated_bytes': 0, 'peak_allocated_bytes': 0,
+                                     'net_bytes': 0}
+        statistics = self.statistics[name]
+        statistics['calls'] += 1
+        statistics['seconds'] += seconds
+        statistics['allocated_bytes'] += allocated_bytes
+        statistics['peak_allocated_bytes'] = max(statistics['peak_allocated_bytes'], allocated_bytes)
+        statistics['net_bytes'] += net_bytes
+
+    def report(self) -> list:
+        """
+        Statistics of all recorded stages, pipeline stages first.
+        :return: list of dictionaries with stage, calls, seconds, seconds_per_call, allocated_bytes (sum over calls of
+            the peak memory above the start of the call), peak_allocated_bytes (largest of a single call) and
+            net_bytes (memory still allocated at the end of the calls).
+        """
+        names = [name for name in STAGES if name in self.statistics]
+        names += sorted(name for name in self.statistics if name not in STAGES)
+
+        report = []
+        for name in names:
+            statistics = self.statistics[name]
+            report.append({'stage': name, 'calls': statistics['calls'], 'seconds': statistics['seconds'],
+                           'seconds_per_call': statistics['seconds'] / statistics['calls'],
+                           'allocated_bytes': statistics['allocated_bytes'],
+                           'peak_allocated_bytes': statistics['peak_allocated_bytes'],
+                           'net_bytes': statistics['net_bytes']})
+        return report
+
+    def to_json(self, path=None) -> str:
+        """
+        Report as json.
+        :param path: (optional) file to write the report to
+        :return: json string
+        """
+        text = json.dumps({'track_memory': self.track_memory, 'stages': self.report()}, indent=2)
+        if path is not None:
+            with open(path, 'w') as file_handle:
+                file_handle.write(text)
+        return text
+
+    def table(self) -> str:
+        """
+        Report as a plain text table.
+        :return: table
+        """
+        lines = [f'{"stage":<24}{"calls":>8}{"time (s)":>12}{"ms/call":>10}{"alloc (MB)":>12}{"peak (MB)":>11}'
+                 f'{"net (MB)":>10}']
+        for row in self.report():
+            lines.append(f'{row["stage"]:<24}{row["calls"]:>8}{row["seconds"]:>12.3f}'
+                         f'{1000 * row["seconds_per_call"]:>10.2f}{row["allocated_bytes"] / 2 ** 20:>12.1f}'
+                         f'{row["peak_allocated_bytes"] / 2 ** 20:>11.1f}{row["net_bytes"] / 2 ** 20:>10.1f}')
+        return '\n'.join(lines)
+
+
+class _Stage:
+    """
+    Context manager that records a single call of a stage.
+    """
+
+    def __init__(self, profile: Profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        if self.profile.track_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            stack = self.profile._memory_stack
+            if stack:
+                # The peak is reset below; keep what the enclosing stage has seen so far.
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            stack.append([current, current])
+            self.track_memory = True
+        else:
+            self.track_memory = False
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self.start
+
+        allocated_bytes = net_bytes = 0
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stack = self.profile._memory_stack
+            start, highest = stack.pop()
+            highest = max(highest, peak)
+            allocated_bytes = highest - start
+            net_bytes = current - start
+            if stack:
+                stack[-1][1] = max(stack[-1][1], highest)
+            tracemalloc.reset_peak()
+
+        self.profile._record(self.name, seconds, allocated_bytes, net_bytes)
+        return False
+
+
+def stage(name):
+    """
+    Context manager around a stage of the pipeline, e.g.:
+
+        with profiling.stage('downsample'):
+            ...
+
+    :param name: name of the stage (see STAGES)
+    :return: context manager
+    """
+    if _active is None:
+        return _NO_OP
+    return _Stage(_active, name)
+
+
+def timed(name):
+    """
+    Decorator that records every call of the function as a call of the given stage.
+    :param name: name of the stage (see STAGES)
+    :return: decorator
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _Stage(_active, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile(track_memory=True):
+    """
+    Record the stages of all code that runs within the context.
+    :param track_memory: record allocated memory (starts tracemalloc if it is not running already).
+    :return: context manager that yields the Profile
+    """
+    global _active
+    previous = _active
+    started_tracing = track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    _active = Profile(track_memory)
+    try:
+        yield _active
+    finally:
+        _active = previous
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def _profile_from_environment():
+    """
+    Enable instrumentation for the whole run if the environment variable is set.
+    """
+    global _active
+    setting = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    if setting in ('', '0'):
+        return
+
+    tracemalloc.start()
+    _active = Profile()
+    run_profile = _active
+
+    def _report():
+        if setting == '1':
+            print(run_profile.table(), file=sys.stderr)
+        else:
+            run_profile.to_json(setting)
+
+    atexit.register(_report)
+
+
+_profile_from_environment()
@@ -0,0 +1,235 @@
+"""
+Contents: Calibration of the refinement factor of the fine (interpolation) frequency grid: the ratio of the coarse
+frequency step to the fine frequency step (100 in figures 1-3), e.g.:
+
+    python refinement.py --error-budget 0.05            # table of errors and costs, and the recommendation
+    python refinement.py --error-budget 0.05 --apply    # ... and use the recommendation in the figure scripts
+
+The fine grid is where figure 3 evaluates the true spectra, and the grid on which the cdf is integrated to obtain
+the downsampled spectra. The target (the peak of the true spectrum on the fine grid) and the downsampled peak periods
+therefore depend on the refinement factor, and through the downsampled spectra so do the monotone and natural spline
+peak periods (the closed form peaks of spline_peak, which do not depend on a grid themselves). For every candidate
+refinement factor the gaussian, jonswap and pm sweeps of figure 3 are calculated with sweep.get_periods, the routine
+figure 3 uses, and so are those of a reference refinement factor that is finer than all candidates.
+
+The error of a refinement factor is the largest difference, over all spectra and all outputs of sweep.get_periods
+(target, downsampled, monotone and natural peak periods), with the reference
+
+    | Tp_r - Tp_reference |
+
+i.e. how much figure 3 would change by using the refinement factor instead of the reference. The cdf of the downsampled
+spectra is a sum over the fine grid, so spectra with two nearly equal largest coarse bins can have a different discrete
+downsampled peak at different refinement factors; the table therefore also lists the error per method. The cost is the
+time per spectrum of sweep.get_periods, and the number of fine grid points (memory per spectrum). The recommendation is
+the cheapest refinement factor whose error is within the budget. Applying it stores it in REFINEMENT_FILE, from where
+the figure scripts read it (see get_refinement).
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+# File with the refinement factor that was applied by the calibration.
+REFINEMENT_FILE = './data/refinement.json'
+
+# Refinement factor used if none was applied.
+DEFAULT_REFINEMENT = 100
+
+# Refinement factors considered by default.
+CANDIDATES = [5, 10, 20, 50, 100, 200]
+
+# Refinement factor of the reference the candidates are compared against (finer than all candidates).
+REFERENCE_REFINEMENT = 1000
+
+# Outputs of sweep.get_periods that are compared.
+METHODS = ['target', 'downsampled', 'monotone', 'natural']
+
+# Settings of the sweeps of figure 3: coarse frequency step and limits, peak frequencies and gaussian widths.
+FREQUENCY_STEP = 0.01
+FREQUENCY_LIMITS = [0.01, 0.5]
+PEAK_FREQUENCIES = np.linspace(5 * FREQUENCY_STEP, 15 * FREQUENCY_STEP, 101)
+FREQUENCY_WIDTHS = [2 * FREQUENCY_STEP, FREQUENCY_STEP, FREQUENCY_STEP / 2, FREQUENCY_STEP / 10]
+
+
+def get_refinement(default=DEFAULT_REFINEMENT) -> int:
+    """
+    Refinement factor of the fine frequency grid: the one that was applied by the calibration, otherwise the default.
+    :param default: refinement factor if none was applied
+    :return: refinement factor
+    """
+    if not os.path.exists(REFINEMENT_FILE):
+        return default
+
+    try:
+        with open(REFINEMENT_FILE) as file_handle:
+            return int(json.load(file_handle)['refinement'])
+    except (ValueError, KeyError):
+        return default
+
+
+def apply(recommendation):
+    """
+    Store the recommended refinement factor, so that the figure scripts use it.
+    :param recommendation: result of the recommended refinement factor (see calibrate)
+    :return: None
+    """
+    import cache
+
+    os.makedirs(os.path.dirname(REFINEMENT_FILE), exist_ok=True)
+    def write(temporary_path):
+        with open(temporary_path, 'w') as file_handle:
+            json.dump(recommendation, file_handle, indent=2)
+
+    cache.write_atomically(REFINEMENT_FILE, write)
+
+
+def frequency_grids(refinement, frequency_step=FREQUENCY_STEP, frequency_limits=FREQUENCY_LIMITS):
+    """
+    Coarse and fine frequency grids, constructed as in the figure scripts.
+    :param refinement: ratio of the coarse to the fine frequency step
+    :param frequency_step: coarse frequency step
+    :param frequency_limits: frequency limits
+    :return: coarse (sampled) frequencies, fine (interpolated) frequencies
+    """
+    frequency_step_highres = frequency_step / refinement
+    frequency_band = frequency_limits[1] - frequency_limits[0]
+    sampled_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
+                                      int(frequency_band / frequency_step) + 1, endpoint=True)
+    interpolated_frequencies = np.linspace(frequency_limits[0], frequency_limits[1],
+                                           int(frequency_band / frequency_step_highres) + 1, endpoint=True)
+    return sampled_frequencies, interpolated_frequencies
+
+
+def measure(refinement, peak_frequencies=PEAK_FREQUENCIES, frequency_widths=FREQUENCY_WIDTHS,
+            frequency_step=FREQUENCY_STEP, frequency_limits=FREQUENCY_LIMITS, solver='roguewavespectrum') -> dict:
+    """
+    Peak periods and cost of a refinement factor for the gaussian, jonswap and pm sweeps, as calculated by
+    sweep.get_periods.
+    :param refinement: ratio of the coarse to the fine frequency step
+    :param peak_frequencies: peak frequencies of the sweeps
+    :param frequency_widths: standard deviations of the gaussian spectra
+    :param frequency_step: coarse frequency step
+    :param frequency_limits: frequency limits
+    :param solver: solver of the monotone spline (see sweep.get_periods)
+    :return: dictionary with the refinement, the number of fine grid points, the time per spectrum (s) and the peak
+        periods per kind and method (target, downsampled, monotone, natural).
+    """
+    import sweep
+
+    sampled_frequencies, interpolated_frequencies = frequency_grids(refinement, frequency_step, frequency_limits)
+    standard_deviations = {'gaussian': frequency_widths, 'jonswap': [0.0], 'pm': [0.0]}
+
+    periods = {}
+    seconds = 0.0
+    number_of_spectra = 0
+    for kind, kind_standard_deviations in standard_deviations.items():
+        start = time.perf_counter()
+        result = sweep.get_periods(peak_frequencies, kind_standard_deviations, interpolated_frequencies,
+                                   sampled_frequencies, kind, solver)
+        seconds += time.perf_counter() - start
+        number_of_spectra += result['target'].size
+        periods[kind] = {method: result[method] for method in METHODS}
+
+    return {'refinement': refinement, 'points': len(interpolated_frequencies),
+            'seconds_per_spectrum': seconds / number_of_spectra, 'periods': periods}
+
+
+def compare(results, reference) -> list:
+    """
+    Error of every refinement factor relative to the reference (see the description at the top of this file).
+    :param results: results of measure for the candidate refinement factors
+    :param reference: result of measure for the reference refinement factor
+    :return: results without the peak periods, with the error (s; largest difference over all kinds and methods) and
+        the errors per kind and method.
+    """
+    compared = []
+    for result in results:
+        errors = {kind: {method: float(np.max(np.abs(kind_periods[method] - reference['periods'][kind][method])))
+                         for method in METHODS}
+                  for kind, kind_periods in result['periods'].items()}
+
+        compared.append({name: value for name, value in result.items() if name != 'periods'})
+        compared[-1]['error'] = max(max(kind_errors.values()) for kind_errors in errors.values())
+        compared[-1]['errors'] = errors
+    return compared
+
+
+def recommend(results, error_budget):
+    """
+    Cheapest refinement factor whose error is within the budget.
+    :param results: results of compare for the candidate refinement factors
+    :param error_budget: largest acceptable error in the peak period (s)
+    :return: result of the recommended refinement factor, or None if no candidate meets the budget.
+    """
+    feasible = [result for result in results if result['error'] <= error_budget]
+    if not feasible:
+        return None
+    return min(feasible, key=lambda result: (result['points'], result['refinement']))
+
+
+def calibrate(error_budget=0.05, refinements=CANDIDATES, apply_recommendation=False,
+              reference_refinement=REFERENCE_REFINEMENT, **kwargs):
+    """
+    Measure all candidate refinement factors and recommend (and optionally apply) the cheapest one within the budget.
+    :param error_budget: largest acceptable error in the peak period (s)
+    :param refinements: candidate refinement factors
+    :param apply_recommendation: store the recommendation for the figure scripts (see apply).
+    :param reference_refinement: refinement factor the errors are measured against; must be finer than all candidates.
+    :param kwargs: passed to measure (e.g. peak_frequencies, solver)
+    :return: recommended result (None if no candidate meets the budget), results of all candidates
+    """
+    if reference_refinement <= max(refinements):
+        raise ValueError(f'the reference refinement {reference_refinement} must be larger than all candidates')
+
+    reference = measure(reference_refinement, **kwargs)
+    results = compare([measure(refinement, **kwargs) for refinement in sorted(refinements)], reference)
+    recommendation = recommend(results, error_budget)
+    if recommendation is not None and apply_recommendation:
+        apply(dict(recommendation, error_budget=error_budget, reference_refinement=reference_refinement))
+    return recommendation, results
+
+
+def table(results, error_budget) -> str:
+    # error: largest difference of the peak periods with those of the reference refinement, in total and per method
+    # (over all kinds).
+    lines = [f'{"refinement":>10}{"points":>8}{"us/spectrum":>13}{"error (s)":>11}' +
+             ''.join(f'{method:>13}' for method in METHODS) + '  within budget']
+    for result in results:
+        method_errors = [max(errors[method] for errors in result['errors'].values()) for method in METHODS]
+        lines.append(f'{result["refinement"]:>10}{result["points"]:>8}{1e6 * result["seconds_per_spectrum"]:>13.1f}'
+                     f'{result["error"]:>11.4f}' + ''.join(f'{error:>13.4f}' for error in method_errors) +
+                     f'  {"yes" if result["error"] <= error_budget else "no"}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate the refinement factor of the fine frequency grid.')
+    parser.add_argument('--error-budget', type=float, default=0.05, help='largest acceptable peak period error (s)')
+    parser.add_argument('--refinements', nargs='+', type=int, default=CANDIDATES, help='candidate refinement factors')
+    parser.add_argument('--reference-refinement', type=int, default=REFERENCE_REFINEMENT,
+                        help='refinement factor the candidates are compared against')
+    parser.add_argument('--solver', default='roguewavespectrum', choices=['roguewavespectrum', 'banded'],
+                        help='solver of the monotone spline (see monotone_spline.SOLVERS)')
+    parser.add_argument('--apply', action='store_true', help='use the recommendation in the figure scripts')
+    args = parser.parse_args()
+
+    recommendation, results = calibrate(args.error_budget, args.refinements, args.apply, args.reference_refinement,
+                                        solver=args.solver)
+    print(table(results, args.error_budget))
+    if recommendation is None:
+        raise SystemExit(f'no refinement factor meets the error budget of {args.error_budget} s')
+
+    print(f'recommended refinement: {recommendation["refinement"]}' + (' (applied)' if args.apply else ''))
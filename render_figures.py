@@ -0,0 +1,310 @@
+"""
+Contents: Headless driver that (re)generates all figures of the manuscript, e.g.:
+
+    python render_figures.py                      # all figures whose inputs changed
+    python render_figures.py figure03 --force     # figure 3, whether or not its inputs changed
+
+Figures are rendered with the Agg backend (nothing is shown) in parallel worker processes, one figure per worker. The
+panels of a figure share a single layout (tight_layout, shared legends), so a figure is the unit of work.
+
+Data that takes a while to calculate (the sweeps of figure 3 and the interpolated observed spectra of figure 4) is
+prepared once in the driver and stored in the content addressed cache (see cache.py), while the figures without
+expensive data (1 and 2) are already being rendered. The sweeps are small and loaded by the worker from the cache; the
+observed spectra are published in shared memory (see shared_data.py), so that the worker maps them instead of loading
+or unpickling its own copy.
+
+The inputs of every figure - the source of its script and of all local modules it (indirectly) imports, its data files,
+and the versions of the packages that determine the result - are hashed and stored in a manifest next to the figures.
+Figures whose inputs did not change since they were last rendered are skipped.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+import matplotlib
+
+# Select the non-interactive backend before pyplot is imported by any of the figure scripts (this module is also
+# imported by the worker processes).
+matplotlib.use('Agg')
+
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata, util
+import matplotlib.pyplot as plt
+import argparse
+import ast
+import hashlib
+import json
+import os
+import sys
+from typing import TYPE_CHECKING
+import cache
+
+if TYPE_CHECKING:
+    import shared_data
+
+# Location of the figure scripts and local modules.
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Name of the manifest with the input hashes of the rendered figures (stored in the output directory).
+MANIFEST_FILE = 'render_manifest.json'
+
+# Packages whose version is part of the inputs of every figure.
+PACKAGES = ['roguewavespectrum', 'numpy', 'scipy', 'xarray', 'matplotlib']
+
+# Figures: the script, the function in the script that renders the figure, and the data files it reads (those of
+# observed_data; not imported here as importing roguewavespectrum takes seconds, even if all figures are up to date).
+# Figures 1-3 read the calibrated refinement factor of the fine frequency grid (see refinement.py).
+FIGURES = {
+    'figure01': ('figure01-02.py', 'render_figure01', ['./data/refinement.json']),
+    'figure02': ('figure01-02.py', 'render_figure02', ['./data/refinement.json']),
+    'figure03': ('figure03.py', 'render', ['./data/refinement.json']),
+    'figure04': ('figure04.py', 'render', ['./data/spectrum_reference.nc', './data/spectrum_target.nc']),
+}
+
+
+def load_script(script):
+    """
+    Import a figure script as a module (the scripts are not importable by name, e.g. figure01-02.py).
+    :param script: file name of the script
+    :return: module
+    """
+    name = os.path.splitext(script)[0].replace('-', '_')
+    if name not in sys.modules:
+        spec = util.spec_from_file_location(name, os.path.join(SOURCE_DIRECTORY, script))
+        module = util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def local_dependencies(script) -> list:
+    """
+    Find the script and all local modules it imports, directly or through other local modules.
+    :param script: file name of the script
+    :return: sorted list of paths
+    """
+    paths = set()
+    stack = [os.path.join(SOURCE_DIRECTORY, script)]
+    while stack:
+        path = stack.pop()
+        if path in paths:
+            continue
+        paths.add(path)
+
+        with open(path) as file_handle:
+            tree = ast.parse(file_handle.read(), filename=path)
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+
+            for name in names:
+                module_path = os.path.join(SOURCE_DIRECTORY, name.split('.')[0] + '.py')
+                if os.path.exists(module_path):
+                    stack.append(module_path)
+
+    return sorted(paths)
+
+
+def input_hash(name) -> str:
+    """
+    Hash of everything the figure depends on: code, data files and package versions.
+    :param name: name of the figure (key in FIGURES)
+    :return: hex digest
+    """
+    script, function, data_files = FIGURES[name]
+
+    packages = {}
+    for package in PACKAGES:
+        try:
+            packages[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            packages[package] = None
+
+    description = {
+        'figure': name,
+        'function': function,
+        'code': {os.path.basename(path): cache.file_hash(path) for path in local_dependencies(script)},
+        'data': {path: cache.file_hash(path) if os.path.exists(path) else None for path in data_files},
+        'packages': packages,
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def read_manifest(output_directory) -> dict:
+    path = os.path.join(output_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as file_handle:
+            return json.load(file_handle)
+    except ValueError:
+        # A corrupt manifest only means that everything is rendered again.
+        return {}
+
+
+def write_manifest(output_directory, manifest):
+    os.makedirs(output_directory, exist_ok=True)
+    path = os.path.join(output_directory, MANIFEST_FILE)
+    def write(temporary_path):
+        with open(temporary_path, 'w') as file_handle:
+            json.dump(manifest, file_handle, indent=2, sort_keys=True)
+
+    cache.write_atomically(path, write)
+
+
+def prepare_data(name, max_workers=None):
+    """
+    Calculate the expensive data of a figure and store it in the cache, so that rendering only has to load it.
+    :param name: name of the figure
+    :param max_workers: number of worker processes used for the calculation.
+    :return: shared_data.SharedData with the data of figure 4 (to be released by the caller), otherwise None
+    """
+    if name == 'figure03':
+        module = load_script(FIGURES[name][0])
+        module.get_data(module.peak_frequency, module.frequency_width, max_workers=max_workers)
+    elif name == 'figure04':
+        import shared_data
+
+        return shared_data.publish_data(*load_script(FIGURES[name][0]).observed_data.get_data())
+    return None
+
+
+def render_figure(name, output_directory, shared: 'shared_data.SharedData' = None) -> str:
+    """
+    Render a single figure (in the current process).
+    :param name: name of the figure
+    :param output_directory: directory the figure is saved to
+    :param shared: (optional) data of the figure published in shared memory (see prepare_data)
+    :return: path of the figure
+    """
+    script, function, _ = FIGURES[name]
+    kwargs = {}
+    if shared is not None:
+        import shared_data
+
+        kwargs['data'] = shared_data.attach_data(shared)
+    try:
+        return getattr(load_script(script), function)(output_directory, **kwargs)
+    finally:
+        plt.close('all')
+
+
+def render_figures(names=None, output_directory='./figures', max_workers=None, force=False, progress=print):
+    """
+    Render the figures whose inputs changed since they were last rendered.
+    :param names: names of the figures to consider (all if None)
+    :param output_directory: directory the figures are saved to
+    :param max_workers: number of worker processes. If 1 everything is done in the current process, if None the number
+        of processors on the machine is used.
+    :param force: render the figures even if their inputs did not change.
+    :param progress: function that is called with a progress message after every figure (None to disable).
+    :return: dictionary with the path of each rendered figure, list of skipped figures, and a dictionary with the
+        error message of each figure that failed.
+    """
+    if names is None:
+        names = list(FIGURES)
+
+    unknown = [name for name in names if name not in FIGURES]
+    if unknown:
+        raise ValueError(f'unknown figures: {", ".join(unknown)}')
+
+    manifest = read_manifest(output_directory)
+    hashes = {name: input_hash(name) for name in names}
+
+    skipped = []
+    stale = []
+    for name in names:
+        entry = manifest.get(name, {})
+        if not force and entry.get('inputs') == hashes[name] and os.path.exists(entry.get('path', '')):
+            skipped.append(name)
+        else:
+            stale.append(name)
+
+    rendered = {}
+    failures = {}
+
+    def _report(name, path=None, error=None):
+        if error is None:
+            rendered[name] = path
+            manifest[name] = {'inputs': hashes[name], 'path': path}
+        else:
+            failures[name] = f'{type(error).__name__}: {error}'
+            manifest.pop(name, None)
+
+        if progress is not None:
+            status = f'saved {path}' if error is None else f'failed ({failures[name]})'
+            progress(f'[{len(rendered) + len(failures)}/{len(stale)}] {name}: {status}')
+
+    # Figures without expensive data go first, so that they render while the data of the others is prepared.
+    cheap = [name for name in stale if name not in ('figure03', 'figure04')]
+    expensive = [name for name in stale if name in ('figure03', 'figure04')]
+
+    if max_workers == 1:
+        for name in cheap + expensive:
+            data = None
+            try:
+                data = prepare_data(name, max_workers=1)
+                path = render_figure(name, output_directory, data)
+            except Exception as error:
+                _report(name, error=error)
+            else:
+                _report(name, path)
+            finally:
+                if data is not None:
+                    data.release()
+    else:
+        shared = []
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {name: executor.submit(render_figure, name, output_directory) for name in cheap}
+                for name in expensive:
+                    try:
+                        data = prepare_data(name, max_workers=max_workers)
+                    except Exception as error:
+                        _report(name, error=error)
+                    else:
+                        if data is not None:
+                            shared.append(data)
+                        futures[name] = executor.submit(render_figure, name, output_directory, data)
+
+                for name, future in futures.items():
+                    try:
+                        path = future.result()
+                    except Exception as error:
+                        _report(name, error=error)
+                    else:
+                        _report(name, path)
+        finally:
+            for data in shared:
+                data.release()
+
+    write_manifest(output_directory, manifest)
+    if progress is not None and skipped:
+        progress(f'unchanged (skipped): {", ".join(skipped)}')
+    return rendered, skipped, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the figures of the manuscript.')
+    parser.add_argument('figures', nargs='*', default=None, help=f'figures to render ({", ".join(FIGURES)})')
+    parser.add_argument('--output-directory', default='./figures', help='directory the figures are saved to')
+    parser.add_argument('--max-workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='render figures even if their inputs did not change')
+    args = parser.parse_args()
+
+    _, _, failures = render_figures(args.figures or None, args.output_directory, args.max_workers, args.force)
+    sys.exit(1 if failures else 0)
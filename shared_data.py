@@ -0,0 +1,193 @@
+"""
+Contents: Zero-copy handoff of computed spectra and bulk parameters to worker processes, e.g.:
+
+    with shared_data.publish_data(*observed_data.get_data()) as shared:
+        executor.submit(work, shared)            # the handle is small and pickles cheaply
+
+    def work(shared):
+        spectra, peak_period, significant_wave_height = shared_data.attach_data(shared)
+
+The arrays are written once, by the publishing process, to memory mapped array (.npy) files in a directory on shared
+memory (/dev/shm if available, otherwise the temporary directory). Workers map the files read-only: the arrays are
+views on the pages that all processes share through the page cache, nothing is unpickled or copied, so the memory used
+does not grow with the number of workers. The handle only describes the layout (variables, dimensions, attributes and
+file names). Whoever publishes the data releases it (removes the files) when the workers are done; mappings that are
+still open remain valid until they are closed.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from xarray import Dataset, DataArray
+import numpy as np
+import xarray
+import os
+import shutil
+import tempfile
+
+# Directory the shared arrays are published in; /dev/shm is memory backed on Linux.
+SHARED_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class SharedData:
+    """
+    Handle of published arrays: the layout of the published objects and the directory with their array files.
+    """
+
+    def __init__(self, directory, layout: dict):
+        """
+        :param directory: directory with the array files
+        :param layout: for every published object its type and variables (see _describe)
+        """
+        self.directory = directory
+        self.layout = layout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def array(self, file_name) -> np.ndarray:
+        """
+        Read-only view of a published array.
+        :param file_name: name of the array file
+        :return: memory mapped array
+        """
+        return np.load(os.path.join(self.directory, file_name), mmap_mode='r')
+
+    def attach(self, name):
+        """
+        Read-only, zero-copy view of a published object.
+        :param name: name the object was published under
+        :return: FrequencySpectrum, Dataset, DataArray or numpy array (as it was published)
+        """
+        description = self.layout[name]
+        if description['type'] == 'array':
+            return self.array(description['file'])
+
+        variables = {variable: xarray.Variable(dims, self.array(file_name), attrs)
+                     for variable, (dims, file_name, attrs) in description['variables'].items()}
+        coords = {variable: variables.pop(variable) for variable in description['coords']}
+        dataset = Dataset(variables, coords=coords, attrs=description['attrs'])
+
+        if description['type'] == 'spectrum':
+            from roguewavespectrum import FrequencySpectrum
+
+            return FrequencySpectrum(dataset)
+        elif description['type'] == 'dataarray':
+            return dataset[description['data']].rename(description['name'])
+        return dataset
+
+    @property
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.directory, file_name))
+                   for file_name in os.listdir(self.directory))
+
+    def release(self):
+        """
+        Remove the array files. Only the publishing process should call this, once the workers are done.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def publish(objects: dict, directory=None) -> SharedData:
+    """
+    Publish objects in shared memory.
+    :param objects: dictionary of name: object, where an object is a FrequencySpectrum, Dataset, DataArray or numpy
+        array. Variables with object dtype (e.g. strings) are not supported.
+    :param directory: (optional) directory to create the array files in, SHARED_DIRECTORY by default.
+    :return: handle to pass to the workers
+    """
+    directory = tempfile.mkdtemp(prefix='peak-period-', dir=directory or SHARED_DIRECTORY)
+    try:
+        layout = {}
+        for index, (name, value) in enumerate(objects.items()):
+            layout[name] = _describe(value, f'{index}', directory)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return SharedData(directory, layout)
+
+
+def publish_data(spectra, peak_period, significant_wave_height, directory=None) -> SharedData:
+    """
+    Publish the result of observed_data.get_data.
+    :param spectra: dictionary with the spectrum of every kind
+    :param peak_period: dictionary with the peak period of every kind
+    :param significant_wave_height: dictionary with the significant wave height of every kind
+    :param directory: (optional) directory to create the array files in
+    :return: handle to pass to the workers (see attach_data)
+    """
+    objects = {}
+    for group, values in (('spectra', spectra), ('peak_period', peak_period),
+                          ('significant_wave_height', significant_wave_height)):
+        for kind, value in values.items():
+            objects[f'{group}/{kind}'] = value
+    return publish(objects, directory)
+
+
+def attach_data(shared: SharedData):
+    """
+    Attach to data published with publish_data.
+    :param shared: handle returned by publish_data
+    :return: spectra, peak periods and significant wave heights, as returned by observed_data.get_data, backed by read
+        only shared memory.
+    """
+    data = {'spectra': {}, 'peak_period': {}, 'significant_wave_height': {}}
+    for name in shared.layout:
+        group, kind = name.split('/', 1)
+        data[group][kind] = shared.attach(name)
+    return data['spectra'], data['peak_period'], data['significant_wave_height']
+
+
+def _describe(value, prefix, directory) -> dict:
+    """
+    Write the arrays of an object to the directory and describe how to put the object back together.
+    """
+    if isinstance(value, np.ndarray):
+        return {'type': 'array', 'file': _write(value, f'{prefix}.npy', directory)}
+
+    from roguewavespectrum import FrequencySpectrum
+
+    if isinstance(value, FrequencySpectrum):
+        description = {'type': 'spectrum'}
+        dataset = value.dataset
+    elif isinstance(value, DataArray):
+        data_name = '__data__' if value.name is None or value.name in value.coords else value.name
+        description = {'type': 'dataarray', 'name': value.name, 'data': data_name}
+        dataset = value.to_dataset(name=data_name)
+    elif isinstance(value, Dataset):
+        description = {'type': 'dataset'}
+        dataset = value
+    else:
+        raise TypeError(f'cannot publish objects of type {type(value).__name__}')
+
+    description['attrs'] = dict(dataset.attrs)
+    description['coords'] = list(dataset.coords)
+    description['variables'] = {}
+    for index, (name, variable) in enumerate(dataset.variables.items()):
+        file_name = _write(variable.values, f'{prefix}-{index}.npy', directory)
+        description['variables'][name] = (variable.dims, file_name, dict(variable.attrs))
+    return description
+
+
+def _write(array, file_name, directory) -> str:
+    array = np.asarray(array)
+    if array.dtype.hasobject:
+        raise TypeError(f'cannot publish arrays of dtype {array.dtype}')
+
+    mapped = np.lib.format.open_memmap(os.path.join(directory, file_name), mode='w+', dtype=array.dtype,
+                                       shape=array.shape)
+    mapped[...] = array
+    mapped.flush()
+    del mapped
+    return file_name
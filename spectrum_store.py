@@ -0,0 +1,166 @@
+"""
+Contents: Time indexed access to the spectra of several kinds (e.g. the reference, target, monotone and natural spectra
+of figure 4) for lookups of individual time steps in long records, e.g.:
+
+    store = SpectrumStore({'reference': './data/spectrum_reference.nc', 'monotone': compact_monotone_spectrum})
+    spectra = store.get(datetime(2022, 9, 24, 7), method='nearest', tolerance=timedelta(minutes=30))
+    spectra['monotone']['frequency'], spectra['monotone']['variance_density']
+
+Every kind keeps a sorted copy of its time axis, so that time steps are found by binary search (O(log n)). As with
+.sel(time=...), lookups are exact by default and raise a KeyError for a time that is not in the record; with
+method='nearest' (and optionally a tolerance) the nearest time step is used. Variance densities are decoded - read from
+a lazily opened netCDF file, evaluated from the spline coefficients of an interpolation.CompactSpectrum, or sliced from
+spectra in memory - in chunks of consecutive time steps, and the most recently used chunks are kept in a small LRU
+cache. Looking up nearby times, or the same time again, therefore does not read or decode any data.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from xarray import Dataset
+import numpy as np
+import xarray
+import interpolation
+import sweep
+
+
+class SpectrumStore:
+    """
+    Time step lookups of the spectra of several kinds at once.
+    """
+
+    def __init__(self, sources: dict, chunk_size=64, maxsize=16):
+        """
+        :param sources: dictionary with for every kind the spectra, as FrequencySpectrum, interpolation.CompactSpectrum,
+            xarray.Dataset (e.g. lazily opened with xarray.open_dataset) or the path to a netCDF file. The spectra must
+            have dimensions time and frequency.
+        :param chunk_size: number of consecutive time steps that are decoded at once.
+        :param maxsize: maximum number of decoded chunks (of all kinds together) that are kept.
+        """
+        self.chunk_size = chunk_size
+        self.chunks = sweep.LRUCache(maxsize=maxsize)
+        self._datasets = []
+
+        self.time = {}
+        self.frequency = {}
+        self._sorted_time = {}
+        self._order = {}
+        self._decoders = {}
+        for kind, source in sources.items():
+            if isinstance(source, str):
+                source = xarray.open_dataset(source)
+                self._datasets.append(source)
+
+            if isinstance(source, interpolation.CompactSpectrum):
+                time = source.spectrum.time.values
+                self.frequency[kind] = source.frequency.values
+                self._decoders[kind] = _compact_decoder(source)
+            else:
+                # A FrequencySpectrum holds its data in a dataset (checked without importing roguewavespectrum).
+                dataset = source if isinstance(source, Dataset) else source.dataset  # type: Dataset
+                time = dataset['time'].values
+                self.frequency[kind] = dataset['frequency'].values
+                self._decoders[kind] = _dataset_decoder(dataset)
+
+            self.time[kind] = time
+            self._order[kind] = np.argsort(time, kind='stable')
+            self._sorted_time[kind] = time[self._order[kind]]
+
+    def close(self):
+        for dataset in self._datasets:
+            dataset.close()
+        self._datasets = []
+        self.chunks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def kinds(self) -> list:
+        return list(self.time)
+
+    def index(self, kind, time, method=None, tolerance=None) -> int:
+        """
+        Index of the time step at the given time, as .sel(time=time, method=method, tolerance=tolerance).
+        :param kind: kind of spectrum
+        :param time: time (datetime, numpy.datetime64, or anything else numpy.datetime64 accepts)
+        :param method: None for an exact match, or 'nearest' for the nearest time step (if two are equally near, the
+            later one).
+        :param tolerance: (optional) largest distance to the nearest time step (timedelta or numpy.timedelta64).
+        :return: index along the time dimension of the source
+        """
+        if method not in (None, 'nearest'):
+            raise ValueError(f'unknown method {method}, expected None or nearest')
+
+        sorted_time = self._sorted_time[kind]
+        time = np.datetime64(time, 'ns')
+        position = np.searchsorted(sorted_time, time, side='left')
+        if method is None:
+            if position == len(sorted_time) or sorted_time[position] != time:
+                raise KeyError(f'{time} is not a time step of the {kind} spectra')
+            return int(self._order[kind][position])
+
+        if position == len(sorted_time) or (position > 0 and
+                                            time - sorted_time[position - 1] < sorted_time[position] - time):
+            position -= 1
+        if tolerance is not None and abs(sorted_time[position] - time) > np.timedelta64(tolerance, 'ns'):
+            raise KeyError(f'the {kind} spectra have no time step within {tolerance} of {time}')
+        return int(self._order[kind][position])
+
+    def get(self, time, kinds=None, method=None, tolerance=None) -> dict:
+        """
+        Spectra of all (or the given) kinds at the given time.
+        :param time: time
+        :param kinds: kinds of spectra (all if None)
+        :param method: None for an exact match, or 'nearest' for the nearest time step (see index).
+        :param tolerance: (optional) largest distance to the nearest time step (see index).
+        :return: dictionary with for every kind a dictionary with the time, frequency and variance_density of the
+            spectrum.
+        """
+        if kinds is None:
+            kinds = self.kinds
+
+        spectra = {}
+        for kind in kinds:
+            index = self.index(kind, time, method, tolerance)
+            chunk, offset = divmod(index, self.chunk_size)
+            variance_density = self.chunks.get(
+                (kind, chunk), lambda: self._decoders[kind](chunk * self.chunk_size, (chunk + 1) * self.chunk_size))
+            spectra[kind] = {'time': self.time[kind][index], 'frequency': self.frequency[kind],
+                             'variance_density': variance_density[offset]}
+        return spectra
+
+
+def _dataset_decoder(dataset):
+    """
+    Decoder of chunks of time steps of a dataset: only the requested time steps are read (or sliced).
+    """
+    variance_density = dataset['variance_density'].transpose('time', 'frequency')
+
+    def decode(start, stop):
+        return variance_density[start:stop].values
+
+    return decode
+
+
+def _compact_decoder(spectrum: interpolation.CompactSpectrum):
+    """
+    Decoder of chunks of time steps of a compact spectrum: the high resolution spectra are evaluated from the spline
+    coefficients of the requested time steps only.
+    """
+    def decode(start, stop):
+        return spectrum.plan.evaluate(spectrum.coefficients[start:stop],
+                                      extrapolate=not spectrum.monotone_interpolation)
+
+    return decode
@@ -0,0 +1,140 @@
+"""
+Contents: Closed form estimate of the continuous peak frequency/period from the spline interpolation of the cumulative
+distribution function. The cumulative distribution is represented on each frequency bin by a cubic polynomial
+
+    cdf(t) = a t**3 + b t**2 + c t + d,       with t = f - f_i and 0 <= t <= f_(i+1) - f_i,
+
+so that the variance density is the quadratic 3 a t**2 + 2 b t + c. The maxima of the density are therefore either
+at t = -b / (3 a) inside a bin (if a < 0), or at a bin edge where the slope of the density changes sign. We evaluate
+these candidates for all bins and all spectra at once directly from the spline coefficients, so that the cost is
+proportional to the number of (coarse) bins and no resampling or per-spectrum root finding is needed.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from typing import TYPE_CHECKING
+import numpy as np
+import profiling
+
+if TYPE_CHECKING:
+    from roguewavespectrum import FrequencySpectrum
+    from xarray import DataArray
+
+
+@profiling.timed('peak_period')
+def peak_frequency_from_coefficients(knots, coefficients):
+    """
+    Find the frequency at which the density (derivative of the cdf spline) obtains its largest local maximum.
+    :param knots: bin edges of the spline, shape (nseg+1,)
+    :param coefficients: spline coefficients [a, b, c(, d)] of the cdf, shape (3 or 4, nseg, ...) (as in scipy
+        CubicSpline.c)
+    :return: peak frequencies, shape (...)
+    """
+    shape = coefficients.shape[2:]
+    number_of_segments = coefficients.shape[1]
+
+    # (4, nseg, ...) -> (4, n, nseg)
+    coefficients = np.moveaxis(np.reshape(coefficients, (coefficients.shape[0], number_of_segments, -1)), 1, 2)
+    a, b, c = coefficients[0], coefficients[1], coefficients[2]
+    width = np.diff(knots)
+
+    # Density at the bin edges
+    density_left = c
+    density_right = 3 * a * width ** 2 + 2 * b * width + c
+
+    # Stationary points within a bin that are maxima.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = -b / (3 * a)
+        is_maximum = (a < 0) & (offset > 0) & (offset < width)
+        stationary_value = np.where(is_maximum, c - b ** 2 / (3 * a), -np.inf)
+    stationary_location = knots[:-1] + np.where(is_maximum, offset, 0.0)
+
+    # Interior bin edges where the slope of the density changes sign from positive to negative.
+    slope_left = 6 * a[:, :-1] * width[:-1] + 2 * b[:, :-1]
+    slope_right = 2 * b[:, 1:]
+    is_maximum = (slope_left >= 0) & (slope_right <= 0) & ~((slope_left == 0) & (slope_right == 0))
+    edge_value = np.where(is_maximum, density_left[:, 1:], -np.inf)
+
+    # Interleave candidates in order of increasing frequency so that ties resolve to the lowest frequency.
+    number_of_spectra = a.shape[0]
+    values = np.full((number_of_spectra, 2 * number_of_segments - 1), -np.inf)
+    values[:, 0::2] = stationary_value
+    values[:, 1::2] = edge_value
+    locations = np.empty_like(values)
+    locations[:, 0::2] = stationary_location
+    locations[:, 1::2] = knots[1:-1]
+
+    index = np.argmax(values, axis=-1)
+    spectra = np.arange(number_of_spectra)
+    peak_frequency = locations[spectra, index]
+
+    # Spectra without a local maximum (e.g. monotone or zero spectra): use the largest value at the bin edges.
+    no_maximum = ~np.isfinite(values[spectra, index])
+    if np.any(no_maximum):
+        edge_values = np.concatenate((density_left, density_right[:, -1:]), axis=-1)
+        peak_frequency[no_maximum] = knots[np.argmax(edge_values[no_maximum, :], axis=-1)]
+
+    return np.reshape(peak_frequency, shape)
+
+
+def spline_peak_frequency(frequency, frequency_spectrum, monotone_interpolation=True,
+                          solver='roguewavespectrum') -> np.ndarray:
+    """
+    Estimate the peak frequency of the spectrum based on a cubic spline interpolation of the partially integrated
+    variance. Drop in replacement for roguewavespectrum.spectrum.spline_interpolation.spline_peak_frequency.
+    :param frequency: Frequencies of the spectrum. Shape = ( nf, )
+    :param frequency_spectrum: Frequency Variance density spectrum. Shape = ( ..., nf )
+    :param monotone_interpolation: Use a monotone spline (True) or a natural spline (False)
+    :param solver: solver of the monotone spline: 'roguewavespectrum' or 'banded' (MonotoneSplineSolver.fit, compiled
+        if Numba is installed); see monotone_spline.SOLVERS.
+    :return: peak frequencies. Shape = ( ..., )
+    """
+    frequency_spectrum = np.asarray(frequency_spectrum)
+    shape = frequency_spectrum.shape[:-1]
+    frequency_spectrum = np.reshape(frequency_spectrum, (-1, len(frequency)))
+
+    if monotone_interpolation and solver != 'roguewavespectrum':
+        # Imported here: interpolation and monotone_spline import this module.
+        import interpolation
+        import monotone_spline
+
+        monotone_spline.check_solver(solver)
+        plan = interpolation.get_plan(frequency, frequency)
+        frequency_spectrum = np.where(np.isnan(frequency_spectrum), 0.0, frequency_spectrum)
+        with profiling.stage('interpolate_frequency'):
+            _, peak_frequency = plan.monotone_solver.fit(frequency_spectrum, plan.binwidth)
+        return np.reshape(peak_frequency, shape)
+
+    from roguewavespectrum.spectrum.spline_interpolation import _cdf_interpolate_spline
+
+    with profiling.stage('interpolate_frequency'):
+        spline = _cdf_interpolate_spline(frequency, frequency_spectrum, monotone_interpolation)
+    return np.reshape(peak_frequency_from_coefficients(spline.x, spline.c), shape)
+
+
+def peak_period(spectrum: 'FrequencySpectrum', monotone_interpolation=True, solver='roguewavespectrum') -> 'DataArray':
+    """
+    Continuous peak period of the spectrum. Drop in replacement for
+    spectrum.peak_period(use_spline=True, monotone_interpolation=...).
+    :param spectrum: spectrum
+    :param monotone_interpolation: Use a monotone spline (True) or a natural spline (False)
+    :param solver: solver of the monotone spline (see spline_peak_frequency)
+    :return: peak period
+    """
+    from xarray import DataArray
+
+    frequency_spectrum = spectrum.e.values
+    if spectrum.dims[-1] != 'frequency':
+        frequency_spectrum = np.moveaxis(frequency_spectrum, spectrum.dims.index('frequency'), -1)
+
+    data = 1 / spline_peak_frequency(spectrum.frequency.values, frequency_spectrum, monotone_interpolation, solver)
+    return DataArray(data=data, coords=spectrum.coords_space_time, dims=spectrum.dims_space_time, name='peak period')
@@ -0,0 +1,553 @@
+"""
+Contents: Vectorized routines to calculate peak periods for sweeps over parametric spectra. Instead of creating a
+FrequencySpectrum object for every (standard deviation, peak frequency) pair, all spectra in a sweep are created as a
+single array of variance densities, downsampled in one call, and peak periods are estimated for all of them at once.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import json
+import os
+import warnings
+from typing import TYPE_CHECKING
+import profiling
+import spline_peak
+
+if TYPE_CHECKING:
+    from roguewavespectrum import FrequencySpectrum
+
+# Default location of the checkpointed sweep results (see SweepStore).
+SWEEP_DIRECTORY = './data/sweep'
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache that keeps track of its hit/miss statistics. The cache is bounded by the number of
+    entries and/or by the memory of the arrays they hold (numpy arrays, or the data of spectra), so that it can hold a
+    complete sweep over fine frequency grids without an unbounded memory footprint. A memory bound requires entries that
+    are numpy arrays or spectra.
+    """
+
+    def __init__(self, maxsize=None, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, create):
+        """
+        Get the entry for the given key, calling create() to calculate it if it is not cached.
+        :param key: hashable key
+        :param create: function without arguments that creates the entry
+        :return: entry
+        """
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        entry = create()
+        self._entries[key] = entry
+        if self.maxbytes is not None:
+            self.nbytes += _nbytes(entry)
+        while len(self._entries) > 1 and (
+                (self.maxsize is not None and len(self._entries) > self.maxsize) or
+                (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            _, evicted = self._entries.popitem(last=False)
+            if self.maxbytes is not None:
+                self.nbytes -= _nbytes(evicted)
+        return entry
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def statistics(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize,
+                'nbytes': self.nbytes, 'maxbytes': self.maxbytes}
+
+
+def _nbytes(entry) -> int:
+    if isinstance(entry, np.ndarray):
+        return entry.nbytes
+    return int(entry.dataset.nbytes)
+
+
+def _read_only(entry):
+    """
+    Make the arrays of a cache entry (numpy array or spectrum) read-only, so that callers that share them cannot
+    change the cached values in place.
+    :param entry: numpy array or spectrum
+    :return: the entry
+    """
+    if isinstance(entry, np.ndarray):
+        entry.setflags(write=False)
+    else:
+        for variable in entry.dataset.variables.values():
+            if isinstance(variable.data, np.ndarray):
+                variable.data.setflags(write=False)
+    return entry
+
+
+# Cache of parametric (and downsampled parametric) spectra, shared by all routines in this module. Entries are
+# read-only. Bounded by memory: a figure 3 sweep (606 spectra on a fine grid of 4901 frequencies) takes about 24 MB.
+spectrum_cache = LRUCache(maxbytes=512 * 2 ** 20)
+
+
+def grid_key(frequencies) -> str:
+    """
+    Hash of a frequency grid, used in the keys of the spectrum cache.
+    :param frequencies: frequencies
+    :return: hex digest
+    """
+    return hashlib.sha1(np.ascontiguousarray(frequencies, dtype='float64').tobytes()).hexdigest()
+
+
+def parametric_spectrum(frequencies, peak_frequency, kind='gaussian', standard_deviation=0.0) -> 'FrequencySpectrum':
+    """
+    Cached version of create_parametric_frequency_spectrum (with unit significant wave height).
+    :param frequencies: frequencies to evaluate the spectrum at
+    :param peak_frequency: peak frequency
+    :param kind: jonswap, pm or gaussian
+    :param standard_deviation: standard deviation of gaussian distribution (N/A for jonswap/pm)
+    :return: spectrum (a shallow copy of the cached spectrum; its arrays are read-only)
+    """
+    from roguewavespectrum.parametric import create_parametric_frequency_spectrum
+
+    key = ('spectrum', grid_key(frequencies), kind, float(peak_frequency), float(standard_deviation))
+    spectrum = spectrum_cache.get(key, lambda: _read_only(create_parametric_frequency_spectrum(
+        frequencies, peak_frequency, 1, kind, standard_deviation_hertz=standard_deviation)))
+    return spectrum.copy(deep=False)
+
+
+def downsampled_parametric_spectrum(frequencies, sampled_frequencies, peak_frequency, kind='gaussian',
+                                    standard_deviation=0.0) -> 'FrequencySpectrum':
+    """
+    Cached version of parametric_spectrum(...).downsample(sampled_frequencies).
+    :param frequencies: frequencies to evaluate the spectrum at
+    :param sampled_frequencies: frequencies to downsample to
+    :param peak_frequency: peak frequency
+    :param kind: jonswap, pm or gaussian
+    :param standard_deviation: standard deviation of gaussian distribution (N/A for jonswap/pm)
+    :return: downsampled spectrum (a shallow copy of the cached spectrum; its arrays are read-only)
+    """
+    key = ('downsampled', grid_key(frequencies), grid_key(sampled_frequencies), kind, float(peak_frequency),
+           float(standard_deviation))
+    def create():
+        spectrum = parametric_spectrum(frequencies, peak_frequency, kind, standard_deviation)
+        # Timed as the vectorized downsample below, so that profiles of figures 1-2 include it.
+        with profiling.stage('downsample'):
+            return _read_only(spectrum.downsample(sampled_frequencies))
+
+    spectrum = spectrum_cache.get(key, create)
+    return spectrum.copy(deep=False)
+
+
+def frequency_binwidth(frequencies):
+    """
+    Bin width of each frequency, taken as the average of the up- and downwind differences. Identical to
+    FrequencySpectrum.frequency_binwidth.
+    :param frequencies: frequencies, shape (nf,)
+    :return: bin widths, shape (nf,)
+    """
+    diff = np.diff(frequencies, append=2 * frequencies[-1] - frequencies[-2],
+                   prepend=2 * frequencies[0] - frequencies[1])
+    return diff[0:-1] * 0.5 + diff[1:] * 0.5
+
+
+def integration_frequencies(frequencies):
+    """
+    Edges of the frequency bins, i.e. the frequencies at which the cumulative distribution is defined.
+    :param frequencies: frequencies, shape (nf,)
+    :return: bin edges, shape (nf+1,)
+    """
+    frequency_step = frequency_binwidth(frequencies)
+    edges = np.concatenate(([0], np.cumsum(frequency_step)))
+    return edges - frequency_step[0] / 2 + frequencies[0]
+
+
+def frequency_shape_values(frequencies, peak_frequencies, standard_deviations, kind='gaussian', m0=1.0):
+    """
+    Values of the frequency shapes of roguewavespectrum.parametric for all combinations of standard deviation and peak
+    frequency at once. Vectorized equivalent of create_frequency_shape(kind, peak_frequency, m0,
+    standard_deviation_hertz=standard_deviation).values(frequencies); the operations are done in the same order, so
+    that the values are identical.
+    :param frequencies: frequencies to evaluate the shapes at, shape (nf,)
+    :param peak_frequencies: peak frequencies, shape (nfp,)
+    :param standard_deviations: standard deviation of gaussian distribution (N/A for jonswap/pm/phillips), shape (nsd,)
+    :param kind: jonswap, pm, phillips or gaussian
+    :param m0: variance of the spectra
+    :return: values, shape (nsd, nfp, nf); (1, nfp, nf) for the shapes that do not depend on the standard deviation
+    """
+    from roguewavespectrum.parametric import GRAVITATIONAL_CONSTANT as g
+
+    frequencies = np.asarray(frequencies, dtype='float64')
+    peak_frequency = np.asarray(peak_frequencies, dtype='float64')[:, None]
+    standard_deviation = np.asarray(standard_deviations, dtype='float64')[:, None, None]
+
+    if kind == 'gaussian':
+        if np.any(standard_deviation == 0):
+            raise ValueError('the standard deviation of a gaussian spectrum must be nonzero')
+        return (m0 / standard_deviation / np.sqrt(2 * np.pi) *
+                np.exp(-0.5 * (frequencies - peak_frequency) ** 2 / standard_deviation ** 2))
+
+    # The energy scale is calculated per peak frequency with scalar arithmetic, as numpy's vectorized power may differ
+    # from the scalar one in the last bit.
+    gamma = 3.3
+    if kind == 'pm':
+        alpha = [m0 * 5 * (2 * np.pi * value) ** 4 / g ** 2 for value in peak_frequency[:, 0]]
+    elif kind == 'jonswap':
+        alpha = [m0 * (2 * np.pi * value) ** 4 / g ** 2 / (0.06533 * gamma ** 0.8015 + 0.13467)
+                 for value in peak_frequency[:, 0]]
+    elif kind == 'phillips':
+        alpha = [m0 * 8 * np.pi ** 4 * value ** 4 / g ** 2 for value in peak_frequency[:, 0]]
+    else:
+        raise ValueError(f'Unknown frequency shape: {kind}')
+    alpha = np.array(alpha)[:, None]
+
+    # The shapes are zero at (and below) zero frequency, and do not depend on the standard deviation.
+    mask = frequencies > 0
+    positive = frequencies[mask]
+    values = np.zeros((peak_frequency.shape[0], len(frequencies)))
+    values[:, mask] = alpha * g ** 2 * (2 * np.pi) ** -4 * positive ** -5
+    if kind in ('pm', 'jonswap'):
+        values[:, mask] *= np.exp(-5 / 4 * (peak_frequency / positive) ** 4)
+    if kind == 'jonswap':
+        sigma = np.where(frequencies <= peak_frequency, 0.07, 0.09)
+        peak_enhancement = gamma ** np.exp(-1 / 2 * ((frequencies / peak_frequency - 1) / sigma) ** 2)
+        values[:, mask] *= peak_enhancement[:, mask]
+    return values[None, :, :]
+
+
+def parametric_variance_density(frequencies, peak_frequencies, standard_deviations, kind='gaussian',
+                                significant_wave_height=1):
+    """
+    Variance densities of the parametric spectra for all combinations of standard deviation and peak frequency. The
+    values are identical to those of the FrequencySpectrum returned by create_parametric_frequency_spectrum.
+    :param frequencies: frequencies to evaluate the spectra at, shape (nf,)
+    :param peak_frequencies: peak frequencies, shape (nfp,)
+    :param standard_deviations: standard deviation of gaussian distribution (N/A for jonswap/pm), shape (nsd,)
+    :param kind: jonswap, pm or gaussian
+    :param significant_wave_height: significant wave height of the spectra
+    :return: variance densities, shape (nsd, nfp, nf)
+    """
+    from roguewavespectrum.parametric import create_directional_shape
+
+    # create_parametric_frequency_spectrum integrates a raised cosine directional distribution (default settings) to
+    # obtain the 1D spectrum. We do the same so that the results are identical to the last bit.
+    directions = np.linspace(0, 360, 36, endpoint=False)
+    directional_distribution = create_directional_shape('raised_cosine').values(directions)
+    direction_step = (np.diff(directions, append=directions[0]) + 180) % 360 - 180
+
+    m0 = (significant_wave_height / 4) ** 2
+    frequency_grid = grid_key(frequencies)
+    keys = [[('variance_density', frequency_grid, kind, float(peak_frequency), float(standard_deviation),
+              float(significant_wave_height)) for peak_frequency in peak_frequencies]
+            for standard_deviation in standard_deviations]
+
+    variance_density = np.zeros((len(standard_deviations), len(peak_frequencies), len(frequencies)))
+    if all(key in spectrum_cache for row in keys for key in row):
+        for ind_sd, row in enumerate(keys):
+            for ind_fp, key in enumerate(row):
+                variance_density[ind_sd, ind_fp, :] = spectrum_cache.get(key, None)
+        return variance_density
+
+    # Integrate over the directions in blocks of samples, so that the products of the frequency shapes and the
+    # directional distribution stay small (the integration is limited by memory bandwidth, not by arithmetic).
+    shape_values = frequency_shape_values(frequencies, peak_frequencies, standard_deviations, kind, m0)
+    samples = shape_values.reshape(-1)
+    density = np.empty_like(samples)
+    block_size = 2 ** 16 // len(directions)
+    for start in range(0, len(samples), block_size):
+        block = slice(start, start + block_size)
+        # Same order of operations as FrequencyDirectionSpectrum: (E * D) * step, not E * (D * step).
+        density[block] = np.nansum(samples[block, None] * directional_distribution * direction_step, axis=-1)
+    variance_density[...] = density.reshape(shape_values.shape)
+
+    for ind_sd, row in enumerate(keys):
+        for ind_fp, key in enumerate(row):
+            spectrum_cache.get(key, lambda: _read_only(variance_density[ind_sd, ind_fp, :].copy()))
+    return variance_density
+
+
+@profiling.timed('downsample')
+def downsample(variance_density, frequencies, sampled_frequencies):
+    """
+    Downsample variance densities by sampling the cumulative distribution at the bin edges of the coarse frequencies.
+    Vectorized equivalent of FrequencySpectrum.downsample for the variance density.
+    :param variance_density: variance densities, shape (..., nf)
+    :param frequencies: frequencies of the variance densities, shape (nf,)
+    :param sampled_frequencies: frequencies to downsample to, shape (ns,)
+    :return: downsampled variance densities, shape (..., ns)
+    """
+    import pandas
+
+    cumsum = np.cumsum(variance_density * frequency_binwidth(frequencies), axis=-1)
+    cdf = np.concatenate((np.zeros(cumsum.shape[:-1] + (1,)), cumsum), axis=-1)
+
+    # Nearest neighbour lookup of the coarse bin edges in the fine bin edges (as in xarray .sel(method='nearest'))
+    index = pandas.Index(integration_frequencies(frequencies)).get_indexer(
+        integration_frequencies(sampled_frequencies), method='nearest')
+
+    return np.diff(cdf[..., index], axis=-1) / frequency_binwidth(sampled_frequencies)
+
+
+def peak_period(variance_density, frequencies, use_spline=False, **kwargs):
+    """
+    Peak period of the given variance densities. Vectorized equivalent of FrequencySpectrum.peak_period.
+    :param variance_density: variance densities, shape (..., nf)
+    :param frequencies: frequencies of the variance densities, shape (nf,)
+    :param use_spline: use a spline based interpolation to determine a continuous peak period.
+    :param kwargs: kwargs passed to spline_peak.spline_peak_frequency (e.g. monotone_interpolation)
+    :return: peak periods, shape (...)
+    """
+    if not use_spline:
+        with profiling.stage('peak_period'):
+            return 1 / frequencies[np.argmax(variance_density, axis=-1)]
+
+    return 1 / spline_peak.spline_peak_frequency(frequencies, variance_density, **kwargs)
+
+
+def get_periods(peak_frequencies, standard_deviations, interpolated_frequencies, sampled_frequencies,
+                kind='gaussian', solver='roguewavespectrum'):
+    """
+    Calculate peak periods for the different methods based on width/type of spectrum for all combinations of standard
+    deviation and peak frequency at once.
+    :param peak_frequencies: peak frequencies of the true distribution
+    :param standard_deviations: standard deviation of gaussian distribution (N/A for jonswap)
+    :param interpolated_frequencies: high resolution frequencies the true distribution is evaluated at.
+    :param sampled_frequencies: coarse frequencies we sample the distribution at.
+    :param kind: jonswap, pm or gaussian
+    :param solver: solver of the monotone spline (see spline_peak.spline_peak_frequency)
+    :return: dictionary with peak periods (and errors) of shape (len(standard_deviations), len(peak_frequencies))
+    """
+    interpolated_frequencies = np.asarray(interpolated_frequencies)
+    sampled_frequencies = np.asarray(sampled_frequencies)
+
+    true_density = parametric_variance_density(interpolated_frequencies, peak_frequencies, standard_deviations, kind)
+    downsampled_density = downsample(true_density, interpolated_frequencies, sampled_frequencies)
+
+    truth = peak_period(true_density, interpolated_frequencies)
+    downsampled = peak_period(downsampled_density, sampled_frequencies)
+    interpolated = peak_period(downsampled_density, sampled_frequencies, use_spline=True, solver=solver)
+    natural = peak_period(downsampled_density, sampled_frequencies, use_spline=True, monotone_interpolation=False)
+
+    return {'target': truth, 'downsampled_error': np.abs(downsampled - truth) / truth,
+            'interpolated_error': np.abs(interpolated - truth) / truth, 'downsampled': downsampled,
+            'monotone': interpolated, 'natural': natural}
+
+
+class SweepStore:
+    """
+    Checkpointed store of sweep results. Results are kept per cell - a (kind, standard deviation) pair - in a directory
+    of netCDF files, one file per chunk of peak frequencies, with the peak frequency as coordinate. A chunk is written
+    (atomically) as soon as it is calculated, so an interrupted sweep loses at most the chunks that were in progress,
+    and a sweep over more peak frequencies or standard deviations only calculates the missing ones. The chunks of a
+    cell are merged into a single file when the cell is read, so that reloading a finished sweep reads one file per
+    cell.
+
+    The name of a cell directory is a hash of the kind, the standard deviation, the frequency grids, the monotone spline
+    solver and the source of the sweep code (this module and spline_peak), so that results of different grids, solvers
+    or code are never mixed.
+    """
+
+    def __init__(self, interpolated_frequencies, sampled_frequencies, directory=SWEEP_DIRECTORY,
+                 solver='roguewavespectrum'):
+        """
+        :param interpolated_frequencies: high resolution frequencies the true distribution is evaluated at.
+        :param sampled_frequencies: coarse frequencies we sample the distribution at.
+        :param directory: directory of the store
+        :param solver: solver of the monotone spline the results are calculated with (see get_periods)
+        """
+        import cache
+
+        self.directory = directory
+        self.solver = solver
+        self._description = {
+            'interpolated_frequencies': grid_key(interpolated_frequencies),
+            'sampled_frequencies': grid_key(sampled_frequencies),
+            'code': [cache.file_hash(__file__), cache.file_hash(spline_peak.__file__)],
+        }
+        if solver != 'roguewavespectrum':
+            # Results of the default solver keep the cell directories they had before the solver option was added.
+            self._description['solver'] = solver
+
+    def cell_directory(self, kind, standard_deviation) -> str:
+        description = dict(self._description, kind=kind, standard_deviation=float(standard_deviation))
+        key = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, f'{kind}-{key[:32]}')
+
+    def load(self, kind, standard_deviation):
+        """
+        Load the results of a cell (and merge its chunk files). Files that cannot be read are removed.
+        :param kind: jonswap, pm or gaussian
+        :param standard_deviation: standard deviation of the gaussian distribution
+        :return: dataset with the results as function of peak_frequency, or None if nothing was calculated yet.
+        """
+        import xarray
+
+        directory = self.cell_directory(kind, standard_deviation)
+        if not os.path.isdir(directory):
+            return None
+
+        paths = []
+        chunks = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.endswith('.nc'):
+                continue
+            try:
+                with xarray.open_dataset(path) as dataset:
+                    chunks.append(dataset.load())
+            except Exception as error:
+                warnings.warn(f'Removing unreadable sweep chunk {path}: {error}')
+                os.remove(path)
+            else:
+                paths.append(path)
+
+        if not chunks:
+            return None
+
+        dataset = xarray.concat(chunks, dim='peak_frequency')
+        _, unique = np.unique(dataset['peak_frequency'].values, return_index=True)
+        dataset = dataset.isel(peak_frequency=unique)
+
+        if len(chunks) > 1:
+            # Write the merged chunk before removing the others; should we be interrupted in between the duplicates
+            # are dropped on the next load.
+            merged_path = self._save(directory, dataset)
+            for path in paths:
+                if path != merged_path:
+                    os.remove(path)
+        return dataset
+
+    def save(self, kind, standard_deviation, peak_frequencies, periods):
+        """
+        Store the results of a chunk.
+        :param kind: jonswap, pm or gaussian
+        :param standard_deviation: standard deviation of the gaussian distribution
+        :param peak_frequencies: peak frequencies of the chunk, shape (n,)
+        :param periods: dictionary returned by get_periods for the chunk (arrays of shape (1, n))
+        :return: None
+        """
+        import xarray
+
+        dataset = xarray.Dataset(
+            data_vars={name: ('peak_frequency', np.asarray(value)[0, :]) for name, value in periods.items()},
+            coords={'peak_frequency': np.asarray(peak_frequencies, dtype='float64')}
+        )
+        self._save(self.cell_directory(kind, standard_deviation), dataset)
+
+    @staticmethod
+    def _save(directory, dataset) -> str:
+        import cache
+
+        os.makedirs(directory, exist_ok=True)
+        name = grid_key(dataset['peak_frequency'].values)
+        path = os.path.join(directory, f'chunk-{name}.nc')
+        cache.write_atomically(path, dataset.to_netcdf)
+        return path
+
+
+def get_data(peak_frequencies, frequency_width, interpolated_frequencies, sampled_frequencies, max_workers=None,
+             chunk_size=16, store: SweepStore = None, solver='roguewavespectrum'):
+    """
+    Calculate the peak periods for the gaussian, jonswap and pm sweeps of figure 3. The (kind, standard deviation, peak
+    frequency) grid is split into chunks of at most chunk_size peak frequencies that are evaluated in parallel on a
+    process pool. Results do not depend on the chunks (every spectrum is processed independently), so neither do they
+    depend on the number of workers or on what was already stored.
+    :param peak_frequencies: peak frequencies of the true distribution
+    :param frequency_width: standard deviations of the gaussian distributions
+    :param interpolated_frequencies: high resolution frequencies the true distribution is evaluated at.
+    :param sampled_frequencies: coarse frequencies we sample the distribution at.
+    :param max_workers: number of worker processes. If 1 the sweep is run in the current process, if None the number
+        of processors on the machine is used.
+    :param chunk_size: maximum number of peak frequencies in a chunk.
+    :param store: (optional) SweepStore; only peak frequencies that are not in the store are calculated, and every
+        chunk is added to the store as soon as it is done.
+    :param solver: solver of the monotone spline (see get_periods); must be the solver of the store.
+    :return: dictionary with for each kind the dictionary returned by get_periods.
+    """
+    import xarray
+
+    if store is not None and store.solver != solver:
+        raise ValueError(f'the store holds results of the {store.solver} solver, not of the {solver} solver')
+
+    peak_frequencies = np.asarray(peak_frequencies, dtype='float64')
+    standard_deviations = {'gaussian': frequency_width, 'jonswap': [0.0], 'pm': [0.0]}
+
+    # Results per cell as function of the peak frequency: stored ones first, calculated chunks are added below.
+    cells = {}
+    tasks = []
+    for kind, kind_standard_deviations in standard_deviations.items():
+        for standard_deviation in kind_standard_deviations:
+            cell = (kind, float(standard_deviation))
+            stored = store.load(kind, standard_deviation) if store is not None else None
+            cells[cell] = [] if stored is None else [stored]
+
+            missing = peak_frequencies
+            if stored is not None:
+                missing = peak_frequencies[~np.isin(peak_frequencies, stored['peak_frequency'].values)]
+
+            for start in range(0, len(missing), chunk_size):
+                tasks.append((kind, standard_deviation, missing[start:start + chunk_size]))
+
+    def _arguments(task):
+        kind, standard_deviation, chunk = task
+        return chunk, [standard_deviation], interpolated_frequencies, sampled_frequencies, kind, solver
+
+    def _add(task, result):
+        kind, standard_deviation, chunk = task
+        if store is not None:
+            store.save(kind, standard_deviation, chunk, result)
+        cells[(kind, float(standard_deviation))].append(xarray.Dataset(
+            data_vars={name: ('peak_frequency', value[0, :]) for name, value in result.items()},
+            coords={'peak_frequency': chunk}))
+
+    if max_workers == 1 or not tasks:
+        for task in tasks:
+            _add(task, get_periods(*_arguments(task)))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(get_periods, *_arguments(task)): task for task in tasks}
+            for future in as_completed(futures):
+                _add(futures[future], future.result())
+
+    # Put the cells back together
+    data = {}
+    for kind, kind_standard_deviations in standard_deviations.items():
+        for ind_sd, standard_deviation in enumerate(kind_standard_deviations):
+            cell = xarray.concat(cells[(kind, float(standard_deviation))], dim='peak_frequency')
+            _, unique = np.unique(cell['peak_frequency'].values, return_index=True)
+            cell = cell.isel(peak_frequency=unique).sel(peak_frequency=peak_frequencies)
+
+            if kind not in data:
+                shape = (len(kind_standard_deviations), len(peak_frequencies))
+                data[kind] = {str(name): np.zeros(shape) for name in cell.data_vars}
+
+            for name in cell.data_vars:
+                data[kind][str(name)][ind_sd, :] = cell[name].values
+
+    return data
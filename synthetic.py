@@ -0,0 +1,216 @@
+"""
+Contents: Generator of synthetic spectrum archives for stress tests: multi-year records of any number of stations, one
+netCDF file per station in the layout of spectrum_reference.nc (variance_density, a1, b1, a2, b2 as function of time
+and frequency; depth, latitude and longitude as function of time), e.g.:
+
+    paths = generate_archive('./data/synthetic', stations=8, years=2)
+    fleet_bulk, failures = fleet.process_fleet('./data/synthetic')
+
+Every spectrum is the sum of a swell and a wind sea partition (each optional, with a configurable frequency shape).
+The partitions are created as in roguewavespectrum.parametric.create_parametric_frequency_spectrum - a frequency shape
+times a raised cosine directional distribution, integrated over 36 directions - but without setting up a 2D spectrum
+object for every time step, which would take hours for long records. The wave height, peak frequency and mean direction
+of each partition follow slowly varying random processes with a seasonal cycle; optionally the variance density is
+perturbed with the chi-squared sampling noise of a spectral estimate with the given degrees of freedom.
+
+Records are generated and written in blocks of time steps, so memory use does not depend on the length of the record.
+The generation settings are stored as attribute of the file, and existing files with the same settings are reused.
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from roguewavespectrum.parametric import create_directional_shape, create_frequency_shape
+from scipy.signal import lfilter
+import netCDF4
+import numpy as np
+import json
+import os
+import cache
+
+# Frequencies of the synthetic spectra: those of spectrum_reference.nc
+FREQUENCY = np.linspace(0.0, 1.25, 128, endpoint=False)
+
+# Directions the directional distribution is integrated over (as create_parametric_frequency_direction_spectrum)
+DIRECTIONS = np.linspace(0, 360, 36, endpoint=False)
+
+# Number of time steps that are generated and written at once.
+BLOCK_SIZE = 2048
+
+# Bump if the generated data changes for the same settings; existing files are then regenerated.
+GENERATOR_VERSION = 1
+
+
+def partition_moments(mean_direction_degrees, width_degrees=30):
+    """
+    Directional integral and moments (a1, b1, a2, b2) of the raised cosine distribution of a partition.
+    :param mean_direction_degrees: mean direction
+    :param width_degrees: directional width (Kuik)
+    :return: integral of the distribution over the directions, and the moments (a1, b1, a2, b2)
+    """
+    distribution = create_directional_shape('raised_cosine', mean_direction_degrees=mean_direction_degrees,
+                                            width_degrees=width_degrees).values(DIRECTIONS)
+    direction_step = (np.diff(DIRECTIONS, append=DIRECTIONS[0]) + 180) % 360 - 180
+    weights = distribution * direction_step
+    total = np.sum(weights)
+
+    radians = np.deg2rad(DIRECTIONS)
+    moments = [np.sum(weights * function(order * radians)) / total
+               for order in (1, 2) for function in (np.cos, np.sin)]
+    return total, moments
+
+
+def partition_parameters(rng, number_of_steps, hours_per_step, start_year_fraction, height, peak_frequency,
+                         frequency_range, direction, time_scale_hours):
+    """
+    Random but plausible series of the wave height, peak frequency and mean direction of a partition: a first order
+    autoregressive process (with the given time scale) around a seasonal cycle, higher in winter.
+    """
+    time_in_years = start_year_fraction + np.arange(number_of_steps) * hours_per_step / 8766
+    seasonal = 1 + 0.3 * np.cos(2 * np.pi * time_in_years)
+
+    def smooth():
+        # AR(1) with unit variance and a correlation time of time_scale_hours.
+        phi = np.exp(-hours_per_step / time_scale_hours)
+        noise = rng.standard_normal(number_of_steps) * np.sqrt(1 - phi ** 2)
+        noise[0] = rng.standard_normal()
+        return lfilter([1.0], [1.0, -phi], noise)
+
+    significant_wave_height = height * seasonal * np.exp(0.4 * smooth())
+    peak_frequencies = np.clip(peak_frequency * np.exp(0.15 * smooth()), *frequency_range)
+    directions = (direction + 25 * smooth()) % 360
+    return significant_wave_height, peak_frequencies, directions
+
+
+def generate_station(path, years=1.0, start='2022-01-01T00:00', hours_per_step=1.0, swell_shape='gaussian',
+                     wind_sea_shape='jonswap', swell_height=1.5, wind_sea_height=1.0, degrees_of_freedom=32,
+                     depth=1000.0, latitude=37.0, longitude=-123.0, seed=0) -> str:
+    """
+    Generate the spectrum record of a single station.
+    :param path: netCDF file to write (an existing file with the same settings is reused)
+    :param years: length of the record in years
+    :param start: time of the first spectrum
+    :param hours_per_step: time between spectra in hours
+    :param swell_shape: frequency shape of the swell partition ('gaussian', 'jonswap', 'pm'), or None for no swell
+    :param wind_sea_shape: frequency shape of the wind sea partition, or None for no wind sea
+    :param swell_height: typical significant wave height of the swell (m)
+    :param wind_sea_height: typical significant wave height of the wind sea (m)
+    :param degrees_of_freedom: degrees of freedom of the spectral estimates for the sampling noise; None for spectra
+        without noise.
+    :param depth: water depth (m)
+    :param latitude: latitude of the station
+    :param longitude: longitude of the station
+    :param seed: seed of the random number generator
+    :return: path
+    """
+    settings = {'generator': GENERATOR_VERSION, 'years': years, 'start': start, 'hours_per_step': hours_per_step,
+                'swell_shape': swell_shape, 'wind_sea_shape': wind_sea_shape, 'swell_height': swell_height,
+                'wind_sea_height': wind_sea_height, 'degrees_of_freedom': degrees_of_freedom, 'depth': depth,
+                'latitude': latitude, 'longitude': longitude, 'seed': seed}
+    if os.path.exists(path):
+        try:
+            with netCDF4.Dataset(path) as dataset:
+                if json.loads(dataset.getncattr('synthetic')) == settings:
+                    return path
+        except (OSError, AttributeError, ValueError):
+            pass
+
+    rng = np.random.default_rng(seed)
+    number_of_steps = int(round(years * 8766 / hours_per_step))
+    start_time = np.datetime64(start, 's')
+    start_year_fraction = (start_time - start_time.astype('datetime64[Y]')) / np.timedelta64(8766, 'h')
+
+    partitions = []
+    for shape, height, peak_frequency, frequency_range, direction, time_scale in (
+            (swell_shape, swell_height, 0.07, (0.04, 0.12), 270.0, 96.0),
+            (wind_sea_shape, wind_sea_height, 0.18, (0.1, 0.4), 300.0, 18.0)):
+        if shape is not None:
+            parameters = partition_parameters(rng, number_of_steps, hours_per_step, start_year_fraction, height,
+                                              peak_frequency, frequency_range, direction, time_scale)
+            partitions.append((shape, parameters))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(temporary_path):
+        with netCDF4.Dataset(temporary_path, 'w') as dataset:
+            dataset.setncattr('synthetic', json.dumps(settings))
+            dataset.createDimension('time', number_of_steps)
+            dataset.createDimension('frequency', len(FREQUENCY))
+
+            time_variable = dataset.createVariable('time', 'i8', ('time',))
+            time_variable.units = f'seconds since {start_time}'
+            time_variable.calendar = 'proleptic_gregorian'
+            dataset.createVariable('frequency', 'f8', ('frequency',))[:] = FREQUENCY
+            for name in ('variance_density', 'a1', 'b1', 'a2', 'b2'):
+                dataset.createVariable(name, 'f8', ('time', 'frequency'), fill_value=np.nan)
+            for name in ('depth', 'latitude', 'longitude'):
+                dataset.createVariable(name, 'f8', ('time',), fill_value=np.nan)
+
+            for block_start in range(0, number_of_steps, BLOCK_SIZE):
+                block = slice(block_start, min(block_start + BLOCK_SIZE, number_of_steps))
+                size = block.stop - block.start
+
+                variance_density = np.zeros((size, len(FREQUENCY)))
+                moments = np.zeros((4, size, len(FREQUENCY)))
+                for shape, (significant_wave_height, peak_frequencies, directions) in partitions:
+                    for index, step in enumerate(range(block.start, block.stop)):
+                        m0 = (significant_wave_height[step] / 4) ** 2
+                        total, partition = partition_moments(directions[step])
+                        kwargs = {'standard_deviation_hertz': 0.01} if shape == 'gaussian' else {}
+                        values = create_frequency_shape(shape, peak_frequencies[step], m0, **kwargs).values(FREQUENCY)
+                        density = np.nan_to_num(values) * total
+                        variance_density[index] += density
+                        for moment in range(4):
+                            moments[moment, index] += density * partition[moment]
+
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    moments = moments / variance_density
+                if degrees_of_freedom is not None:
+                    variance_density *= rng.chisquare(degrees_of_freedom, variance_density.shape) / degrees_of_freedom
+
+                seconds = np.arange(block.start, block.stop) * hours_per_step * 3600
+                dataset['time'][block] = np.round(seconds).astype('int64')
+                dataset['variance_density'][block] = variance_density
+                for moment, name in enumerate(('a1', 'b1', 'a2', 'b2')):
+                    dataset[name][block] = moments[moment]
+                dataset['depth'][block] = depth
+                dataset['latitude'][block] = latitude
+                dataset['longitude'][block] = longitude
+
+    cache.write_atomically(path, write)
+    return path
+
+
+def generate_archive(directory, stations=4, years=1.0, max_workers=None, **kwargs) -> list:
+    """
+    Generate the records of a number of stations (in parallel), one file per station.
+    :param directory: directory the files are written to (station_000.nc, station_001.nc, ...)
+    :param stations: number of stations
+    :param years: length of the records in years
+    :param max_workers: number of worker processes. If 1 the stations are generated in the current process, if None
+        the number of processors on the machine is used.
+    :param kwargs: settings of the records (see generate_station); every station gets its own seed and position.
+    :return: paths of the files
+    """
+    seed = kwargs.pop('seed', 0)
+    arguments = []
+    for station in range(stations):
+        station_kwargs = dict(kwargs, years=years, seed=seed + station,
+                              latitude=kwargs.get('latitude', 37.0) + 0.5 * station)
+        arguments.append((os.path.join(directory, f'station_{station:03d}.nc'), station_kwargs))
+
+    if max_workers == 1 or stations == 1:
+        return [generate_station(path, **station_kwargs) for path, station_kwargs in arguments]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(generate_station, path, **station_kwargs) for path, station_kwargs in arguments]
+        return [future.result() for future in futures]
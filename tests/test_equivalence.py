@@ -0,0 +1,172 @@
+"""
+Contents: Equivalence tests of the rewritten calculations: the batched sweep of figure 3 (sweep.py), the closed form
+spline peak (spline_peak.py), the interpolation plan (interpolation.py), the banded monotone spline solver
+(monotone_spline.py), the fused bulk parameters (bulk.py) and the resumable bulk parameter stream (observed_data.py) are
+compared with the roguewavespectrum (or single pass) results they replace, on small synthetic spectra (synthetic.py).
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+import os
+import numpy as np
+import pytest
+import xarray
+import bulk
+import interpolation
+import monotone_spline
+import observed_data
+import spline_peak
+import sweep
+import synthetic
+
+# Small versions of the frequency grids of figure 3 (refinement 10 instead of 100).
+SAMPLED_FREQUENCIES = np.linspace(0.01, 0.5, 50)
+INTERPOLATED_FREQUENCIES = np.linspace(0.01, 0.5, 491)
+PEAK_FREQUENCIES = np.linspace(0.05, 0.15, 3)
+
+# The banded solver solves the same quadratic program as roguewavespectrum with a different algorithm; the peak periods
+# agree to within the tolerance of the solvers.
+SOLVER_TOLERANCE = 1e-3
+
+# Number of spectra of the synthetic station; the solver of roguewavespectrum takes O(0.1) s per spectrum.
+NUMBER_OF_SPECTRA = 6
+
+
+@pytest.fixture(scope='module')
+def station(tmp_path_factory) -> str:
+    path = os.path.join(tmp_path_factory.mktemp('synthetic'), 'station.nc')
+    return synthetic.generate_station(path, years=NUMBER_OF_SPECTRA / 8766, seed=1)
+
+
+@pytest.fixture(scope='module')
+def spectrum(station):
+    return next(observed_data.iterate_file(station, NUMBER_OF_SPECTRA))
+
+
+@pytest.mark.parametrize('kind, standard_deviations', [('gaussian', [0.005, 0.01]), ('jonswap', [0.0]),
+                                                       ('pm', [0.0])])
+def test_parametric_variance_density(kind, standard_deviations):
+    from roguewavespectrum.parametric import create_parametric_frequency_spectrum
+
+    sweep.spectrum_cache.clear()
+    variance_density = sweep.parametric_variance_density(INTERPOLATED_FREQUENCIES, PEAK_FREQUENCIES,
+                                                         standard_deviations, kind)
+    for ind_sd, standard_deviation in enumerate(standard_deviations):
+        for ind_fp, peak_frequency in enumerate(PEAK_FREQUENCIES):
+            expected = create_parametric_frequency_spectrum(INTERPOLATED_FREQUENCIES, peak_frequency, 1, kind,
+                                                            standard_deviation_hertz=standard_deviation)
+            np.testing.assert_array_equal(variance_density[ind_sd, ind_fp], expected.e.values)
+
+
+def test_downsample(spectrum):
+    fine = spectrum.interpolate_frequency(np.linspace(0.0, 1.24, 1241), method='linear')
+    expected = fine.downsample(SAMPLED_FREQUENCIES)
+    downsampled = sweep.downsample(fine.e.values, fine.frequency.values, SAMPLED_FREQUENCIES)
+    np.testing.assert_allclose(downsampled, expected.e.values, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('kind, standard_deviations', [('gaussian', [0.01]), ('jonswap', [0.0])])
+def test_get_periods(kind, standard_deviations):
+    """
+    The batched sweep against the per spectrum loop of the original figure03.get_periods.
+    """
+    from roguewavespectrum.parametric import create_parametric_frequency_spectrum
+
+    periods = sweep.get_periods(PEAK_FREQUENCIES, standard_deviations, INTERPOLATED_FREQUENCIES, SAMPLED_FREQUENCIES,
+                                kind)
+    for ind_sd, standard_deviation in enumerate(standard_deviations):
+        for ind_fp, peak_frequency in enumerate(PEAK_FREQUENCIES):
+            true_spectrum = create_parametric_frequency_spectrum(INTERPOLATED_FREQUENCIES, peak_frequency, 1, kind,
+                                                                 standard_deviation_hertz=standard_deviation)
+            downsampled_spectrum = true_spectrum.downsample(SAMPLED_FREQUENCIES)
+
+            index = (ind_sd, ind_fp)
+            assert periods['target'][index] == true_spectrum.peak_period().values
+            assert periods['downsampled'][index] == downsampled_spectrum.peak_period().values
+            np.testing.assert_allclose(periods['monotone'][index],
+                                       downsampled_spectrum.peak_period(use_spline=True).values, rtol=1e-10)
+            np.testing.assert_allclose(
+                periods['natural'][index],
+                downsampled_spectrum.peak_period(use_spline=True, monotone_interpolation=False).values, rtol=1e-10)
+
+
+@pytest.mark.parametrize('monotone_interpolation', [True, False])
+def test_spline_peak(spectrum, monotone_interpolation):
+    expected = spectrum.peak_period(use_spline=True, monotone_interpolation=monotone_interpolation)
+    peak_period = spline_peak.peak_period(spectrum, monotone_interpolation)
+    np.testing.assert_allclose(peak_period.values, expected.values, rtol=1e-10)
+
+
+@pytest.mark.parametrize('monotone_interpolation', [True, False])
+def test_interpolation_plan(spectrum, monotone_interpolation):
+    fine = np.linspace(spectrum.frequency.values[0], spectrum.frequency.values[-1], 1271)
+    expected = spectrum.interpolate_frequency(fine, method='spline', monotone_interpolation=monotone_interpolation)
+    interpolated = interpolation.get_plan(spectrum.frequency.values, fine).interpolate(spectrum, monotone_interpolation)
+    np.testing.assert_allclose(interpolated.e.values, expected.e.values, rtol=1e-8, atol=1e-12)
+
+
+def test_banded_solver(spectrum):
+    expected = spectrum.peak_period(use_spline=True)
+    peak_period = spline_peak.peak_period(spectrum, solver='banded')
+    np.testing.assert_allclose(peak_period.values, expected.values, atol=SOLVER_TOLERANCE)
+
+
+@pytest.mark.skipif(not monotone_spline.COMPILED, reason='Numba is not installed')
+def test_compiled_solver(spectrum):
+    plan = interpolation.get_plan(spectrum.frequency.values, spectrum.frequency.values)
+    variance_density = spectrum.e.fillna(0.0).values
+    coefficients, peak_frequency = plan.monotone_solver.fit(variance_density, plan.binwidth, compiled=True)
+    expected_coefficients, expected_peak_frequency = plan.monotone_solver.fit(variance_density, plan.binwidth,
+                                                                              compiled=False)
+    np.testing.assert_allclose(coefficients, expected_coefficients, rtol=1e-10, atol=1e-14)
+    np.testing.assert_allclose(peak_frequency, expected_peak_frequency, rtol=1e-10)
+
+
+@pytest.mark.parametrize('solver', monotone_spline.SOLVERS)
+def test_bulk_parameters(spectrum, solver):
+    parameters = bulk.bulk_parameters(spectrum, solver=solver)
+    np.testing.assert_array_equal(parameters['peak_period_reference'].values, spectrum.peak_period().values)
+    np.testing.assert_allclose(parameters['peak_period_monotone'].values,
+                               spline_peak.peak_period(spectrum, solver=solver).values, rtol=1e-10)
+    np.testing.assert_allclose(parameters['peak_period_natural'].values,
+                               spline_peak.peak_period(spectrum, monotone_interpolation=False).values, rtol=1e-10)
+    np.testing.assert_allclose(parameters['significant_waveheight'].values,
+                               spectrum.significant_waveheight.values, rtol=1e-12)
+
+
+def test_stream_bulk_parameters_resume(station, tmp_path, monkeypatch):
+    """
+    A stream that is interrupted and resumed gives the result of a single pass, without recalculating the blocks that
+    were already written.
+    """
+    monkeypatch.setattr(observed_data, 'REFERENCE_FILE', station)
+    directory = str(tmp_path)
+    chunk_size = 2
+
+    stream = observed_data.stream_bulk_parameters(directory, chunk_size, solver='banded')
+    next(stream)
+    stream.close()
+    first_block = os.path.join(directory, 'block_0000000000.nc')
+    modified = os.stat(first_block).st_mtime_ns
+
+    blocks = list(observed_data.stream_bulk_parameters(directory, chunk_size, solver='banded'))
+    assert len(blocks) == NUMBER_OF_SPECTRA // chunk_size
+    assert os.stat(first_block).st_mtime_ns == modified
+
+    expected = observed_data.get_bulk_parameters(solver='banded')
+    xarray.testing.assert_allclose(xarray.concat(blocks, dim='time').drop_attrs(), expected, rtol=1e-12)
+    xarray.testing.assert_allclose(observed_data.read_bulk_parameters(directory, chunk_size, solver='banded'),
+                                   expected, rtol=1e-12)
+
+    # Blocks of another solver are not reused.
+    with pytest.raises(ValueError):
+        observed_data.read_bulk_parameters(directory, chunk_size)
@@ -0,0 +1,48 @@
+"""
+Contents: Start-up time regression test of the command line tool and of observed_data: both are started in a new
+interpreter and must stay within benchmark.STARTUP_BUDGET (see benchmark.py --check-startup).
+
+These files serve as the companion to the manuscript:
+
+    "Continuous peak-period estimates from discrete surface-wave spectra", Smit et al., 2023
+
+For details we on methods and results, please refer to the manuscript.
+
+Copyright (C) 2023
+Sofar Ocean Technologies
+
+Authors: Pieter Bart Smit
+"""
+
+import os
+import subprocess
+import sys
+import time
+import pytest
+import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cold_start(arguments, repeat=3) -> float:
+    """
+    Best wall clock time of running the python interpreter with the given arguments. The command is run once before
+    timing, so that byte code and compiled (numba) functions are cached on disk.
+    :param arguments: arguments of the interpreter
+    :param repeat: number of timed runs
+    :return: seconds
+    """
+    subprocess.run([sys.executable] + arguments, cwd=ROOT, check=True, capture_output=True)
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, cwd=ROOT, check=True, capture_output=True)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+@pytest.mark.parametrize('arguments', [['estimate_peak_period.py', '--help'], ['-c', 'import observed_data']])
+def test_startup_within_budget(arguments):
+    seconds = cold_start(arguments)
+    assert seconds <= benchmark.STARTUP_BUDGET, f'{" ".join(arguments)} took {seconds:.2f} s'